@@ -3,6 +3,7 @@
 Модульная архитектура с исправленной логикой планировщика
 """
 import sys
+import asyncio
 import logging
 from telegram import Update
 from telegram.ext import (
@@ -13,18 +14,30 @@ from telegram.ext import (
 
 from .config import (
     TELEGRAM_BOT_TOKEN,
-    LOG_LEVEL, LOG_FILE
+    LOG_LEVEL, LOG_MODULES_LEVEL, LOG_FILE, LOG_ASYNC, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+    BOT_MODE,
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL,
+    WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS,
+    TELEGRAM_API_BASE_URL,
+    METRICS_ENABLED, METRICS_HOST, METRICS_PORT
 )
-from .utils import setup_logger
-from .database import init_db, get_all_active_water_reminders
-from .scheduler import job_manager
+from .utils import setup_logger, stop_logging, summary_logger, metrics_server, install_signal_handler
+from .database import init_db, iter_active_water_reminders, close_connections, settings_cache
+from .scheduler import job_manager, bind_event_loop, unbind_event_loop
+from .delivery import delivery_pipeline, outbox_relay, dead_chats, delivery_ledger
 from .handlers import (
     start, reset_command, cancel,
-    water_menu, water_stop, water_resume, check_and_send_water_reminder
+    water_menu, water_stop, water_resume, check_and_send_water_reminder,
+    profile_command
 )
 
-# Инициализация логгера
-logger = setup_logger(__name__, LOG_LEVEL, LOG_FILE)
+# Инициализация логгера пакета: записи всех модулей app.* идут в его обработчики.
+# Модули пишут с LOG_MODULES_LEVEL, сам бот и сводки - с LOG_LEVEL
+setup_logger('app', LOG_LEVEL, LOG_FILE, LOG_ASYNC, LOG_MAX_BYTES, LOG_BACKUP_COUNT)
+logging.getLogger('app').setLevel(LOG_MODULES_LEVEL)
+summary_logger.setLevel(LOG_LEVEL)
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
 
 print(f"--- Запущено с помощью Python версии: {sys.version} ---")
 
@@ -33,30 +46,40 @@ async def post_init(application: Application):
     Восстановление задач после запуска бота.
     Критически важно для корректной работы после перезапуска.
     """
+    # Задачи планировщика выполняют корутины в event loop бота
+    bind_event_loop(asyncio.get_running_loop())
+    # Напоминания доставляются воркерами конвейера в том же event loop
+    await delivery_pipeline.start()
+    # Outbox: недоставленные до остановки слоты возвращаются в очередь
+    await outbox_relay.start(application, check_and_send_water_reminder)
+    
     logger.info("🔄 --- Восстановление задач из БД ---")
     
     try:
-        # Восстановление задач о воде
-        water_reminders = get_all_active_water_reminders()
-        logger.info(f"📊 Найдено {len(water_reminders)} активных напоминаний о воде")
-        
-        for r in water_reminders:
-            logger.info(f"🔄 Восстанавливаю напоминание о воде для {r['chat_id']}")
-            job_manager.schedule_water_reminders(
-                application,
-                r['chat_id'],
-                r,
-                check_and_send_water_reminder
-            )
+        # Восстановление задач о воде одним потоковым проходом по покрывающему индексу,
+        # кэш настроек прогревается за тот же проход
+        job_manager.restore_water_reminders(
+            application,
+            settings_cache.warm(iter_active_water_reminders()),
+            check_and_send_water_reminder
+        )
         
         logger.info("✅ --- Восстановление завершено ---")
         
         # Выводим статистику задач
-        job_manager.print_jobs()
+        logger.info(f"📋 Всего запланированных задач: {len(job_manager.get_all_jobs())}")
         
     except Exception as e:
         logger.error(f"❌ Ошибка при восстановлении задач: {e}", exc_info=True)
 
+async def post_shutdown(application: Application):
+    """Останавливает конвейер доставки и отвязывает планировщик от event loop бота."""
+    await outbox_relay.stop()
+    await delivery_pipeline.stop()
+    # Подтверждения доставки, накопленные воркерами при остановке
+    await outbox_relay.flush()
+    unbind_event_loop()
+
 async def error_handler(update: object, context):
     """Глобальный обработчик ошибок для бота."""
     logger.error(f"❌ Ошибка в боте: {context.error}", exc_info=context.error)
@@ -73,16 +96,21 @@ def create_application() -> Application:
         logger.critical("❌ TELEGRAM_BOT_TOKEN не найден!")
         raise ValueError("TELEGRAM_BOT_TOKEN is required")
     
-    # Инициализация БД
+    # Инициализация БД и миграции (при актуальной схеме - одно чтение версии)
     init_db()
-    from app.database import run_all_migrations
-    run_all_migrations()
     
     # Создание Application с post_init
-    application = Application.builder()\
+    builder = Application.builder()\
         .token(TELEGRAM_BOT_TOKEN)\
         .post_init(post_init)\
-        .build()
+        .post_shutdown(post_shutdown)
+    
+    # Другой адрес Bot API (локальная заглушка для нагрузочных тестов)
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+        logger.info(f"🧪 Bot API: {TELEGRAM_API_BASE_URL}")
+    
+    application = builder.build()
     
     # Добавление обработчика ошибок
     application.add_error_handler(error_handler)
@@ -93,6 +121,8 @@ def create_application() -> Application:
     
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("reset", reset_command))
+    # Служебная команда администраторов (ADMIN_CHAT_IDS)
+    application.add_handler(CommandHandler("profile", profile_command))
     
     # =========================================================================
     # CALLBACK QUERY HANDLERS
@@ -111,6 +141,29 @@ def create_application() -> Application:
     
     return application
 
+def run_webhook(application: Application):
+    """
+    Запускает встроенный webhook-сервер PTB (tornado) за reverse proxy.
+    Telegram присылает обновления на WEBHOOK_URL, proxy передает их на
+    WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH.
+    """
+    if not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL обязателен при BOT_MODE=webhook")
+    
+    logger.info(
+        f"🌐 Webhook-режим: {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH} "
+        f"(max_connections={WEBHOOK_MAX_CONNECTIONS})"
+    )
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET_TOKEN,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=Update.ALL_TYPES
+    )
+
 def run_bot():
     """Запускает бота с планировщиком задач."""
     try:
@@ -121,14 +174,24 @@ def run_bot():
         logger.info("📊 Запуск планировщика...")
         job_manager.start()
         
+        if METRICS_ENABLED:
+            metrics_server.start(METRICS_HOST, METRICS_PORT)
+        
+        # kill -USR1 <pid> - профилирование без перезапуска (отчет в PROFILE_DIR)
+        if install_signal_handler():
+            logger.info("🔬 Профилирование по сигналу SIGUSR1 включено")
+        
         # Создаем application (post_init добавит задачи в УЖЕ работающий планировщик)
         application = create_application()
         
         logger.info("✅ Бот запущен и готов к работе...")
         print("Bot is running...")
         
-        # Запускаем polling
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if BOT_MODE == 'webhook':
+            run_webhook(application)
+        else:
+            # Запускаем polling
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
         
     except KeyboardInterrupt:
         logger.info("⚠️ Получен сигнал остановки (Ctrl+C)")
@@ -136,8 +199,14 @@ def run_bot():
         logger.error(f"❌ Критическая ошибка при запуске бота: {e}", exc_info=True)
     finally:
         logger.info("🛑 Бот останавливается...")
+        metrics_server.stop()
         job_manager.shutdown()
+        # Недоступные чаты, не успевшие попасть в БД
+        dead_chats.flush()
+        delivery_ledger.flush()
+        close_connections()
         logger.info("✅ Планировщик остановлен. Работа завершена.")
+        stop_logging()
 
 if __name__ == '__main__':
     run_bot()
@@ -39,13 +39,39 @@ DEFAULT_END_HOUR = int(os.getenv('DEFAULT_END_HOUR', '23'))       # 23:00 (по
 DB_NAME = os.getenv('DB_NAME', 'reminders.db')
 SCHEDULER_DB_NAME = os.getenv('SCHEDULER_DB_NAME', 'scheduler_jobs.db')
 
+# Сколько секунд ждать снятия блокировки БД другим соединением
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '5'))
+
+# Уровень PRAGMA synchronous (NORMAL безопасен в режиме WAL)
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL').upper()
+
+# Размер кэша подготовленных SQL-выражений на соединение
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '256'))
+
+# Сколько chat_id передавать в один запрос WHERE chat_id IN (...)
+# (SQLite до 3.32 допускает не более 999 параметров в запросе; больше - только для 3.32+)
+DB_LOOKUP_CHUNK_SIZE = int(os.getenv('DB_LOOKUP_CHUNK_SIZE', '999'))
+
+# Максимум пользователей в кэше настроек (LRU); 0 отключает кэш
+SETTINGS_CACHE_SIZE = int(os.getenv('SETTINGS_CACHE_SIZE', '100000'))
+
 # =============================================================================
 # НАСТРОЙКИ ЛОГИРОВАНИЯ
 # =============================================================================
 
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Уровень модулей app.* (кроме app.bot и сводок): INFO модулей - это строки на каждое
+# нажатие и задачу, поэтому по умолчанию пишутся только предупреждения и ошибки
+LOG_MODULES_LEVEL = os.getenv('LOG_MODULES_LEVEL', 'WARNING')
 LOG_FILE = os.getenv('LOG_FILE', 'bot_log.txt')
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Запись логов в фоновом потоке (QueueHandler/QueueListener)
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'false').lower() == 'true'
+# Ротация файла логов по размеру (байты; 0 - без ротации) и число хранимых файлов
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+# Интервал сводки по срабатываниям напоминаний (секунды); отдельные срабатывания - DEBUG
+LOG_SUMMARY_INTERVAL = int(os.getenv('LOG_SUMMARY_INTERVAL', '300'))
 
 # =============================================================================
 # НАСТРОЙКИ ПЛАНИРОВЩИКА
@@ -54,9 +80,127 @@ LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 # Настройки для обработки пропущенных задач
 MISFIRE_GRACE_TIME = int(os.getenv('MISFIRE_GRACE_TIME', '3600'))  # 1 час в секундах
 
+# Режим планирования напоминаний:
+#   per_user - 16 задач на каждого пользователя (water_{chat_id}_{hour})
+#   bucketed - одна задача на пару (часовой пояс, час), рассылка по подписчикам
+SCHEDULER_MODE = os.getenv('SCHEDULER_MODE', 'per_user').lower()
+
+# Сколько отправок bucket-задача запускает одновременно
+BUCKET_FANOUT_BATCH_SIZE = int(os.getenv('BUCKET_FANOUT_BATCH_SIZE', '30'))
+
+# Размер пачки при массовом восстановлении расписаний на старте
+RESTORE_BATCH_SIZE = int(os.getenv('RESTORE_BATCH_SIZE', '1000'))
+
+# За сколько минут до слота bucketed-режим заранее собирает список получателей
+SLOT_PLAN_LEAD_MINUTES = int(os.getenv('SLOT_PLAN_LEAD_MINUTES', '5'))
+
+# Где выполняются корутины задач планировщика:
+#   app_loop - в event loop бота (один пул HTTP-соединений, без создания loop на каждый запуск)
+#   thread   - в новом event loop через asyncio.run() в потоке планировщика
+SCHEDULER_ASYNC_MODE = os.getenv('SCHEDULER_ASYNC_MODE', 'app_loop').lower()
+# Сколько секунд поток планировщика ждет корутину в event loop бота (app_loop)
+SCHEDULER_ASYNC_TIMEOUT = float(os.getenv('SCHEDULER_ASYNC_TIMEOUT', '600'))
+
+# =============================================================================
+# ЛИМИТЫ TELEGRAM
+# =============================================================================
+
+# Глобальная скорость отправки сообщений (Telegram допускает ~30 сообщений/с)
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '25'))
+
+# Сколько сообщений можно отправить подряд без ожидания
+TELEGRAM_GLOBAL_BURST = int(os.getenv('TELEGRAM_GLOBAL_BURST', '25'))
+
+# Минимальный интервал между сообщениями в один чат (секунды)
+TELEGRAM_PER_CHAT_INTERVAL = float(os.getenv('TELEGRAM_PER_CHAT_INTERVAL', '1.0'))
+
+# Сколько раз повторять отправку после RetryAfter
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '3'))
+
+# Конвейер доставки: число async-воркеров и размер очереди отправок.
+# Заполненная очередь притормаживает планировщик (backpressure)
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', '32'))
+DELIVERY_QUEUE_SIZE = int(os.getenv('DELIVERY_QUEUE_SIZE', '10000'))
+# Сколько секунд поток планировщика ждет места в очереди, прежде чем сдаться
+DELIVERY_SUBMIT_TIMEOUT = float(os.getenv('DELIVERY_SUBMIT_TIMEOUT', '600'))
+
+# Outbox доставки в БД: наступившие слоты переживают падение процесса.
+# Выключен по умолчанию. Доставка через outbox - «хотя бы один раз»; в per_user-режиме
+# каждое срабатывание - отдельная транзакция, поэтому outbox рассчитан на bucketed
+OUTBOX_ENABLED = os.getenv('OUTBOX_ENABLED', 'false').lower() == 'true'
+# Сколько строк outbox забирать и подтверждать одной транзакцией
+OUTBOX_CLAIM_BATCH = int(os.getenv('OUTBOX_CLAIM_BATCH', '500'))
+OUTBOX_ACK_BATCH = int(os.getenv('OUTBOX_ACK_BATCH', '200'))
+# Сколько раз пытаться отправить строку outbox при временных ошибках Telegram
+# и пауза перед первым повтором (секунды; каждая следующая вдвое длиннее)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv('OUTBOX_RETRY_BASE_SECONDS', '30'))
+# Сколько часов хранить доставленные строки outbox
+OUTBOX_RETENTION_HOURS = int(os.getenv('OUTBOX_RETENTION_HOURS', '48'))
+
+# Пользователи, заблокировавшие бота, выключаются в БД пачками:
+# по достижении размера пачки или раз в интервал (секунды)
+DEAD_CHAT_BATCH_SIZE = int(os.getenv('DEAD_CHAT_BATCH_SIZE', '500'))
+DEAD_CHAT_FLUSH_INTERVAL = int(os.getenv('DEAD_CHAT_FLUSH_INTERVAL', '30'))
+
+# Журнал доставки: размер пачки записи, интервал сброса буфера (секунды)
+# и срок хранения записей (дни)
+LEDGER_BATCH_SIZE = int(os.getenv('LEDGER_BATCH_SIZE', '1000'))
+LEDGER_FLUSH_INTERVAL = int(os.getenv('LEDGER_FLUSH_INTERVAL', '10'))
+LEDGER_RETENTION_DAYS = int(os.getenv('LEDGER_RETENTION_DAYS', '14'))
+
 # Фиксированное сообщение для напоминаний о воде
 WATER_REMINDER_MESSAGE = 'Время пить воду! 💧'
 
+# =============================================================================
+# ПОЛУЧЕНИЕ ОБНОВЛЕНИЙ
+# =============================================================================
+
+# polling - long polling (getUpdates); webhook - встроенный HTTP-сервер PTB
+# за reverse proxy (нужен пакет python-telegram-bot[webhooks])
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+
+# Адрес и порт, на которых слушает webhook-сервер (reverse proxy проксирует на них)
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+# Путь webhook на сервере и публичный URL, который регистрируется в Telegram
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token (1-256 символов A-Z, a-z, 0-9, _, -)
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '') or None
+# Максимум одновременных HTTPS-соединений Telegram к webhook (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Адрес Bot API без токена (например, http://127.0.0.1:8081/bot для локальной
+# заглушки из benchmarks/fake_bot_api.py); пусто - https://api.telegram.org/bot
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', '')
+
+# =============================================================================
+# МЕТРИКИ
+# =============================================================================
+
+# Локальный HTTP-эндпоинт /metrics в текстовом формате Prometheus
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+# Адрес и порт эндпоинта (по умолчанию только localhost)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+# =============================================================================
+# ПРОФИЛИРОВАНИЕ
+# =============================================================================
+
+# chat_id администраторов через запятую: им доступна команда /profile
+ADMIN_CHAT_IDS = frozenset(
+    int(chat_id) for chat_id in os.getenv('ADMIN_CHAT_IDS', '').replace(' ', '').split(',') if chat_id
+)
+# Каталог отчетов профилировщика (по умолчанию profiles/ рядом с БД - на томе данных)
+PROFILE_DIR = os.getenv('PROFILE_DIR', '') or os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), 'profiles')
+# Длительность профилирования по умолчанию и максимум (секунды)
+PROFILE_SECONDS = int(os.getenv('PROFILE_SECONDS', '60'))
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', '600'))
+# Интервал снятия стеков всех потоков (миллисекунды)
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '10'))
+
 # =============================================================================
 # СООБЩЕНИЯ БОТА
 # =============================================================================
@@ -105,4 +249,5 @@ DEBUG_MODE = os.getenv('DEBUG_MODE', 'false').lower() == 'true'
 
 if DEBUG_MODE:
     LOG_LEVEL = 'DEBUG'
+    LOG_MODULES_LEVEL = 'DEBUG'
 
@@ -5,11 +5,32 @@ from .models import init_db, set_db_name, DB_NAME
 from .water_db import (
     save_water_reminder,
     get_water_reminder,
+    get_water_reminder_state,
+    get_water_reminder_states,
     set_water_reminder_active,
+    deactivate_water_reminders,
     get_all_active_water_reminders,
+    iter_active_water_reminders,
     set_onboarding_completed
 )
+from .delivery_db import (
+    add_outbox_entries,
+    claim_outbox_entries,
+    ack_outbox_entries,
+    retry_outbox_entries,
+    release_stale_outbox_claims,
+    prune_outbox,
+    count_pending_outbox
+)
+from .ledger_db import (
+    append_ledger_entries,
+    prune_ledger,
+    get_slot_delivery_stats,
+    get_failing_chats
+)
 from .migrations import run_all_migrations
+from .connection import get_connection, transaction, close_connections
+from .cache import SettingsCache, settings_cache
 
 __all__ = [
     'init_db',
@@ -17,9 +38,29 @@ __all__ = [
     'DB_NAME',
     'save_water_reminder',
     'get_water_reminder',
+    'get_water_reminder_state',
+    'get_water_reminder_states',
     'set_water_reminder_active',
+    'deactivate_water_reminders',
     'get_all_active_water_reminders',
+    'iter_active_water_reminders',
     'set_onboarding_completed',
-    'run_all_migrations'
+    'add_outbox_entries',
+    'claim_outbox_entries',
+    'ack_outbox_entries',
+    'retry_outbox_entries',
+    'release_stale_outbox_claims',
+    'prune_outbox',
+    'count_pending_outbox',
+    'append_ledger_entries',
+    'prune_ledger',
+    'get_slot_delivery_stats',
+    'get_failing_chats',
+    'run_all_migrations',
+    'get_connection',
+    'transaction',
+    'close_connections',
+    'SettingsCache',
+    'settings_cache'
 ]
 
@@ -0,0 +1,107 @@
+"""
+Процессный кэш настроек пользователей.
+
+Горячий путь рассылки проверяет is_active на каждом срабатывании. Кэш
+заполняется при восстановлении задач на старте и обновляется сквозной
+записью (write-through) функциями water_db, поэтому проверка не ходит
+в SQLite. Размер ограничен, вытесняются давно не использованные записи (LRU).
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from ..config import SETTINGS_CACHE_SIZE
+
+
+class SettingsCache:
+    """
+    Потокобезопасный LRU-кэш настроек по chat_id со счетчиками попаданий.
+    
+    Запись может быть полной строкой water_reminders (есть created_at)
+    или частичным состоянием (chat_id, timezone, is_active), загруженным при старте.
+    """
+    
+    def __init__(self, max_size: int = SETTINGS_CACHE_SIZE):
+        self.max_size = max_size
+        self._data: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, chat_id: int, full_row: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает копию записи или None при промахе.
+        
+        Args:
+            chat_id: ID чата пользователя
+            full_row: Считать промахом частичную запись без полной строки БД
+        """
+        with self._lock:
+            entry = self._data.get(chat_id)
+            if entry is None or (full_row and 'created_at' not in entry):
+                self.misses += 1
+                return None
+            self._data.move_to_end(chat_id)
+            self.hits += 1
+            return dict(entry)
+    
+    def put(self, chat_id: int, settings: Dict[str, Any]):
+        """Сохраняет запись, вытесняя самую старую при переполнении."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[chat_id] = dict(settings)
+            self._data.move_to_end(chat_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def update(self, chat_id: int, **fields):
+        """Обновляет поля записи, если она есть в кэше (сквозная запись)."""
+        with self._lock:
+            entry = self._data.get(chat_id)
+            if entry is not None:
+                entry.update(fields)
+                entry['updated_at'] = _sqlite_timestamp()
+    
+    def invalidate(self, chat_id: int):
+        """Удаляет запись из кэша."""
+        with self._lock:
+            self._data.pop(chat_id, None)
+    
+    def clear(self):
+        """Очищает кэш и счетчики."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def warm(self, rows: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Заполняет кэш строками по мере их чтения и отдает строки дальше.
+        Позволяет прогреть кэш за тот же проход, что и восстановление задач.
+        """
+        for row in rows:
+            self.put(row['chat_id'], row)
+            yield row
+    
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает размер кэша и счетчики попаданий/промахов."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0
+            }
+
+
+def _sqlite_timestamp() -> str:
+    """Текущее время в формате CURRENT_TIMESTAMP SQLite (UTC)."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+# Глобальный экземпляр кэша настроек
+settings_cache = SettingsCache()
@@ -0,0 +1,101 @@
+"""
+Общий слой подключения к SQLite.
+
+Вместо sqlite3.connect() на каждый вызов каждый поток держит одно долгоживущее
+соединение (потоки APScheduler и event loop бота живут весь срок работы процесса).
+Соединение открывается в режиме WAL с настраиваемым уровнем synchronous,
+кэшем подготовленных выражений и busy timeout, поэтому горячие чтения
+не переоткрывают файл базы данных.
+"""
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from ..config import DB_BUSY_TIMEOUT, DB_SYNCHRONOUS, DB_STATEMENT_CACHE_SIZE
+from . import models
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_connections: List[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+# Увеличивается при close_connections(), чтобы потоки переоткрыли закрытые соединения
+_generation = 0
+
+
+def _open_connection(db_name: str) -> sqlite3.Connection:
+    """Открывает и настраивает новое соединение."""
+    con = sqlite3.connect(
+        db_name,
+        timeout=DB_BUSY_TIMEOUT,
+        cached_statements=DB_STATEMENT_CACHE_SIZE,
+        # Соединение используется только своим потоком, флаг нужен для close_connections()
+        check_same_thread=False
+    )
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    con.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}")
+    
+    with _connections_lock:
+        _connections.append(con)
+    logger.debug(f"🔌 Открыто соединение с {db_name} для потока {threading.current_thread().name}")
+    return con
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Возвращает соединение текущего потока, открывая его при первом обращении.
+    Если имя базы данных изменилось (set_db_name/init_db), соединение переоткрывается.
+    """
+    db_name = models.DB_NAME
+    con = getattr(_local, 'connection', None)
+    if con is not None and _local.db_name == db_name and _local.generation == _generation:
+        return con
+    
+    if con is not None and _local.generation == _generation:
+        _close(con)
+    con = _open_connection(db_name)
+    _local.connection = con
+    _local.db_name = db_name
+    _local.generation = _generation
+    return con
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """
+    Контекстный менеджер транзакции на соединении текущего потока.
+    Коммитит при успешном выходе и откатывает при исключении.
+    """
+    con = get_connection()
+    with con:
+        yield con
+
+
+def _close(con: sqlite3.Connection):
+    """Закрывает соединение и убирает его из реестра."""
+    with _connections_lock:
+        if con in _connections:
+            _connections.remove(con)
+    try:
+        con.close()
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Ошибка при закрытии соединения с БД: {e}")
+
+
+def close_connections():
+    """Закрывает соединения всех потоков (вызывается при остановке бота)."""
+    global _generation
+    with _connections_lock:
+        connections = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for con in connections:
+        try:
+            con.close()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Ошибка при закрытии соединения с БД: {e}")
+    if connections:
+        logger.info(f"🔌 Закрыто {len(connections)} соединений с БД")
@@ -0,0 +1,193 @@
+"""
+Операции с outbox доставки напоминаний.
+
+Планировщик пишет наступившие слоты пачками (INSERT OR IGNORE по первичному
+ключу (chat_id, slot)), конвейер доставки забирает их пачками и подтверждает
+отправку тоже пачками - коммит приходится на пачку, а не на сообщение.
+Повторная запись того же слота игнорируется, поэтому слот попадает в outbox
+один раз. Доставка же - «хотя бы один раз»: подтверждения пишутся пачками,
+и строки, отправленные, но не подтвержденные до падения процесса, после
+перезапуска возвращаются в ожидание и отправляются повторно. Временная
+ошибка отправки возвращает строку в ожидание с паузой (next_attempt_at),
+которая удваивается с каждой попыткой, пока попытки не исчерпаны.
+"""
+import sqlite3
+import logging
+import time
+from typing import Iterable, List, Tuple
+from .connection import get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Статусы строк outbox
+OUTBOX_PENDING = 0
+OUTBOX_CLAIMED = 1
+OUTBOX_SENT = 2
+OUTBOX_EXPIRED = 3
+OUTBOX_FAILED = 4
+
+# =============================================================================
+# ФУНКЦИИ OUTBOX
+# =============================================================================
+
+def add_outbox_entries(entries: Iterable[Tuple[int, str, str]]) -> int:
+    """
+    Записывает наступившие слоты в outbox одной транзакцией.
+
+    Args:
+        entries: Кортежи (chat_id, slot, timezone)
+
+    Returns:
+        Количество новых строк (уже записанные слоты пропускаются)
+    """
+    now = time.time()
+    try:
+        with transaction() as con:
+            before = con.total_changes
+            con.executemany("""
+                INSERT OR IGNORE INTO delivery_outbox (chat_id, slot, timezone, status, created_at)
+                VALUES (?, ?, ?, 0, ?)
+            """, ((chat_id, slot, timezone, now) for chat_id, slot, timezone in entries))
+            return con.total_changes - before
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при записи в outbox: {e}")
+        raise
+
+def claim_outbox_entries(limit: int) -> List[Tuple[int, str, str]]:
+    """
+    Забирает до limit ожидающих строк, чья пауза перед попыткой истекла
+    (самые старые первыми), и помечает их взятыми.
+
+    Returns:
+        Список кортежей (chat_id, slot, timezone)
+    """
+    now = time.time()
+    try:
+        with transaction() as con:
+            return con.execute("""
+                UPDATE delivery_outbox
+                SET status = 1, claimed_at = ?
+                WHERE (chat_id, slot) IN (
+                    SELECT chat_id, slot FROM delivery_outbox
+                    WHERE status = 0 AND next_attempt_at <= ?
+                    ORDER BY created_at
+                    LIMIT ?
+                )
+                RETURNING chat_id, slot, timezone
+            """, (now, now, limit)).fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при выборке из outbox: {e}")
+        return []
+
+def ack_outbox_entries(keys: Iterable[Tuple[int, str]]) -> int:
+    """
+    Подтверждает доставку пачки строк одной транзакцией.
+
+    Args:
+        keys: Кортежи (chat_id, slot)
+
+    Returns:
+        Количество подтвержденных строк
+    """
+    now = time.time()
+    try:
+        with transaction() as con:
+            before = con.total_changes
+            con.executemany("""
+                UPDATE delivery_outbox SET status = 2, sent_at = ?
+                WHERE chat_id = ? AND slot = ?
+            """, ((now, chat_id, slot) for chat_id, slot in keys))
+            return con.total_changes - before
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при подтверждении доставки в outbox: {e}")
+        return 0
+
+def retry_outbox_entries(
+    keys: Iterable[Tuple[int, str]],
+    max_attempts: int,
+    base_delay: float
+) -> Tuple[int, int]:
+    """
+    Учитывает неудачную попытку отправки пачки строк одной транзакцией:
+    строка возвращается в ожидание не раньше чем через base_delay * 2^(попытка - 1)
+    секунд или, если попытки исчерпаны, помечается неудачной.
+
+    Args:
+        keys: Кортежи (chat_id, slot)
+        max_attempts: Сколько всего попыток отправки разрешено
+        base_delay: Пауза перед первым повтором (секунды)
+
+    Returns:
+        (возвращено в ожидание, помечено неудачными)
+    """
+    keys = list(keys)
+    now = time.time()
+    try:
+        with transaction() as con:
+            before = con.total_changes
+            con.executemany("""
+                UPDATE delivery_outbox SET status = 4, attempts = attempts + 1
+                WHERE chat_id = ? AND slot = ? AND status = 1 AND attempts + 1 >= ?
+            """, ((chat_id, slot, max_attempts) for chat_id, slot in keys))
+            failed = con.total_changes - before
+            # attempts здесь - число попыток до текущей: пауза base_delay * 2^attempts
+            con.executemany("""
+                UPDATE delivery_outbox
+                SET status = 0, attempts = attempts + 1, claimed_at = NULL,
+                    next_attempt_at = ? + ? * (1 << attempts)
+                WHERE chat_id = ? AND slot = ? AND status = 1
+            """, ((now, base_delay, chat_id, slot) for chat_id, slot in keys))
+            return con.total_changes - before - failed, failed
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при возврате строк outbox в ожидание: {e}")
+        return 0, 0
+
+def release_stale_outbox_claims(max_age_seconds: float) -> Tuple[int, int]:
+    """
+    Вызывается при запуске: строки, взятые до падения процесса, возвращаются
+    в ожидание, а ожидающие дольше max_age_seconds помечаются просроченными.
+
+    Returns:
+        (возвращено в ожидание, помечено просроченными)
+    """
+    try:
+        with transaction() as con:
+            cur = con.cursor()
+            cur.execute("""
+                UPDATE delivery_outbox SET status = 3
+                WHERE status IN (0, 1) AND created_at < ?
+            """, (time.time() - max_age_seconds,))
+            expired = cur.rowcount
+            cur.execute("UPDATE delivery_outbox SET status = 0, claimed_at = NULL WHERE status = 1")
+            released = cur.rowcount
+        return released, expired
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при освобождении строк outbox: {e}")
+        return 0, 0
+
+def prune_outbox(retention_seconds: float) -> int:
+    """
+    Удаляет доставленные, просроченные и неудачные строки старше retention_seconds.
+
+    Returns:
+        Количество удаленных строк
+    """
+    try:
+        with transaction() as con:
+            cur = con.execute("""
+                DELETE FROM delivery_outbox
+                WHERE status IN (2, 3, 4) AND created_at < ?
+            """, (time.time() - retention_seconds,))
+            return cur.rowcount
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при очистке outbox: {e}")
+        return 0
+
+def count_pending_outbox() -> int:
+    """Количество строк outbox, ожидающих доставки."""
+    try:
+        cur = get_connection().execute("SELECT COUNT(*) FROM delivery_outbox WHERE status = 0")
+        return cur.fetchone()[0]
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при подсчете outbox: {e}")
+        return 0
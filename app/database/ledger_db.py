@@ -0,0 +1,111 @@
+"""
+Операции с журналом доставки напоминаний.
+
+Журнал только дополняется: строки пишутся пачками через executemany
+(буфер DeliveryLedger), старые строки удаляются по времени.
+"""
+import sqlite3
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+from .connection import get_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# (chat_id, slot, scheduled_at, sent_at, latency_ms, outcome)
+LedgerEntry = Tuple[int, str, float, float, float, str]
+
+# =============================================================================
+# ФУНКЦИИ ЖУРНАЛА ДОСТАВКИ
+# =============================================================================
+
+def append_ledger_entries(entries: Iterable[LedgerEntry]) -> int:
+    """
+    Дописывает пачку записей в журнал одной транзакцией.
+
+    Returns:
+        Количество записанных строк
+    """
+    try:
+        with transaction() as con:
+            before = con.total_changes
+            con.executemany("""
+                INSERT INTO delivery_ledger (chat_id, slot, scheduled_at, sent_at, latency_ms, outcome)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, entries)
+            return con.total_changes - before
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при записи в журнал доставки: {e}")
+        raise
+
+def prune_ledger(retention_seconds: float) -> int:
+    """
+    Удаляет записи журнала старше retention_seconds.
+
+    Returns:
+        Количество удаленных строк
+    """
+    try:
+        with transaction() as con:
+            cur = con.execute(
+                "DELETE FROM delivery_ledger WHERE sent_at < ?",
+                (time.time() - retention_seconds,)
+            )
+            return cur.rowcount
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при очистке журнала доставки: {e}")
+        return 0
+
+def get_slot_delivery_stats(since_seconds: float = 86400, limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Возвращает самые медленные слоты: время от начала слота до последней отправки.
+
+    Args:
+        since_seconds: За какой период смотреть журнал
+        limit: Сколько слотов вернуть
+
+    Returns:
+        Список {slot, total, failed, drain_seconds, avg_latency_ms}
+    """
+    try:
+        cur = get_connection().cursor()
+        cur.row_factory = sqlite3.Row
+        cur.execute("""
+            SELECT slot,
+                   COUNT(*) AS total,
+                   SUM(outcome != 'sent') AS failed,
+                   MAX(sent_at) - MIN(scheduled_at) AS drain_seconds,
+                   AVG(latency_ms) AS avg_latency_ms
+            FROM delivery_ledger
+            WHERE sent_at >= ?
+            GROUP BY slot
+            ORDER BY drain_seconds DESC
+            LIMIT ?
+        """, (time.time() - since_seconds, limit))
+        return [dict(row) for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при чтении статистики слотов: {e}")
+        return []
+
+def get_failing_chats(since_seconds: float = 86400, min_failures: int = 3) -> List[Dict[str, Any]]:
+    """
+    Возвращает пользователей с повторяющимися неудачными доставками.
+
+    Returns:
+        Список {chat_id, failures, last_outcome_at}
+    """
+    try:
+        cur = get_connection().cursor()
+        cur.row_factory = sqlite3.Row
+        cur.execute("""
+            SELECT chat_id, COUNT(*) AS failures, MAX(sent_at) AS last_outcome_at
+            FROM delivery_ledger
+            WHERE sent_at >= ? AND outcome != 'sent'
+            GROUP BY chat_id
+            HAVING COUNT(*) >= ?
+            ORDER BY failures DESC
+        """, (time.time() - since_seconds, min_failures))
+        return [dict(row) for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при чтении неудачных доставок: {e}")
+        return []
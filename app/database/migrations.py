@@ -1,9 +1,15 @@
 """
 Миграции базы данных
+
+Версионированный раннер: примененные шаги записываются в таблицу schema_version,
+реестр MIGRATIONS упорядочен по версии. Ожидающие шаги применяются в одной
+транзакции. Если схема актуальна, запуск стоит одного чтения MAX(version)
+по первичному ключу schema_version.
 """
 import sqlite3
 import logging
-from .models import DB_NAME
+from typing import Callable, List, Tuple
+from .connection import get_connection
 
 logger = logging.getLogger(__name__)
 
@@ -13,129 +19,234 @@ def check_column_exists(cur, table_name: str, column_name: str) -> bool:
     columns = [row[1] for row in cur.fetchall()]
     return column_name in columns
 
-def migrate_add_updated_at():
+def check_table_exists(cur, table_name: str) -> bool:
+    """Проверяет существование таблицы."""
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+    return cur.fetchone() is not None
+
+# =============================================================================
+# ШАГИ МИГРАЦИЙ
+# Каждый шаг получает курсор открытой транзакции и не делает commit сам.
+# Шаги идемпотентны: базы, созданные до появления schema_version, проходят их безопасно.
+# =============================================================================
+
+def migrate_create_water_reminders(cur):
+    """Создает таблицу настроек напоминаний о воде."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS water_reminders (
+            chat_id INTEGER PRIMARY KEY,
+            message TEXT NOT NULL,
+            interval_minutes INTEGER NOT NULL,
+            start_hour INTEGER NOT NULL,
+            end_hour INTEGER NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            onboarding_completed BOOLEAN DEFAULT 0,
+            timezone TEXT DEFAULT 'Etc/GMT-3',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def migrate_add_updated_at(cur):
     """
     Добавляет колонку updated_at в таблицы, если её нет.
     
     ИСПРАВЛЕНО: Проверяет существование таблиц перед добавлением колонок.
     """
-    try:
-        with sqlite3.connect(DB_NAME) as con:
-            cur = con.cursor()
-            
-            # Проверяем и добавляем updated_at в water_reminders
-            if not check_column_exists(cur, 'water_reminders', 'updated_at'):
-                logger.info("➕ Добавляем колонку updated_at в water_reminders")
-                cur.execute("""
-                    ALTER TABLE water_reminders 
-                    ADD COLUMN updated_at TEXT
-                """)
-                # Устанавливаем значение по умолчанию для существующих записей
-                cur.execute("""
-                    UPDATE water_reminders 
-                    SET updated_at = datetime('now') 
-                    WHERE updated_at IS NULL
-                """)
-                con.commit()
-                logger.info("✅ Колонка updated_at добавлена в water_reminders")
-            else:
-                logger.info("✓ Колонка updated_at уже существует в water_reminders")
-            
-            # ИСПРАВЛЕНИЕ: Проверяем существование таблицы custom_reminders перед работой с ней
-            cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='custom_reminders'")
-            if cur.fetchone():
-                # Таблица существует - добавляем updated_at
-                if not check_column_exists(cur, 'custom_reminders', 'updated_at'):
-                    logger.info("➕ Добавляем колонку updated_at в custom_reminders")
-                    cur.execute("""
-                        ALTER TABLE custom_reminders 
-                        ADD COLUMN updated_at TEXT
-                    """)
-                    cur.execute("""
-                        UPDATE custom_reminders 
-                        SET updated_at = datetime('now') 
-                        WHERE updated_at IS NULL
-                    """)
-                    con.commit()
-                    logger.info("✅ Колонка updated_at добавлена в custom_reminders")
-                else:
-                    logger.info("✓ Колонка updated_at уже существует в custom_reminders")
-            else:
-                logger.info("✓ Таблица custom_reminders не существует (уже удалена или не создавалась)")
-            
-    except sqlite3.Error as e:
-        logger.error(f"❌ Ошибка при выполнении миграции: {e}")
-        raise
+    # Проверяем и добавляем updated_at в water_reminders
+    if not check_column_exists(cur, 'water_reminders', 'updated_at'):
+        logger.info("➕ Добавляем колонку updated_at в water_reminders")
+        cur.execute("""
+            ALTER TABLE water_reminders
+            ADD COLUMN updated_at TEXT
+        """)
+        # Устанавливаем значение по умолчанию для существующих записей
+        cur.execute("""
+            UPDATE water_reminders
+            SET updated_at = datetime('now')
+            WHERE updated_at IS NULL
+        """)
+        logger.info("✅ Колонка updated_at добавлена в water_reminders")
+    
+    # ИСПРАВЛЕНИЕ: Проверяем существование таблицы custom_reminders перед работой с ней
+    if check_table_exists(cur, 'custom_reminders') and not check_column_exists(cur, 'custom_reminders', 'updated_at'):
+        logger.info("➕ Добавляем колонку updated_at в custom_reminders")
+        cur.execute("""
+            ALTER TABLE custom_reminders
+            ADD COLUMN updated_at TEXT
+        """)
+        cur.execute("""
+            UPDATE custom_reminders
+            SET updated_at = datetime('now')
+            WHERE updated_at IS NULL
+        """)
+        logger.info("✅ Колонка updated_at добавлена в custom_reminders")
 
-def migrate_remove_custom_tables():
+def migrate_remove_custom_tables(cur):
     """Удаляет таблицы кастомных напоминаний и истории."""
-    try:
-        with sqlite3.connect(DB_NAME) as con:
-            cur = con.cursor()
-            
-            # Удаляем таблицу custom_reminders если существует
-            cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='custom_reminders'")
-            if cur.fetchone():
-                logger.info("🗑️ Удаляем таблицу custom_reminders")
-                cur.execute("DROP TABLE IF EXISTS custom_reminders")
-                con.commit()
-                logger.info("✅ Таблица custom_reminders удалена")
-            else:
-                logger.info("✓ Таблица custom_reminders не существует")
-            
-            # Удаляем таблицу water_reminder_history если существует
-            cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='water_reminder_history'")
-            if cur.fetchone():
-                logger.info("🗑️ Удаляем таблицу water_reminder_history")
-                cur.execute("DROP TABLE IF EXISTS water_reminder_history")
-                con.commit()
-                logger.info("✅ Таблица water_reminder_history удалена")
-            else:
-                logger.info("✓ Таблица water_reminder_history не существует")
-            
-            # Удаляем индексы для custom_reminders если существуют
-            cur.execute("SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'idx_custom%'")
-            indexes = cur.fetchall()
-            for index in indexes:
-                logger.info(f"🗑️ Удаляем индекс {index[0]}")
-                cur.execute(f"DROP INDEX IF EXISTS {index[0]}")
-                con.commit()
-            
-    except sqlite3.Error as e:
-        logger.error(f"❌ Ошибка при удалении таблиц: {e}")
-        raise
+    for table_name in ('custom_reminders', 'water_reminder_history'):
+        if check_table_exists(cur, table_name):
+            logger.info(f"🗑️ Удаляем таблицу {table_name}")
+            cur.execute(f"DROP TABLE IF EXISTS {table_name}")
+            logger.info(f"✅ Таблица {table_name} удалена")
+    
+    # Удаляем индексы для custom_reminders если существуют
+    cur.execute("SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'idx_custom%'")
+    for index in cur.fetchall():
+        logger.info(f"🗑️ Удаляем индекс {index[0]}")
+        cur.execute(f"DROP INDEX IF EXISTS {index[0]}")
 
-def migrate_add_onboarding_completed():
+def migrate_add_onboarding_completed(cur):
     """Добавляет колонку onboarding_completed в water_reminders."""
+    if not check_column_exists(cur, 'water_reminders', 'onboarding_completed'):
+        logger.info("➕ Добавляем колонку onboarding_completed в water_reminders")
+        cur.execute("""
+            ALTER TABLE water_reminders
+            ADD COLUMN onboarding_completed BOOLEAN DEFAULT 0
+        """)
+        # Сбрасываем onboarding_completed для всех существующих пользователей
+        cur.execute("""
+            UPDATE water_reminders
+            SET onboarding_completed = 0
+            WHERE onboarding_completed IS NULL
+        """)
+        logger.info("✅ Колонка onboarding_completed добавлена в water_reminders")
+
+def migrate_covering_active_index(cur):
+    """
+    Заменяет индекс idx_water_active(is_active) покрывающим индексом
+    idx_water_active_tz_chat(is_active, timezone, chat_id).
+    """
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_water_active_tz_chat
+        ON water_reminders(is_active, timezone, chat_id)
+    """)
+    cur.execute("DROP INDEX IF EXISTS idx_water_active")
+
+def migrate_create_delivery_outbox(cur):
+    """
+    Создает outbox доставки: одна строка на (chat_id, slot).
+    status: 0 - ожидает, 1 - взята воркером, 2 - доставлена, 3 - просрочена.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS delivery_outbox (
+            chat_id INTEGER NOT NULL,
+            slot TEXT NOT NULL,
+            timezone TEXT NOT NULL,
+            status INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            claimed_at REAL,
+            sent_at REAL,
+            PRIMARY KEY (chat_id, slot)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_status_created
+        ON delivery_outbox(status, created_at)
+    """)
+
+def migrate_create_delivery_ledger(cur):
+    """
+    Создает журнал доставки (только добавление строк).
+    Время хранится в секундах Unix, latency_ms - длительность вызова отправки.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS delivery_ledger (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            slot TEXT NOT NULL,
+            scheduled_at REAL NOT NULL,
+            sent_at REAL NOT NULL,
+            latency_ms REAL NOT NULL,
+            outcome TEXT NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_ledger_sent_at
+        ON delivery_ledger(sent_at)
+    """)
+
+def migrate_add_outbox_attempts(cur):
+    """
+    Добавляет в outbox счетчик неудачных попыток отправки.
+    Новый status: 4 - попытки исчерпаны.
+    """
+    if not check_column_exists(cur, 'delivery_outbox', 'attempts'):
+        cur.execute("ALTER TABLE delivery_outbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+def migrate_add_outbox_next_attempt(cur):
+    """
+    Добавляет в outbox время следующей попытки: строка после временной ошибки
+    ждет паузы (экспоненциальной по числу попыток) и до нее не выбирается.
+    0 - строка доступна сразу.
+    """
+    if not check_column_exists(cur, 'delivery_outbox', 'next_attempt_at'):
+        cur.execute("ALTER TABLE delivery_outbox ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
+
+# =============================================================================
+# РЕЕСТР МИГРАЦИЙ
+# Новые шаги добавляются только в конец со следующим номером версии.
+# =============================================================================
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, 'create_water_reminders', migrate_create_water_reminders),
+    (2, 'add_updated_at', migrate_add_updated_at),
+    (3, 'remove_custom_tables', migrate_remove_custom_tables),
+    (4, 'add_onboarding_completed', migrate_add_onboarding_completed),
+    (5, 'covering_active_index', migrate_covering_active_index),
+    (6, 'create_delivery_outbox', migrate_create_delivery_outbox),
+    (7, 'create_delivery_ledger', migrate_create_delivery_ledger),
+    (8, 'add_outbox_attempts', migrate_add_outbox_attempts),
+    (9, 'add_outbox_next_attempt', migrate_add_outbox_next_attempt),
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(cur) -> int:
+    """Возвращает текущую версию схемы (0 для базы без schema_version)."""
     try:
-        with sqlite3.connect(DB_NAME) as con:
-            cur = con.cursor()
-            
-            if not check_column_exists(cur, 'water_reminders', 'onboarding_completed'):
-                logger.info("➕ Добавляем колонку onboarding_completed в water_reminders")
-                cur.execute("""
-                    ALTER TABLE water_reminders 
-                    ADD COLUMN onboarding_completed BOOLEAN DEFAULT 0
-                """)
-                # Сбрасываем onboarding_completed для всех существующих пользователей
-                cur.execute("""
-                    UPDATE water_reminders 
-                    SET onboarding_completed = 0
-                    WHERE onboarding_completed IS NULL
-                """)
-                con.commit()
-                logger.info("✅ Колонка onboarding_completed добавлена в water_reminders")
-            else:
-                logger.info("✓ Колонка onboarding_completed уже существует в water_reminders")
-            
-    except sqlite3.Error as e:
-        logger.error(f"❌ Ошибка при добавлении onboarding_completed: {e}")
-        raise
+        cur.execute("SELECT MAX(version) FROM schema_version")
+    except sqlite3.OperationalError:
+        return 0
+    version = cur.fetchone()[0]
+    return version or 0
 
 def run_all_migrations():
-    """Запускает все необходимые миграции."""
+    """
+    Применяет ожидающие миграции в одной транзакции.
+    Если схема актуальна, выполняется только чтение версии.
+    """
+    con = get_connection()
+    cur = con.cursor()
+    
+    if get_schema_version(cur) >= LATEST_SCHEMA_VERSION:
+        logger.info(f"✓ Схема БД актуальна (версия {LATEST_SCHEMA_VERSION})")
+        return
+    
     logger.info("🔄 Запуск миграций базы данных...")
-    migrate_add_updated_at()
-    migrate_remove_custom_tables()
-    migrate_add_onboarding_completed()
-    logger.info("✅ Все миграции выполнены успешно")
+    try:
+        # IMMEDIATE сразу берет блокировку записи: параллельный процесс дождется
+        # окончания и увидит уже примененные шаги
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        current_version = get_schema_version(cur)
+        
+        for version, name, step in MIGRATIONS:
+            if version <= current_version:
+                continue
+            logger.info(f"➕ Миграция {version}: {name}")
+            step(cur)
+            cur.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+        
+        con.commit()
+        logger.info(f"✅ Все миграции выполнены успешно (версия {LATEST_SCHEMA_VERSION})")
+    except sqlite3.Error as e:
+        con.rollback()
+        logger.error(f"❌ Ошибка при выполнении миграций: {e}")
+        raise
@@ -17,56 +17,28 @@ def set_db_name(db_name: str):
     logger.info(f"База данных установлена: {DB_NAME}")
 
 def get_connection():
-    """Возвращает соединение с БД."""
-    return sqlite3.connect(DB_NAME)
+    """Возвращает соединение с БД текущего потока (см. connection.get_connection)."""
+    from .connection import get_connection as get_thread_connection
+    return get_thread_connection()
 
 def init_db(db_name: Optional[str] = None):
     """
-    Инициализирует базу данных и создает все необходимые таблицы.
+    Инициализирует базу данных: создает таблицы и применяет ожидающие миграции.
+    Схема описана шагами реестра migrations.MIGRATIONS; если она актуальна,
+    вызов стоит одного чтения версии.
     
     Args:
         db_name: Имя файла базы данных (если None, используется DB_NAME)
     """
     global DB_NAME
-    if db_name is None:
-        db_name = DB_NAME
-    else:
+    if db_name is not None:
         DB_NAME = db_name
     
     try:
-        con = sqlite3.connect(db_name)
-        cur = con.cursor()
-        
-        # ==================================================================
-        # ТАБЛИЦА: Настройки напоминаний о воде
-        # ==================================================================
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS water_reminders (
-                chat_id INTEGER PRIMARY KEY,
-                message TEXT NOT NULL,
-                interval_minutes INTEGER NOT NULL,
-                start_hour INTEGER NOT NULL,
-                end_hour INTEGER NOT NULL,
-                is_active BOOLEAN DEFAULT 1,
-                onboarding_completed BOOLEAN DEFAULT 0,
-                timezone TEXT DEFAULT 'Etc/GMT-3',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # ==================================================================
-        # ИНДЕКСЫ для производительности
-        # ==================================================================
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_water_active ON water_reminders(is_active)")
-        
-        con.commit()
+        from .migrations import run_all_migrations
+        run_all_migrations()
         logger.info("✅ База данных успешно инициализирована")
         
     except sqlite3.Error as e:
         logger.error(f"❌ Ошибка при инициализации БД: {e}")
         raise
-    finally:
-        if con:
-            con.close()
-
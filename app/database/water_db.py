@@ -3,8 +3,11 @@
 """
 import sqlite3
 import logging
-from typing import Optional, List, Dict, Any
-from .models import DB_NAME
+from typing import Optional, List, Dict, Any, Iterable, Iterator, Mapping
+from .connection import get_connection, transaction
+from .cache import settings_cache
+from ..config import DB_LOOKUP_CHUNK_SIZE, RESTORE_BATCH_SIZE
+from ..utils.metrics import db_timed
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +15,7 @@ logger = logging.getLogger(__name__)
 # ФУНКЦИИ ДЛЯ НАПОМИНАНИЙ О ВОДЕ
 # =============================================================================
 
+@db_timed
 def save_water_reminder(chat_id: int, settings: Dict[str, Any]):
     """
     Сохраняет или обновляет настройки напоминания о воде для пользователя.
@@ -24,7 +28,7 @@ def save_water_reminder(chat_id: int, settings: Dict[str, Any]):
     try:
         logger.info(f"💾 Сохраняем настройки воды для {chat_id}: {settings}")
         
-        with sqlite3.connect(DB_NAME) as con:
+        with transaction() as con:
             cur = con.cursor()
             
             # Фиксированные значения
@@ -49,12 +53,23 @@ def save_water_reminder(chat_id: int, settings: Dict[str, Any]):
                     onboarding_completed = excluded.onboarding_completed,
                     updated_at = CURRENT_TIMESTAMP
             """, (chat_id, message, interval_minutes, start_hour, end_hour, timezone, int(is_active), int(onboarding_completed)))
-            con.commit()
-            logger.info(f"✅ Настройки напоминания о воде для {chat_id} успешно сохранены")
+        
+        settings_cache.update(
+            chat_id,
+            message=message,
+            interval_minutes=interval_minutes,
+            start_hour=start_hour,
+            end_hour=end_hour,
+            timezone=timezone,
+            is_active=bool(is_active),
+            onboarding_completed=bool(onboarding_completed)
+        )
+        logger.info(f"✅ Настройки напоминания о воде для {chat_id} успешно сохранены")
     except sqlite3.Error as e:
         logger.error(f"❌ Ошибка БД при сохранении настроек воды для {chat_id}: {e}")
         raise
 
+@db_timed
 def get_water_reminder(chat_id: int) -> Optional[Dict[str, Any]]:
     """
     Получает настройки напоминания о воде для пользователя.
@@ -65,22 +80,96 @@ def get_water_reminder(chat_id: int) -> Optional[Dict[str, Any]]:
     Returns:
         Словарь с настройками или None, если не найдено
     """
+    cached = settings_cache.get(chat_id, full_row=True)
+    if cached is not None:
+        return cached
+    
     try:
-        with sqlite3.connect(DB_NAME) as con:
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            cur.execute("SELECT * FROM water_reminders WHERE chat_id = ?", (chat_id,))
-            row = cur.fetchone()
-            if row:
-                result = dict(row)
-                result['is_active'] = bool(result['is_active'])
-                result['onboarding_completed'] = bool(result.get('onboarding_completed', False))
-                return result
-            return None
+        cur = get_connection().cursor()
+        cur.row_factory = sqlite3.Row
+        cur.execute("SELECT * FROM water_reminders WHERE chat_id = ?", (chat_id,))
+        row = cur.fetchone()
+        if row:
+            result = dict(row)
+            result['is_active'] = bool(result['is_active'])
+            result['onboarding_completed'] = bool(result.get('onboarding_completed', False))
+            settings_cache.put(chat_id, result)
+            return result
+        return None
     except sqlite3.Error as e:
         logger.error(f"❌ Ошибка при получении настроек воды для {chat_id}: {e}")
         return None
 
+def get_water_reminder_state(chat_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Возвращает состояние напоминания (как минимум chat_id, timezone, is_active)
+    для горячего пути рассылки. Сначала смотрит в кэш, в том числе в частичные
+    записи, загруженные при старте; SQLite читается только при промахе.
+    
+    Args:
+        chat_id: ID чата пользователя
+        
+    Returns:
+        Словарь с состоянием или None, если пользователь не найден
+    """
+    cached = settings_cache.get(chat_id)
+    if cached is not None:
+        return cached
+    return get_water_reminder(chat_id)
+
+@db_timed
+def get_water_reminder_states(
+    chat_ids: Iterable[int],
+    chunk_size: int = DB_LOOKUP_CHUNK_SIZE
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Пакетно возвращает состояние (timezone, is_active) для набора пользователей.
+    
+    Записи из кэша отдаются без обращения к БД, остальные читаются запросами
+    WHERE chat_id IN (...) по chunk_size идентификаторов и кладутся в кэш.
+    
+    Args:
+        chat_ids: ID чатов пользователей
+        chunk_size: Сколько идентификаторов передавать в один запрос
+        
+    Returns:
+        Словарь chat_id -> {chat_id, timezone, is_active}; отсутствующие в БД пропускаются
+    
+    Raises:
+        sqlite3.Error: запрос не выполнен. Частичный результат не возвращается:
+        вызывающий код иначе принял бы непрочитанных пользователей за удаленных
+    """
+    result: Dict[int, Dict[str, Any]] = {}
+    missing: List[int] = []
+    for chat_id in chat_ids:
+        cached = settings_cache.get(chat_id)
+        if cached is not None:
+            result[chat_id] = cached
+        else:
+            missing.append(chat_id)
+    
+    if not missing:
+        return result
+    
+    try:
+        cur = get_connection().cursor()
+        for i in range(0, len(missing), chunk_size):
+            chunk = missing[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            cur.execute(
+                f"SELECT chat_id, timezone, is_active FROM water_reminders WHERE chat_id IN ({placeholders})",
+                chunk
+            )
+            for chat_id, timezone, is_active in cur.fetchall():
+                state = {'chat_id': chat_id, 'timezone': timezone, 'is_active': bool(is_active)}
+                settings_cache.put(chat_id, state)
+                result[chat_id] = state
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при пакетном получении состояния {len(missing)} напоминаний: {e}")
+        raise
+    return result
+
+@db_timed
 def set_water_reminder_active(chat_id: int, is_active: bool):
     """
     Включает или выключает напоминание о воде.
@@ -90,23 +179,68 @@ def set_water_reminder_active(chat_id: int, is_active: bool):
         is_active: True для включения, False для выключения
     """
     try:
-        with sqlite3.connect(DB_NAME) as con:
+        with transaction() as con:
             cur = con.cursor()
             cur.execute("""
                 UPDATE water_reminders 
                 SET is_active = ?, updated_at = CURRENT_TIMESTAMP 
                 WHERE chat_id = ?
             """, (int(is_active), chat_id))
-            con.commit()
             
             if cur.rowcount == 0:
                 logger.warning(f"⚠️ Напоминание о воде для {chat_id} не найдено для обновления")
             else:
+                settings_cache.update(chat_id, is_active=bool(is_active))
                 logger.info(f"✅ Статус напоминания о воде для {chat_id} изменен на {is_active}")
     except sqlite3.Error as e:
         logger.error(f"❌ Ошибка при изменении статуса напоминания о воде для {chat_id}: {e}")
         raise
 
+@db_timed
+def deactivate_water_reminders(queued_at: Mapping[int, str]) -> int:
+    """
+    Выключает напоминания пачки пользователей одной транзакцией
+    (пользователи, заблокировавшие бота или удалившие аккаунт).
+    
+    Чат выключается, только если его строка не менялась с момента постановки
+    в очередь: пользователь, успевший возобновить напоминания (или сменить
+    настройки) до записи пачки, остается активным. Изменение в ту же секунду
+    тоже считается более поздним - такой чат просто будет выключен после
+    следующей неудачной отправки.
+    
+    Args:
+        queued_at: chat_id -> время постановки в очередь в формате CURRENT_TIMESTAMP (UTC)
+        
+    Returns:
+        Количество выключенных напоминаний
+    """
+    if not queued_at:
+        return 0
+    try:
+        deactivated = []
+        with transaction() as con:
+            for chat_id, timestamp in queued_at.items():
+                cur = con.execute("""
+                    UPDATE water_reminders 
+                    SET is_active = 0, updated_at = CURRENT_TIMESTAMP 
+                    WHERE chat_id = ? AND is_active = 1
+                      AND (updated_at IS NULL OR updated_at < ?)
+                """, (chat_id, timestamp))
+                if cur.rowcount:
+                    deactivated.append(chat_id)
+        for chat_id in deactivated:
+            settings_cache.update(chat_id, is_active=False)
+        skipped = len(queued_at) - len(deactivated)
+        logger.info(
+            f"✅ Выключены напоминания для {len(deactivated)} недоступных пользователей"
+            + (f", {skipped} пропущено (уже выключены или изменены после ошибки)" if skipped else "")
+        )
+        return len(deactivated)
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при пакетном выключении {len(queued_at)} напоминаний: {e}")
+        raise
+
+@db_timed
 def get_all_active_water_reminders() -> List[Dict[str, Any]]:
     """
     Возвращает все активные напоминания о воде для восстановления при перезапуске.
@@ -115,22 +249,52 @@ def get_all_active_water_reminders() -> List[Dict[str, Any]]:
         Список словарей с настройками всех активных напоминаний
     """
     try:
-        with sqlite3.connect(DB_NAME) as con:
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            cur.execute("SELECT * FROM water_reminders WHERE is_active = 1")
-            rows = cur.fetchall()
-            result = []
-            for row in rows:
-                row_dict = dict(row)
-                row_dict['is_active'] = bool(row_dict['is_active'])
-                row_dict['onboarding_completed'] = bool(row_dict.get('onboarding_completed', False))
-                result.append(row_dict)
-            return result
+        cur = get_connection().cursor()
+        cur.row_factory = sqlite3.Row
+        cur.execute("SELECT * FROM water_reminders WHERE is_active = 1")
+        rows = cur.fetchall()
+        result = []
+        for row in rows:
+            row_dict = dict(row)
+            row_dict['is_active'] = bool(row_dict['is_active'])
+            row_dict['onboarding_completed'] = bool(row_dict.get('onboarding_completed', False))
+            result.append(row_dict)
+        return result
     except sqlite3.Error as e:
         logger.error(f"❌ Ошибка при получении всех активных напоминаний о воде: {e}")
         return []
 
+def iter_active_water_reminders(chunk_size: int = RESTORE_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Потоково отдает активных пользователей для восстановления при перезапуске.
+    
+    Читаются только chat_id и timezone пачками по chunk_size строк, поэтому
+    память не зависит от числа пользователей. Запрос покрывается индексом
+    idx_water_active_tz_chat (is_active, timezone, chat_id) и не обращается к таблице.
+    
+    Args:
+        chunk_size: Сколько строк читать за один fetchmany
+        
+    Yields:
+        Словари {chat_id, timezone, is_active}
+    """
+    try:
+        cur = get_connection().cursor()
+        cur.execute("""
+            SELECT chat_id, timezone FROM water_reminders
+            WHERE is_active = 1
+            ORDER BY timezone, chat_id
+        """)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            for chat_id, timezone in rows:
+                yield {'chat_id': chat_id, 'timezone': timezone, 'is_active': True}
+    except sqlite3.Error as e:
+        logger.error(f"❌ Ошибка при потоковом чтении активных напоминаний о воде: {e}")
+
+@db_timed
 def set_onboarding_completed(chat_id: int, completed: bool = True):
     """
     Устанавливает флаг прохождения онбординга для пользователя.
@@ -140,18 +304,18 @@ def set_onboarding_completed(chat_id: int, completed: bool = True):
         completed: True если онбординг пройден, False если нет
     """
     try:
-        with sqlite3.connect(DB_NAME) as con:
+        with transaction() as con:
             cur = con.cursor()
             cur.execute("""
                 UPDATE water_reminders 
                 SET onboarding_completed = ?, updated_at = CURRENT_TIMESTAMP 
                 WHERE chat_id = ?
             """, (int(completed), chat_id))
-            con.commit()
             
             if cur.rowcount == 0:
                 logger.warning(f"⚠️ Напоминание о воде для {chat_id} не найдено для обновления onboarding_completed")
             else:
+                settings_cache.update(chat_id, onboarding_completed=bool(completed))
                 logger.info(f"✅ Флаг onboarding_completed для {chat_id} изменен на {completed}")
     except sqlite3.Error as e:
         logger.error(f"❌ Ошибка при изменении onboarding_completed для {chat_id}: {e}")
@@ -0,0 +1,12 @@
+"""
+Модуль доставки сообщений пользователям
+"""
+from .rate_limiter import TelegramRateLimiter, rate_limiter
+from .pipeline import DeliveryPipeline, delivery_pipeline
+from .outbox import OutboxRelay, outbox_relay
+from .dead_chats import DeadChatCollector, dead_chats, is_permanent_failure
+from .ledger import DeliveryLedger, delivery_ledger
+
+__all__ = ['TelegramRateLimiter', 'rate_limiter', 'DeliveryPipeline', 'delivery_pipeline',
+           'OutboxRelay', 'outbox_relay', 'DeadChatCollector', 'dead_chats',
+           'is_permanent_failure', 'DeliveryLedger', 'delivery_ledger']
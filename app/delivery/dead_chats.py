@@ -0,0 +1,124 @@
+"""
+Учет недоступных чатов.
+
+Если пользователь заблокировал бота, удалил аккаунт или чат не найден,
+каждая следующая отправка гарантированно упадет. Такие чаты снимаются
+с расписания сразу после первой ошибки (это делает вызывающий код),
+а в БД выключаются пачками (deactivate_water_reminders), чтобы не делать
+отдельную транзакцию на каждый чат в разгар рассылки. Пачку пишет задача
+планировщика (dead_chats_flush) или, если пачка заполнилась раньше, поток
+исполнителя event loop - add() вызывается из функции отправки и в БД не ходит.
+
+Пачка пишется уже после того, как очередь отпущена, поэтому пользователь может
+возобновить напоминания между add() и записью. Вместе с чатом запоминается
+время постановки в очередь, и БД выключает только строки, не менявшиеся
+с этого момента: запись пачки не затирает возобновление.
+"""
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict
+
+from telegram.error import BadRequest, Forbidden, TelegramError
+
+from ..config import DEAD_CHAT_BATCH_SIZE
+from ..database import deactivate_water_reminders
+
+logger = logging.getLogger(__name__)
+
+# Фрагменты текста BadRequest, означающие, что чат больше недоступен
+_DEAD_CHAT_MESSAGES = (
+    'chat not found',
+    'user is deactivated',
+    'bot was blocked',
+    'bot was kicked',
+    'peer_id_invalid',
+)
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """Проверяет, означает ли ошибка отправки, что чат недоступен навсегда."""
+    if isinstance(error, Forbidden):
+        return True
+    if isinstance(error, BadRequest):
+        message = str(error).lower()
+        return any(fragment in message for fragment in _DEAD_CHAT_MESSAGES)
+    return False
+
+
+class DeadChatCollector:
+    """Копит недоступные чаты и выключает их напоминания в БД пачками."""
+
+    def __init__(self, batch_size: int = DEAD_CHAT_BATCH_SIZE):
+        self.batch_size = batch_size
+        # chat_id -> время постановки в очередь (формат CURRENT_TIMESTAMP SQLite)
+        self._pending: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._flush_scheduled = False
+        self.total = 0
+
+    def add(self, chat_id: int, error: TelegramError):
+        """Регистрирует недоступный чат; заполненная пачка пишется в БД в фоновом потоке."""
+        with self._lock:
+            if chat_id in self._pending:
+                return
+            self._pending[chat_id] = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            self.total += 1
+            full = len(self._pending) >= self.batch_size and not self._flush_scheduled
+            if full:
+                self._flush_scheduled = True
+        logger.warning(f"🚫 Чат {chat_id} недоступен ({error}), напоминания будут выключены")
+        if not full:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вызов из обычного потока: event loop не блокируется
+            self._flush_in_background()
+            return
+        loop.run_in_executor(None, self._flush_in_background)
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"❌ Недоступные чаты не выключены, повтор при следующем flush: {e}")
+        finally:
+            with self._lock:
+                self._flush_scheduled = False
+
+    def discard(self, chat_id: int):
+        """Убирает чат из очереди (пользователь снова написал боту до записи пачки)."""
+        with self._lock:
+            self._pending.pop(chat_id, None)
+
+    def pending(self) -> int:
+        """Количество чатов, ожидающих выключения в БД."""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Выключает накопленные чаты в БД одной транзакцией.
+
+        Returns:
+            Количество выключенных напоминаний
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+            queued_at = self._pending
+            self._pending = {}
+        try:
+            return deactivate_water_reminders(queued_at)
+        except Exception:
+            # Вернем чаты в очередь, следующая попытка будет при следующем flush
+            with self._lock:
+                for chat_id, timestamp in queued_at.items():
+                    self._pending.setdefault(chat_id, timestamp)
+            raise
+
+
+# Глобальный экземпляр учета недоступных чатов
+dead_chats = DeadChatCollector()
@@ -0,0 +1,117 @@
+"""
+Журнал доставки напоминаний.
+
+Путь отправки записывает исход каждой доставки (sent / blocked / failed)
+в буфер в памяти; буфер сбрасывается в таблицу delivery_ledger одной
+транзакцией executemany - по задаче планировщика раз в LEDGER_FLUSH_INTERVAL
+секунд или, по достижении LEDGER_BATCH_SIZE, в потоке исполнителя event loop:
+record() вызывается из функции отправки и в БД не ходит.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import List
+
+from ..config import LEDGER_BATCH_SIZE, LEDGER_RETENTION_DAYS
+from ..database import append_ledger_entries, prune_ledger
+from ..database.ledger_db import LedgerEntry
+
+logger = logging.getLogger(__name__)
+
+# Исходы доставки
+OUTCOME_SENT = 'sent'
+OUTCOME_BLOCKED = 'blocked'
+OUTCOME_FAILED = 'failed'
+
+# Предел буфера: если БД недоступна, старые записи отбрасываются
+_MAX_BUFFER_BATCHES = 10
+
+
+class DeliveryLedger:
+    """Буфер записей журнала доставки с пакетной записью в БД."""
+
+    def __init__(self, batch_size: int = LEDGER_BATCH_SIZE, retention_days: int = LEDGER_RETENTION_DAYS):
+        self.batch_size = batch_size
+        self.retention_seconds = retention_days * 86400
+        self._buffer: List[LedgerEntry] = []
+        self._lock = threading.Lock()
+        self._flush_scheduled = False
+        self.dropped = 0
+
+    def record(
+        self,
+        chat_id: int,
+        slot: str,
+        scheduled_at: float,
+        started_at: float,
+        outcome: str
+    ):
+        """
+        Добавляет исход доставки в буфер.
+
+        Args:
+            chat_id: ID чата
+            slot: Ключ слота рассылки
+            scheduled_at: Время начала слота (Unix)
+            started_at: Время начала отправки (Unix); длительность считается до текущего момента
+            outcome: sent / blocked / failed
+        """
+        sent_at = time.time()
+        entry = (chat_id, slot, scheduled_at, sent_at, (sent_at - started_at) * 1000, outcome)
+        with self._lock:
+            self._buffer.append(entry)
+            full = len(self._buffer) >= self.batch_size and not self._flush_scheduled
+            if full:
+                self._flush_scheduled = True
+        if not full:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вызов из обычного потока: event loop не блокируется
+            self._flush_in_background()
+            return
+        loop.run_in_executor(None, self._flush_in_background)
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._flush_scheduled = False
+
+    def flush(self) -> int:
+        """
+        Записывает буфер в БД одной транзакцией.
+
+        Returns:
+            Количество записанных строк
+        """
+        with self._lock:
+            if not self._buffer:
+                return 0
+            entries, self._buffer = self._buffer, []
+        try:
+            return append_ledger_entries(entries)
+        except Exception as e:
+            # Записи возвращаются в буфер, но не сверх предела
+            with self._lock:
+                self._buffer[:0] = entries
+                overflow = len(self._buffer) - self.batch_size * _MAX_BUFFER_BATCHES
+                if overflow > 0:
+                    del self._buffer[:overflow]
+                    self.dropped += overflow
+            logger.error(f"❌ Журнал доставки не записан, {len(entries)} записей отложено: {e}")
+            return 0
+
+    def prune(self) -> int:
+        """Удаляет записи старше срока хранения."""
+        pruned = prune_ledger(self.retention_seconds)
+        if pruned:
+            logger.info(f"🧹 Журнал доставки: удалено {pruned} старых записей")
+        return pruned
+
+
+# Глобальный экземпляр журнала доставки
+delivery_ledger = DeliveryLedger()
@@ -0,0 +1,216 @@
+"""
+Ретранслятор outbox доставки.
+
+Потоки планировщика записывают наступившие слоты в таблицу delivery_outbox
+(submit) и будят ретранслятор. Bucket-задача пишет получателей пачками, а
+задача per_user-режима - свою единственную строку, то есть транзакцию на
+срабатывание: outbox рассчитан на bucketed-режим и по умолчанию выключен
+(OUTBOX_ENABLED). Ретранслятор в event loop бота забирает строки
+пачками (claim) и ставит их в очередь DeliveryPipeline; после отправки воркер
+копит подтверждения и записывает их пачкой (ack). Подтверждается успешная
+отправка и постоянная ошибка (чат недоступен); при временной ошибке строка
+возвращается в ожидание с паузой OUTBOX_RETRY_BASE_SECONDS, удваиваемой с каждой
+попыткой, а после OUTBOX_MAX_ATTEMPTS попыток помечается неудачной.
+
+Доставка - «хотя бы один раз»: строки, взятые до падения процесса (в том числе
+уже отправленные, но еще не подтвержденные), при следующем запуске
+возвращаются в ожидание, а слишком старые - помечаются просроченными, чтобы
+не рассылать напоминания за прошедшие часы.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Coroutine, Iterable, List, Optional, Set, Tuple
+
+from ..config import (
+    OUTBOX_ENABLED,
+    OUTBOX_CLAIM_BATCH,
+    OUTBOX_ACK_BATCH,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_BASE_SECONDS,
+    OUTBOX_RETENTION_HOURS,
+    MISFIRE_GRACE_TIME
+)
+from ..database import (
+    add_outbox_entries,
+    claim_outbox_entries,
+    ack_outbox_entries,
+    retry_outbox_entries,
+    release_stale_outbox_claims,
+    prune_outbox
+)
+from .pipeline import DeliveryPipeline, delivery_pipeline
+
+logger = logging.getLogger(__name__)
+
+# Как часто ретранслятор проверяет outbox без явного сигнала и сбрасывает подтверждения
+_POLL_INTERVAL = 1.0
+# Как часто чистить доставленные строки
+_PRUNE_INTERVAL = 3600
+
+
+class OutboxRelay:
+    """Перекладывает строки outbox в очередь конвейера и подтверждает доставку пачками."""
+
+    def __init__(
+        self,
+        pipeline: DeliveryPipeline = delivery_pipeline,
+        enabled: bool = OUTBOX_ENABLED,
+        claim_batch: int = OUTBOX_CLAIM_BATCH,
+        ack_batch: int = OUTBOX_ACK_BATCH,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        retry_base_seconds: float = OUTBOX_RETRY_BASE_SECONDS
+    ):
+        self.pipeline = pipeline
+        self.enabled = enabled
+        self.claim_batch = claim_batch
+        self.ack_batch = ack_batch
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+
+        self._send_func: Optional[Callable[..., Coroutine]] = None
+        self._application: Any = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._acks: List[Tuple[int, str]] = []
+        # Строки с временной ошибкой отправки: вернуть в ожидание
+        self._retries: List[Tuple[int, str]] = []
+        # Слоты, в которые планировщик больше ничего не запишет
+        self._closing: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        """Запущен ли ретранслятор и конвейер под ним."""
+        return self._task is not None and self.pipeline.running
+
+    async def start(self, application: Any, send_func: Callable[..., Coroutine]):
+        """Освобождает строки прошлого запуска и запускает ретранслятор (после старта конвейера)."""
+        if not self.enabled or self._task is not None:
+            return
+        self._application = application
+        self._send_func = send_func
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+
+        released, expired = await asyncio.to_thread(release_stale_outbox_claims, MISFIRE_GRACE_TIME)
+        if released or expired:
+            logger.info(f"📮 Outbox: возвращено в очередь {released}, просрочено {expired}")
+
+        self._task = asyncio.create_task(self._run(), name="outbox-relay")
+        logger.info("✅ Ретранслятор outbox запущен")
+
+    async def stop(self):
+        """Останавливает выборку из outbox; взятые строки дошлет конвейер при своей остановке."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info("🛑 Ретранслятор outbox остановлен")
+
+    async def flush(self):
+        """Записывает накопленные подтверждения доставки и неудачные попытки."""
+        if self._acks:
+            acks, self._acks = self._acks, []
+            await asyncio.to_thread(ack_outbox_entries, acks)
+        if self._retries:
+            retries, self._retries = self._retries, []
+            _, failed = await asyncio.to_thread(
+                retry_outbox_entries, retries, self.max_attempts, self.retry_base_seconds
+            )
+            if failed:
+                logger.warning(f"⚠️ Outbox: {failed} напоминаний не доставлено за {self.max_attempts} попыток")
+
+    def submit(self, entries: Iterable[Tuple[int, str, str]]) -> int:
+        """
+        Записывает наступившие слоты в outbox из потока планировщика.
+
+        Args:
+            entries: Кортежи (chat_id, slot, timezone)
+
+        Returns:
+            Количество новых строк outbox
+        """
+        added = add_outbox_entries(entries)
+        self._notify()
+        return added
+
+    def close_slot(self, slot: str):
+        """Отмечает, что запись слота завершена (для отчета о доставке слота)."""
+        with self._lock:
+            self._closing.add(slot)
+        self._notify()
+
+    def _notify(self):
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        last_prune = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), _POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self._relay()
+                await self.flush()
+                if time.monotonic() - last_prune > _PRUNE_INTERVAL:
+                    last_prune = time.monotonic()
+                    pruned = await asyncio.to_thread(prune_outbox, OUTBOX_RETENTION_HOURS * 3600)
+                    if pruned:
+                        logger.info(f"🧹 Outbox: удалено {pruned} доставленных строк")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка ретранслятора outbox: {e}", exc_info=True)
+
+    async def _relay(self):
+        """Забирает строки пачками, пока outbox не опустеет."""
+        while True:
+            # Слоты снимаются до выборки: их строки уже записаны, и неполная
+            # пачка значит, что все они забраны
+            with self._lock:
+                closing = set(self._closing)
+            rows = await asyncio.to_thread(claim_outbox_entries, self.claim_batch)
+            for chat_id, slot, timezone in rows:
+                await self.pipeline.enqueue_many(
+                    self._deliver, (chat_id,), slot=slot, slot_id=slot, timezone=timezone
+                )
+            if len(rows) < self.claim_batch:
+                for slot in closing:
+                    await self.pipeline.enqueue_many(self._deliver, (), slot=slot, close_slot=True)
+                with self._lock:
+                    self._closing -= closing
+                return
+
+    async def _deliver(self, chat_id: int, slot_id: str, timezone: str):
+        """
+        Отправляет напоминание и копит подтверждение. Функция отправки сама
+        обрабатывает постоянные ошибки и пробрасывает только временные - такая
+        строка не подтверждается, а возвращается в ожидание для повтора.
+        """
+        try:
+            await self._send_func(
+                application=self._application,
+                chat_id=chat_id,
+                settings={'timezone': timezone, 'is_active': True, 'slot': slot_id}
+            )
+        except Exception:
+            self._retries.append((chat_id, slot_id))
+            raise
+        else:
+            self._acks.append((chat_id, slot_id))
+        finally:
+            if len(self._acks) + len(self._retries) >= self.ack_batch:
+                await self.flush()
+
+
+# Глобальный экземпляр ретранслятора outbox
+outbox_relay = OutboxRelay()
@@ -0,0 +1,288 @@
+"""
+Конвейер доставки напоминаний.
+
+Задачи планировщика не отправляют сообщения сами, а кладут их в ограниченную
+asyncio.Queue в event loop бота. Очередь разбирает пул async-воркеров
+(DELIVERY_WORKERS), поэтому число одновременных отправок не зависит от
+ThreadPoolExecutor планировщика. Когда очередь заполнена, поток планировщика
+ждет свободного места - это и есть backpressure (не дольше
+DELIVERY_SUBMIT_TIMEOUT).
+
+Метрики: глубина очереди, число отправок в работе и время доставки слота
+(от первой постановки в очередь до последней завершенной отправки). Ошибка
+отправки (исключение функции отправки) считается в failed слота. Слот
+bucket-задачи закрывает она сама; слоты per_user-режима закрывает
+close_idle_slots, когда в слот перестают поступать отправки.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine, Dict, Iterable, List, Optional
+
+from ..config import DELIVERY_WORKERS, DELIVERY_QUEUE_SIZE, DELIVERY_SUBMIT_TIMEOUT
+from ..utils.logger import summary_logger
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних слотов хранить в статистике
+_SLOT_HISTORY_SIZE = 100
+
+# Через сколько секунд ключ слота начинает новый слот (тот же час следующих суток)
+_SLOT_MAX_AGE = 3600
+
+# Через сколько секунд без новых отправок слот считается закрытым (close_idle_slots)
+_SLOT_IDLE_SECONDS = 60
+
+
+class _SlotStats:
+    """Счетчики доставки одного слота."""
+    __slots__ = ('enqueued', 'completed', 'failed', 'started', 'last_enqueued', 'finished', 'closed')
+
+    def __init__(self):
+        self.enqueued = 0
+        self.completed = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.last_enqueued = self.started
+        self.finished: Optional[float] = None
+        self.closed = False
+
+    @property
+    def drained(self) -> bool:
+        return self.closed and self.completed >= self.enqueued
+
+    def as_dict(self) -> Dict[str, Any]:
+        caught_up = self.finished is not None and self.completed >= self.enqueued
+        end = self.finished if caught_up else time.monotonic()
+        return {
+            'enqueued': self.enqueued,
+            'completed': self.completed,
+            'failed': self.failed,
+            'drained': self.drained,
+            'drain_seconds': round(end - self.started, 3),
+        }
+
+
+class DeliveryPipeline:
+    """Ограниченная очередь отправок и пул async-воркеров в event loop бота."""
+
+    def __init__(self, workers: int = DELIVERY_WORKERS, queue_size: int = DELIVERY_QUEUE_SIZE):
+        if workers <= 0:
+            raise ValueError("workers должен быть больше нуля")
+        self.workers = workers
+        self.queue_size = queue_size
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._in_flight = 0
+        self._slots: "OrderedDict[str, _SlotStats]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        """Запущен ли конвейер и жив ли его event loop."""
+        return self._loop is not None and self._loop.is_running()
+
+    async def start(self):
+        """Создает очередь и воркеров в текущем event loop (вызывается из post_init)."""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"delivery-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"✅ Конвейер доставки запущен: {self.workers} воркеров, очередь {self.queue_size}")
+
+    async def stop(self, timeout: float = 10.0):
+        """Дожидается опустошения очереди (не дольше timeout) и останавливает воркеров."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Конвейер доставки остановлен с {self._queue.qsize()} неотправленными сообщениями")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+        logger.info("🛑 Конвейер доставки остановлен")
+
+    async def _worker(self):
+        while True:
+            func, kwargs, slot = await self._queue.get()
+            self._in_flight += 1
+            ok = True
+            try:
+                await func(**kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                ok = False
+                logger.error(f"❌ Ошибка доставки для {kwargs.get('chat_id')}: {e}")
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+                self._complete(slot, ok)
+
+    def _slot(self, slot: str) -> _SlotStats:
+        stats = self._slots.get(slot)
+        if stats is None or stats.closed or time.monotonic() - stats.started > _SLOT_MAX_AGE:
+            self._slots.pop(slot, None)
+            stats = self._slots[slot] = _SlotStats()
+            while len(self._slots) > _SLOT_HISTORY_SIZE:
+                self._slots.popitem(last=False)
+        return stats
+
+    def _complete(self, slot: Optional[str], ok: bool):
+        if slot is None:
+            return
+        with self._lock:
+            stats = self._slots.get(slot)
+            if stats is None:
+                return
+            stats.completed += 1
+            if not ok:
+                stats.failed += 1
+            stats.finished = time.monotonic()
+            if stats.drained:
+                _log_drained(slot, stats)
+
+    def _close(self, slot: str, stats: _SlotStats):
+        """Закрывает слот; вызывается под self._lock."""
+        stats.closed = True
+        # Все отправки могли завершиться раньше, чем слот закрыт
+        if stats.drained and stats.finished is not None:
+            _log_drained(slot, stats)
+
+    def close_idle_slots(self, idle_seconds: float = _SLOT_IDLE_SECONDS) -> int:
+        """
+        Закрывает слоты, в которые idle_seconds не ставилось ни одной отправки.
+        В per_user-режиме задачи слота не знают, какая из них последняя, поэтому
+        слоты закрывает периодическая задача планировщика.
+
+        Returns:
+            Количество закрытых слотов
+        """
+        now = time.monotonic()
+        closed = 0
+        with self._lock:
+            for slot, stats in self._slots.items():
+                if not stats.closed and now - stats.last_enqueued >= idle_seconds:
+                    self._close(slot, stats)
+                    closed += 1
+        return closed
+
+    async def enqueue_many(
+        self,
+        func: Callable[..., Coroutine],
+        chat_ids: Iterable[int],
+        slot: Optional[str] = None,
+        close_slot: bool = False,
+        **kwargs
+    ) -> int:
+        """
+        Ставит отправки в очередь; ждет свободного места, если очередь заполнена.
+
+        Args:
+            func: Async функция отправки, вызывается как func(chat_id=..., **kwargs)
+            chat_ids: Получатели
+            slot: Ключ слота для метрик доставки
+            close_slot: Больше отправок в этот слот не будет (для отчета о доставке)
+
+        Returns:
+            Количество поставленных в очередь отправок
+        """
+        count = 0
+        for chat_id in chat_ids:
+            stats = None
+            if slot is not None:
+                with self._lock:
+                    stats = self._slot(slot)
+                    stats.enqueued += 1
+                    stats.last_enqueued = time.monotonic()
+            try:
+                await self._queue.put((func, dict(kwargs, chat_id=chat_id), slot))
+            except asyncio.CancelledError:
+                # Постановка отменена (таймаут submit_many): отправки не будет
+                if stats is not None:
+                    with self._lock:
+                        stats.enqueued -= 1
+                raise
+            count += 1
+        if slot is not None and close_slot:
+            with self._lock:
+                stats = self._slots.get(slot)
+                if stats is not None and not stats.closed:
+                    self._close(slot, stats)
+        return count
+
+    def submit_many(
+        self,
+        func: Callable[..., Coroutine],
+        chat_ids: Iterable[int],
+        slot: Optional[str] = None,
+        close_slot: bool = False,
+        timeout: Optional[float] = DELIVERY_SUBMIT_TIMEOUT,
+        **kwargs
+    ) -> int:
+        """
+        Потокобезопасная постановка в очередь из потока планировщика.
+        Блокирует вызывающий поток, пока все отправки не попадут в очередь.
+
+        Raises:
+            TimeoutError: Очередь не приняла отправки за timeout секунд
+                (event loop завис или доставка стоит); непоставленные отправки отменяются
+        """
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            raise RuntimeError("Конвейер доставки не запущен")
+        try:
+            current_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            current_loop = None
+        if current_loop is loop:
+            raise RuntimeError("submit_many нельзя вызывать из event loop конвейера")
+        future = asyncio.run_coroutine_threadsafe(
+            self.enqueue_many(func, chat_ids, slot, close_slot, **kwargs), loop
+        )
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # Иначе корутина продолжит ставить отправки уже после ошибки
+            future.cancel()
+            raise TimeoutError(f"Очередь доставки не приняла отправки за {timeout:g}с") from None
+
+    def submit(self, func: Callable[..., Coroutine], chat_id: int, slot: Optional[str] = None, **kwargs) -> int:
+        """Потокобезопасная постановка одной отправки в очередь."""
+        return self.submit_many(func, (chat_id,), slot, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Снимок метрик конвейера."""
+        with self._lock:
+            slots = {slot: stats.as_dict() for slot, stats in self._slots.items()}
+        return {
+            'running': self.running,
+            'workers': self.workers,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'queue_size': self.queue_size,
+            'in_flight': self._in_flight,
+            'slots': slots,
+        }
+
+
+def _log_drained(slot: str, stats: _SlotStats):
+    summary_logger.info(
+        f"📬 Слот {slot} доставлен: {stats.completed} сообщений "
+        f"за {stats.finished - stats.started:.2f}с (ошибок: {stats.failed})"
+    )
+
+
+# Глобальный экземпляр конвейера доставки
+delivery_pipeline = DeliveryPipeline()
@@ -0,0 +1,138 @@
+"""
+Общий ограничитель частоты отправки сообщений в Telegram.
+
+В начале каждого часа все активные пользователи получают напоминание
+одновременно. Telegram допускает около 30 сообщений в секунду на бота
+и около одного сообщения в секунду в один чат, поэтому все отправки
+проходят через один token bucket с глобальной скоростью и интервалом
+между сообщениями в один чат. При RetryAfter пауза ставится на весь
+bucket, а не роняет отдельную задачу.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+from ..utils.metrics import delivery_metrics
+from ..config import (
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_GLOBAL_BURST,
+    TELEGRAM_PER_CHAT_INTERVAL,
+    TELEGRAM_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# Порог размера таблицы per-chat интервалов, после которого устаревшие записи вычищаются
+_CHAT_TABLE_PRUNE_SIZE = 10000
+
+
+class TelegramRateLimiter:
+    """
+    Token bucket (GCRA) с глобальной скоростью и интервалом между сообщениями в один чат.
+    
+    Слоты резервируются под threading.Lock, а ожидание выполняется через asyncio.sleep,
+    поэтому один экземпляр безопасно использовать из любого потока и event loop.
+    """
+    
+    def __init__(
+        self,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        burst: int = TELEGRAM_GLOBAL_BURST,
+        per_chat_interval: float = TELEGRAM_PER_CHAT_INTERVAL,
+        max_retries: int = TELEGRAM_MAX_RETRIES
+    ):
+        if global_rate <= 0:
+            raise ValueError("global_rate должен быть больше нуля")
+        self.interval = 1.0 / global_rate
+        self.tolerance = max(burst - 1, 0) * self.interval
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        
+        self._lock = threading.Lock()
+        self._tat = 0.0  # theoretical arrival time следующего слота
+        self._paused_until = 0.0
+        self._chat_next: Dict[int, float] = {}
+    
+    def _reserve(self, chat_id: int) -> float:
+        """Резервирует слот отправки и возвращает, сколько секунд нужно подождать."""
+        with self._lock:
+            now = time.monotonic()
+            arrival = max(now, self._paused_until, self._chat_next.get(chat_id, 0.0))
+            allowed_at = max(arrival, self._tat - self.tolerance)
+            self._tat = max(self._tat, allowed_at) + self.interval
+            
+            if self.per_chat_interval > 0:
+                if len(self._chat_next) >= _CHAT_TABLE_PRUNE_SIZE:
+                    self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+                self._chat_next[chat_id] = allowed_at + self.per_chat_interval
+            
+            return allowed_at - now
+    
+    async def acquire(self, chat_id: int):
+        """Ждет, пока отправка в чат будет разрешена лимитами."""
+        delay = self._reserve(chat_id)
+        if delay > 0:
+            await asyncio.sleep(delay)
+    
+    def pause(self, seconds: float):
+        """Приостанавливает все отправки на заданное время (ответ RetryAfter)."""
+        with self._lock:
+            resume_at = time.monotonic() + seconds
+            if resume_at > self._paused_until:
+                self._paused_until = resume_at
+                self._tat = max(self._tat, resume_at)
+    
+    async def send_message(self, bot: Any, chat_id: int, text: str, **kwargs) -> Any:
+        """
+        Отправляет сообщение с учетом лимитов.
+        При RetryAfter ставит bucket на паузу и повторяет отправку до max_retries раз.
+        
+        Args:
+            bot: Экземпляр telegram.Bot
+            chat_id: ID чата
+            text: Текст сообщения
+            **kwargs: Дополнительные параметры send_message
+            
+        Returns:
+            Отправленное сообщение
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id)
+            started = time.perf_counter()
+            try:
+                message = await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            except RetryAfter as e:
+                delivery_metrics.retry_after.inc()
+                retry_after = _retry_after_seconds(e)
+                self.pause(retry_after)
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"⏸️ RetryAfter {retry_after:.0f}с при отправке в {chat_id}, отправки приостановлены")
+            except Forbidden:
+                delivery_metrics.forbidden.inc()
+                raise
+            except TelegramError:
+                delivery_metrics.errors.inc()
+                raise
+            else:
+                delivery_metrics.sent.inc()
+                return message
+            finally:
+                delivery_metrics.send_seconds.observe(time.perf_counter() - started)
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    """Возвращает задержку RetryAfter в секундах (PTB отдает int или timedelta)."""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+# Глобальный экземпляр ограничителя для всех отправок бота
+rate_limiter = TelegramRateLimiter()
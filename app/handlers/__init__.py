@@ -8,6 +8,7 @@ from .water_handlers import (
     water_resume,
     check_and_send_water_reminder
 )
+from .admin import profile_command
 
 __all__ = [
     'start',
@@ -17,6 +18,7 @@ __all__ = [
     'water_menu',
     'water_stop',
     'water_resume',
-    'check_and_send_water_reminder'
+    'check_and_send_water_reminder',
+    'profile_command'
 ]
 
@@ -0,0 +1,56 @@
+"""
+Служебные команды администраторов (chat_id из ADMIN_CHAT_IDS)
+"""
+import asyncio
+import logging
+from telegram import Message, Update
+from telegram.ext import CallbackContext
+
+from app.config import ADMIN_CHAT_IDS, PROFILE_SECONDS
+from app.utils.profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+PROFILE_USAGE = "Использование: /profile [секунды] или /profile stop"
+
+
+async def profile_command(update: Update, context: CallbackContext):
+    """
+    /profile [секунды] - профилирование работающего бота на заданное окно.
+    /profile stop - досрочное завершение. Остальным пользователям команда не отвечает.
+    """
+    chat_id = update.effective_chat.id
+    if chat_id not in ADMIN_CHAT_IDS:
+        return
+
+    args = context.args or []
+    if args and args[0] == 'stop':
+        if profiler.stop():
+            await update.message.reply_text("⏹️ Профилирование завершается, отчет придет следующим сообщением")
+        else:
+            await update.message.reply_text("ℹ️ Профилирование не запущено")
+        return
+
+    try:
+        seconds = int(args[0]) if args else PROFILE_SECONDS
+    except ValueError:
+        await update.message.reply_text(PROFILE_USAGE)
+        return
+
+    seconds = profiler.start(seconds, reason=f"/profile от {chat_id}")
+    if not seconds:
+        await update.message.reply_text("⏳ Профилирование уже идет")
+        return
+
+    logger.info(f"🔬 Администратор {chat_id} запустил профилирование на {seconds:.0f}с")
+    await update.message.reply_text(f"🔬 Профилирование запущено на {seconds:.0f}с")
+    # Отчет отправляется отдельной задачей, обработка обновлений не ждет окончания окна
+    context.application.create_task(_reply_with_report(update.message), update=update)
+
+
+async def _reply_with_report(message: Message):
+    report = await asyncio.to_thread(profiler.wait)
+    if report:
+        await message.reply_text(f"📄 Отчеты профилирования:\n{report}.txt\n{report}.folded")
+    else:
+        await message.reply_text("❌ Отчет не записан, подробности в логе")
@@ -5,7 +5,7 @@ import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext, ConversationHandler
 
-from app.database import init_db, get_water_reminder, save_water_reminder, set_onboarding_completed
+from app.database import get_water_reminder, save_water_reminder, set_onboarding_completed
 from app.config import Messages, DEFAULT_TIMEZONE, DEFAULT_START_HOUR, DEFAULT_END_HOUR
 from app.scheduler import job_manager
 from app.handlers.water_handlers import check_and_send_water_reminder
@@ -20,9 +20,6 @@ async def start(update: Update, context: CallbackContext):
     Показывает онбординг для новых пользователей или меню управления для существующих.
     """
     try:
-        # Убеждаемся, что БД инициализирована
-        init_db()
-        
         chat_id = update.effective_chat.id
         settings = get_water_reminder(chat_id)
         
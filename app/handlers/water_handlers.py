@@ -3,10 +3,12 @@
 Упрощенная версия с фиксированным расписанием
 """
 import logging
+import time
 from datetime import datetime, timedelta
 import pytz
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
+from telegram.error import TelegramError
 
 from app.config import (
     DEFAULT_TIMEZONE, DEFAULT_START_HOUR, DEFAULT_END_HOUR, 
@@ -14,10 +16,14 @@ from app.config import (
 )
 from app.database import (
     get_water_reminder,
+    get_water_reminder_state,
     save_water_reminder,
     set_water_reminder_active
 )
-from app.scheduler import job_manager
+from app.scheduler import job_manager, slot_key, slot_start
+from app.delivery import rate_limiter, dead_chats, is_permanent_failure, delivery_ledger
+from app.delivery.ledger import OUTCOME_SENT, OUTCOME_BLOCKED, OUTCOME_FAILED
+from app.utils.metrics import delivery_metrics, scheduler_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +41,10 @@ async def check_and_send_water_reminder(application, chat_id: int, settings: dic
         application: Telegram Application
         chat_id: ID чата пользователя
         settings: Настройки напоминаний
+    
+    Raises:
+        TelegramError: Временная ошибка отправки (уже записана в журнал как failed) -
+            конвейер доставки считает ее в failed слота
     """
     try:
         user_tz = pytz.timezone(settings.get('timezone', DEFAULT_TIMEZONE))
@@ -45,31 +55,61 @@ async def check_and_send_water_reminder(application, chat_id: int, settings: dic
         end_hour = DEFAULT_END_HOUR  # 23
         message = WATER_REMINDER_MESSAGE  # Фиксированное сообщение
         
-        logger.info(f"⏰ Проверка времени для {chat_id}: час {now.hour}, диапазон {start_hour}-{end_hour}")
+        logger.debug(f"⏰ Проверка времени для {chat_id}: час {now.hour}, диапазон {start_hour}-{end_hour}")
         
+        # Быстрая проверка по реестру: пользователь мог остановить напоминания,
+        # пока задача ждала в очереди исполнителя
+        if not job_manager.has_water_reminders(chat_id):
+            delivery_metrics.skipped.inc()
+            logger.debug(f"⏭️ Пользователь {chat_id} снят с расписания, пропускаем")
+            return
+
         # ИСПРАВЛЕНИЕ: Проверяем is_active И удаляем задачи если пользователь неактивен
-        from app.database import get_water_reminder
-        user_settings = get_water_reminder(chat_id)
+        # Состояние берется из кэша настроек, SQLite читается только при промахе
+        user_settings = get_water_reminder_state(chat_id)
         
         if not user_settings:
             logger.warning(f"⚠️ Пользователь {chat_id} не найден в БД, удаляем задачи")
             # Удаляем задачи для несуществующего пользователя
-            job_manager._remove_jobs_by_prefix(f"water_{chat_id}")
+            job_manager.unschedule_water_reminders(chat_id)
             return
             
         if not user_settings.get('is_active', False):
             logger.warning(f"⚠️ Пользователь {chat_id} неактивен, но задачи ещё существуют! Удаляем.")
             # Это не должно происходить - задачи должны были быть удалены при остановке
-            job_manager._remove_jobs_by_prefix(f"water_{chat_id}")
+            job_manager.unschedule_water_reminders(chat_id)
             return
         
         # ИСПРАВЛЕНИЕ: Изменяем условие на <= для включения 23:00
         if start_hour <= now.hour <= end_hour:
-            await application.bot.send_message(chat_id=chat_id, text=message)
-            logger.info(f"✅ Отправлено напоминание о воде для {chat_id} в {now.hour}:00")
+            # Слот и его начало - для журнала доставки. Час берется тот, на который
+            # назначен запуск (hour от задачи), а не текущий: опоздавший запуск - в своем слоте
+            timezone = settings.get('timezone', DEFAULT_TIMEZONE)
+            scheduled = slot_start(timezone, settings.get('hour'), now)
+            slot = settings.get('slot') or slot_key(timezone, scheduled.hour, now)
+            scheduled_at = scheduled.timestamp()
+            started_at = time.time()
+            try:
+                await rate_limiter.send_message(application.bot, chat_id, message)
+            except TelegramError as e:
+                if not is_permanent_failure(e):
+                    delivery_ledger.record(chat_id, slot, scheduled_at, started_at, OUTCOME_FAILED)
+                    raise
+                delivery_ledger.record(chat_id, slot, scheduled_at, started_at, OUTCOME_BLOCKED)
+                # Чат недоступен навсегда: снимаем с расписания сразу, в БД - пачкой
+                job_manager.unschedule_water_reminders(chat_id)
+                dead_chats.add(chat_id, e)
+                return
+            delivery_ledger.record(chat_id, slot, scheduled_at, started_at, OUTCOME_SENT)
+            scheduler_metrics.message_sent(slot, timezone, scheduled_at, time.time())
+            logger.debug(f"✅ Отправлено напоминание о воде для {chat_id} в {now.hour}:00")
         else:
-            logger.info(f"⏭️ Напоминание пропущено - час {now.hour} вне диапазона {start_hour}-{end_hour}")
+            delivery_metrics.skipped.inc()
+            logger.debug(f"⏭️ Напоминание пропущено - час {now.hour} вне диапазона {start_hour}-{end_hour}")
             
+    except TelegramError:
+        # Постоянные ошибки обработаны выше, сюда доходят только временные
+        raise
     except Exception as e:
         logger.error(f"❌ Ошибка при проверке и отправке напоминания о воде для {chat_id}: {e}", exc_info=True)
 
@@ -142,7 +182,6 @@ async def water_stop(update: Update, context: CallbackContext):
     """
     try:
         chat_id = update.effective_chat.id
-        job_id_prefix = f"water_{chat_id}"
         
         logger.info(f"🛑 Остановка напоминаний для {chat_id}...")
         
@@ -150,25 +189,10 @@ async def water_stop(update: Update, context: CallbackContext):
         set_water_reminder_active(chat_id, is_active=False)
         logger.info(f"💾 БД обновлена: is_active=False для {chat_id}")
         
-        # ЗАТЕМ удаляем ВСЕ задачи через job_manager
-        jobs = job_manager.get_all_jobs()
-        removed_count = 0
-        logger.info(f"📋 Всего задач в планировщике: {len(jobs)}")
+        # ЗАТЕМ снимаем пользователя с расписания через job_manager
+        job_manager.unschedule_water_reminders(chat_id)
         
-        for job in jobs:
-            if job.id.startswith(job_id_prefix):
-                logger.info(f"🗑️ Удаляю задачу: {job.id} (next_run: {job.next_run_time})")
-                job_manager.remove_job(job.id)
-                removed_count += 1
-        
-        logger.info(f"✅ Напоминания о воде для {chat_id} остановлены ({removed_count} задач удалено)")
-        
-        # ПРОВЕРКА: Убеждаемся, что задачи действительно удалены
-        remaining_jobs = [j for j in job_manager.get_all_jobs() if j.id.startswith(job_id_prefix)]
-        if remaining_jobs:
-            logger.error(f"❌ ОШИБКА: После остановки остались задачи: {[j.id for j in remaining_jobs]}")
-        else:
-            logger.info(f"✅ Проверка: все задачи для {chat_id} успешно удалены")
+        logger.info(f"✅ Напоминания о воде для {chat_id} остановлены")
         
         text = Messages.WATER_STOPPED
         keyboard = [
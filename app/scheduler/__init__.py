@@ -1,8 +1,12 @@
 """
 Модуль планировщика задач
 """
-from .job_manager import JobManager, job_manager
-from .async_wrapper import async_to_sync
+from .job_manager import JobManager, job_manager, slot_key, slot_start
+from .triggers import MemoCronTrigger, hourly_trigger
+from .async_wrapper import async_to_sync, bind_event_loop, unbind_event_loop
 
-__all__ = ['JobManager', 'job_manager', 'async_to_sync']
+__all__ = [
+    'JobManager', 'job_manager', 'slot_key', 'slot_start', 'MemoCronTrigger', 'hourly_trigger',
+    'async_to_sync', 'bind_event_loop', 'unbind_event_loop'
+]
 
@@ -1,23 +1,64 @@
 """
 Синхронно-асинхронные обертки для APScheduler.
 Решает проблему memory leaks и правильно управляет event loops.
+
+Режимы выполнения (SCHEDULER_ASYNC_MODE):
+- app_loop: корутина передается в работающий event loop бота через
+  run_coroutine_threadsafe - используется один пул HTTP-соединений бота.
+  Поток планировщика ждет ее не дольше SCHEDULER_ASYNC_TIMEOUT: зависший
+  loop или отправка не должны навсегда занимать поток пула APScheduler
+- thread: корутина выполняется в отдельном event loop через asyncio.run()
+  (используется также как запасной вариант, пока loop бота не привязан)
 """
 import asyncio
 import logging
-from typing import Callable, Any, Coroutine
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Any, Coroutine, Optional, Set
 from functools import wraps
 
+from ..config import SCHEDULER_ASYNC_MODE, SCHEDULER_ASYNC_TIMEOUT
+
 logger = logging.getLogger(__name__)
 
 class AsyncJobRunner:
     """
     Менеджер для запуска асинхронных функций из синхронного контекста APScheduler.
-    Использует asyncio.run() для правильного управления event loops.
+    
+    Если привязан event loop бота (bind_loop), корутины выполняются в нем,
+    а поток планировщика ждет результата. Иначе используется asyncio.run().
     """
     
+    def __init__(self, mode: str = SCHEDULER_ASYNC_MODE, timeout: Optional[float] = SCHEDULER_ASYNC_TIMEOUT):
+        if mode not in ('app_loop', 'thread'):
+            raise ValueError(f"Неизвестный режим выполнения async задач: {mode}")
+        self.mode = mode
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Set[Future] = set()
+        self._lock = threading.Lock()
+    
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Привязывает event loop бота (вызывается из post_init)."""
+        if self.mode != 'app_loop':
+            return
+        self._loop = loop
+        logger.info("✅ AsyncJobRunner: задачи выполняются в event loop бота")
+    
+    def unbind_loop(self):
+        """Отвязывает event loop бота и отменяет незавершенные корутины (вызывается при остановке)."""
+        with self._lock:
+            self._loop = None
+            pending = list(self._pending)
+            self._pending.clear()
+        for future in pending:
+            future.cancel()
+        if pending:
+            logger.info(f"🛑 AsyncJobRunner: отменено {len(pending)} незавершенных задач")
+    
     def run_async(self, coro: Coroutine) -> Any:
         """
-        Запускает корутину в отдельном event loop.
+        Запускает корутину в event loop бота или в отдельном event loop.
         
         Args:
             coro: Асинхронная функция для выполнения
@@ -26,18 +67,46 @@ class AsyncJobRunner:
             Результат выполнения корутины
         """
         try:
-            logger.debug(f"🔄 AsyncJobRunner: Запуск корутины {coro.__name__ if hasattr(coro, '__name__') else type(coro)}")
+            loop = self._loop
+            if loop is not None and loop.is_running():
+                return self._run_in_loop(coro, loop)
             # Для Python 3.7+ используем asyncio.run() - правильно создает и закрывает loop
-            result = asyncio.run(coro)
-            logger.debug(f"✅ AsyncJobRunner: Корутина завершена успешно")
-            return result
+            return asyncio.run(coro)
         except Exception as e:
             logger.error(f"❌ AsyncJobRunner: Ошибка при выполнении async задачи: {e}", exc_info=True)
             raise
+    
+    def _run_in_loop(self, coro: Coroutine, loop: asyncio.AbstractEventLoop) -> Any:
+        """
+        Передает корутину в loop бота и блокирует поток планировщика до результата.
+        
+        Raises:
+            TimeoutError: Корутина не завершилась за self.timeout секунд (она отменяется)
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        with self._lock:
+            self._pending.add(future)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            logger.error(f"⏱️ AsyncJobRunner: задача не завершилась за {self.timeout:g}с и отменена")
+            raise TimeoutError(f"Async задача не завершилась за {self.timeout:g}с") from None
+        finally:
+            with self._lock:
+                self._pending.discard(future)
 
 # Глобальный экземпляр runner
 _runner = AsyncJobRunner()
 
+def bind_event_loop(loop: asyncio.AbstractEventLoop):
+    """Привязывает event loop бота к глобальному runner."""
+    _runner.bind_loop(loop)
+
+def unbind_event_loop():
+    """Отвязывает event loop бота от глобального runner."""
+    _runner.unbind_loop()
+
 def async_to_sync(async_func: Callable[..., Coroutine]) -> Callable:
     """
     Декоратор для преобразования async функции в sync для использования в APScheduler.
@@ -59,11 +128,8 @@ def async_to_sync(async_func: Callable[..., Coroutine]) -> Callable:
     @wraps(async_func)
     def wrapper(*args, **kwargs):
         try:
-            logger.debug(f"🔄 async_to_sync wrapper: вызвана функция {async_func.__name__}")
             coro = async_func(*args, **kwargs)
-            result = _runner.run_async(coro)
-            logger.debug(f"✅ async_to_sync wrapper: функция {async_func.__name__} завершена")
-            return result
+            return _runner.run_async(coro)
         except Exception as e:
             logger.error(f"❌ async_to_sync wrapper: ошибка в {async_func.__name__}: {e}", exc_info=True)
             raise
@@ -2,65 +2,203 @@
 Менеджер задач для APScheduler с персистентным хранилищем.
 ИСПРАВЛЕНО: Решена проблема с pickle для вложенных замыканий.
 """
+import asyncio
 import logging
+import sqlite3
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+from types import MappingProxyType
+from typing import Callable, Dict, Any, Iterable, List, Mapping, Optional, Sequence, Tuple
 import pytz
 
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.base import STATE_RUNNING
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.executors.pool import ThreadPoolExecutor
-from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.job import Job
 
 from ..config import (
     DEFAULT_TIMEZONE,
     DEFAULT_START_HOUR,
     DEFAULT_END_HOUR,
-    MISFIRE_GRACE_TIME
+    MISFIRE_GRACE_TIME,
+    SCHEDULER_MODE,
+    BUCKET_FANOUT_BATCH_SIZE,
+    RESTORE_BATCH_SIZE,
+    DB_LOOKUP_CHUNK_SIZE,
+    DEAD_CHAT_FLUSH_INTERVAL,
+    LEDGER_FLUSH_INTERVAL,
+    LOG_SUMMARY_INTERVAL
 )
+from ..database import get_water_reminder_states
+from ..delivery import delivery_pipeline, outbox_relay, dead_chats, delivery_ledger
+from ..utils.logger import summary_logger
+from ..utils.metrics import ActivitySummary, scheduler_metrics
 from .async_wrapper import async_to_sync
+from .jobstore import CoalesceCountingJobStore
+from .triggers import hourly_trigger
+from .registry import UserRegistry
+from .planner import SlotPlanner
 
 logger = logging.getLogger(__name__)
 
+# Имя задач напоминаний per_user-режима: одна строка на все задачи
+WATER_JOB_NAME = "Water reminder"
+
 # ============================================================================
 # НОВОЕ: Сериализуемые callable классы для задач
 # ============================================================================
 
+def utc_now() -> datetime:
+    """Часы планировщика по умолчанию: текущее время в UTC."""
+    return datetime.now(pytz.utc)
+
+
+def slot_start(timezone: str, hour: Optional[int] = None, now: Optional[datetime] = None) -> datetime:
+    """
+    Начало слота рассылки в местном времени. По умолчанию берется текущий
+    местный час. Час позже текущего - запуск, опоздавший за полночь:
+    слот относится к предыдущим суткам.
+    """
+    local_now = (now or utc_now()).astimezone(pytz.timezone(timezone))
+    if hour is None:
+        hour = local_now.hour
+    start = local_now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if start > local_now:
+        start -= timedelta(days=1)
+    return start
+
+
+def slot_key(timezone: str, hour: Optional[int] = None, now: Optional[datetime] = None) -> str:
+    """
+    Ключ слота рассылки: местная дата, час и часовой пояс, например
+    "2025-10-17 14:00 Asia/Tokyo". Используется в outbox и метриках доставки.
+    По умолчанию берется текущий местный час (см. slot_start).
+    """
+    start = slot_start(timezone, hour, now)
+    return f"{start:%Y-%m-%d} {start.hour:02d}:00 {timezone}"
+
+
+def slot_settings(settings: Mapping[str, Any], slot: str, hour: Optional[int]) -> Mapping[str, Any]:
+    """
+    Настройки для функции отправки с ключом слота и часом, на который назначен
+    запуск: опоздавшая отправка записывается в свой слот, а не в слот текущего часа.
+    """
+    return MappingProxyType({**settings, 'slot': slot, 'hour': hour})
+
+
+# Атрибуты Job, копируемые с задачи-образца; свои у задачи только id, func, args, trigger и время запуска
+_JOB_ATTRS = tuple(
+    attr for attr in Job.__slots__
+    if not attr.startswith('__') and attr not in ('id', 'func', 'args', 'trigger', 'next_run_time')
+)
+
+# Аргументы задач per_user-режима: час слота, общие кортежи на всех пользователей
+_HOUR_ARGS = {hour: (hour,) for hour in range(DEFAULT_START_HOUR, DEFAULT_END_HOUR + 1)}
+
+
 class WaterReminderJob:
     """
-    Сериализуемая задача для напоминаний о воде.
+    Задача для напоминаний о воде: один неизменяемый экземпляр на пользователя,
+    общий для всех 16 его задач. Настройки - общий для часового пояса словарь
+    только для чтения (JobManager.timezone_settings): состояние пользователя
+    функция отправки все равно перечитывает из реестра и кэша настроек.
+    Час слота задача получает аргументом (args задачи), поэтому опоздавший
+    запуск записывается в свой слот, а не в слот текущего часа.
     Использует глобальный job_manager для получения application и функции.
     """
-    def __init__(self, chat_id: int, settings: Dict[str, Any]):
-        self.chat_id = chat_id
-        self.settings = settings
+    __slots__ = ('chat_id', 'settings')
     
-    def __call__(self):
-        """Вызывается планировщиком при выполнении задачи."""
+    def __init__(self, chat_id: int, settings: Mapping[str, Any]):
+        object.__setattr__(self, 'chat_id', chat_id)
+        object.__setattr__(self, 'settings', settings)
+    
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError("WaterReminderJob неизменяем")
+    
+    def __call__(self, hour: Optional[int] = None):
+        """
+        Вызывается планировщиком при выполнении задачи.
+        
+        Args:
+            hour: Час, на который назначен запуск (по умолчанию - текущий местный час)
+        """
         try:
-            logger.info(f"🔔 WaterReminderJob вызван для chat_id={self.chat_id}")
+            logger.debug(f"🔔 WaterReminderJob вызван для chat_id={self.chat_id}")
             from . import job_manager  # Импортируем глобальный экземпляр
             
             if job_manager.application is None or job_manager.water_send_func is None:
                 logger.error("❌ Application или send_func не установлены в JobManager")
                 return
             
-            logger.info(f"📤 Отправляем напоминание о воде для {self.chat_id}")
+            timezone = self.settings.get('timezone', DEFAULT_TIMEZONE)
+            slot = slot_key(timezone, hour, job_manager.clock())
+            if outbox_relay.running:
+                # Слот записывается в outbox, отправку выполнит воркер конвейера
+                outbox_relay.submit(((self.chat_id, slot, timezone),))
+                return
+            settings = slot_settings(self.settings, slot, hour)
+            if delivery_pipeline.running:
+                # Отправку выполнит воркер конвейера, поток планировщика свободен сразу
+                delivery_pipeline.submit(
+                    job_manager.water_send_func,
+                    self.chat_id,
+                    slot=slot,
+                    application=job_manager.application,
+                    settings=settings
+                )
+                return
+            
+            logger.debug(f"📤 Отправляем напоминание о воде для {self.chat_id}")
             sync_send_func = async_to_sync(job_manager.water_send_func)
             result = sync_send_func(
                 application=job_manager.application,
                 chat_id=self.chat_id,
-                settings=self.settings
+                settings=settings
             )
-            logger.info(f"✅ WaterReminderJob завершен для {self.chat_id}")
+            logger.debug(f"✅ WaterReminderJob завершен для {self.chat_id}")
             return result
         except Exception as e:
             logger.error(f"❌ Ошибка в WaterReminderJob для {self.chat_id}: {e}", exc_info=True)
             raise
 
 
+class WaterBucketJob:
+    """
+    Задача bucketed-режима: одна на пару (часовой пояс, час).
+    При срабатывании рассылает напоминание всем подписчикам часового пояса.
+    """
+    def __init__(self, timezone: str, hour: int):
+        self.timezone = timezone
+        self.hour = hour
+    
+    def __call__(self):
+        """Вызывается планировщиком при выполнении задачи."""
+        try:
+            from . import job_manager  # Импортируем глобальный экземпляр
+            
+            if job_manager.application is None or job_manager.water_send_func is None:
+                logger.error("❌ Application или send_func не установлены в JobManager")
+                return
+            
+            chat_ids = job_manager.get_slot_recipients(self.timezone, self.hour)
+            if not chat_ids:
+                logger.info(f"⏭️ Нет подписчиков в {self.timezone} на {self.hour:02d}:00")
+                return
+            
+            logger.info(f"🔔 Рассылка {self.timezone} {self.hour:02d}:00 для {len(chat_ids)} пользователей")
+            sent = job_manager.dispatch_bucket(chat_ids, self.timezone, self.hour)
+            logger.info(f"✅ Рассылка {self.timezone} {self.hour:02d}:00 завершена ({sent} отправок)")
+            return sent
+        except Exception as e:
+            logger.error(f"❌ Ошибка в WaterBucketJob {self.timezone} {self.hour:02d}:00: {e}", exc_info=True)
+            raise
+
+
 class JobManager:
     """
     Централизованный менеджер для управления всеми задачами планировщика.
@@ -70,14 +208,34 @@ class JobManager:
     - Задачи восстанавливаются из reminders.db при каждом запуске бота
     - Это решает все проблемы с pickle сериализацией классов
     - Использует сериализуемые классы WaterReminderJob и CustomReminderJob
+    
+    РЕЖИМЫ (SCHEDULER_MODE):
+    - per_user: 16 задач на пользователя, число задач растет с числом пользователей
+    - bucketed: 16 задач на часовой пояс (WaterBucketJob), пользователи хранятся
+      в реестре подписчиков; число задач зависит только от числа часовых поясов
+    
+    В обоих режимах состояние пользователей (пояс, активность) хранится в
+    компактном UserRegistry, id задач per_user-режима выводятся из chat_id.
+    
+    Текущее время берется из clock (aware datetime в UTC). Время первого
+    запуска задач, ключи слотов и планы получателей считаются от него, поэтому
+    бенчмарки подставляют виртуальные часы и прогоняют сутки за секунды.
     """
     
-    def __init__(self):
+    def __init__(self, mode: str = SCHEDULER_MODE, clock: Callable[[], datetime] = utc_now):
+        if mode not in ('per_user', 'bucketed'):
+            raise ValueError(f"Неизвестный режим планировщика: {mode}")
+        self.mode = mode
+        self.clock = clock
+        
         # ИСПРАВЛЕНИЕ: Используем MemoryJobStore вместо SQLAlchemy
         # Задачи восстанавливаются из reminders.db при каждом запуске
         # Это решает все проблемы с сериализацией pickle
+        # Хранилище дополнительно считает объединенные (coalesce) запуски
+        # и отдает число задач для метрик (job_counts)
+        self.jobstore = CoalesceCountingJobStore(self._job_coalesced)
         jobstores = {
-            'default': MemoryJobStore()
+            'default': self.jobstore
         }
         
         # Настройка executor'ов
@@ -86,7 +244,7 @@ class JobManager:
         }
         
         # Настройки для обработки пропущенных задач
-        job_defaults = {
+        self.job_defaults = {
             'coalesce': True,  # Объединить пропущенные запуски в один
             'max_instances': 1,  # Не запускать несколько экземпляров одновременно
             'misfire_grace_time': MISFIRE_GRACE_TIME  # Запустить в течение часа после пропуска
@@ -95,7 +253,7 @@ class JobManager:
         self.scheduler = BackgroundScheduler(
             jobstores=jobstores,
             executors=executors,
-            job_defaults=job_defaults,
+            job_defaults=self.job_defaults,
             timezone=DEFAULT_TIMEZONE
         )
         
@@ -103,11 +261,30 @@ class JobManager:
         self.application = None
         self.water_send_func = None
         
+        # Реестр подписчиков: chat_id -> (часовой пояс, активен) в параллельных массивах.
+        # Остановка и возобновление не сканируют задачи планировщика
+        self.registry = UserRegistry()
+        # Заранее собранные получатели ближайшего слота (bucketed-режим)
+        self.planner = SlotPlanner(self.registry)
+        # Сериализует изменение реестра вместе с созданием/удалением задач
+        self._index_lock = threading.RLock()
+        # Проверенная задача-образец для массового восстановления (_make_job)
+        self._job_template: Optional[Job] = None
+        self._job_template_attrs: List[Tuple[str, Any]] = []
+        
+        # Общие настройки задач по часовому поясу (заменяется целиком, читается без блокировки)
+        self._timezone_settings: Dict[str, Mapping[str, Any]] = {}
+        # Счетчики срабатываний на момент прошлой сводки в лог
+        self._activity = ActivitySummary()
+        
         # Добавляем обработчики событий для подробного логирования
         self.scheduler.add_listener(self._job_error_listener, EVENT_JOB_ERROR)
         self.scheduler.add_listener(self._job_executed_listener, EVENT_JOB_EXECUTED)
+        # Задержка старта задач напоминаний и пропущенные запуски
+        self.scheduler.add_listener(self._job_submitted_listener, EVENT_JOB_SUBMITTED)
+        self.scheduler.add_listener(self._job_missed_listener, EVENT_JOB_MISSED)
         
-        logger.info("✅ JobManager инициализирован с MemoryJobStore (задачи восстанавливаются из reminders.db)")
+        logger.info(f"✅ JobManager инициализирован с MemoryJobStore, режим {self.mode} (задачи восстанавливаются из reminders.db)")
     
     def _job_error_listener(self, event):
         """Обработчик ошибок выполнения задач."""
@@ -121,7 +298,42 @@ class JobManager:
     
     def _job_executed_listener(self, event):
         """Обработчик успешного выполнения задач."""
-        logger.info(f"✅ Задача {event.job_id} выполнена успешно")
+        timezone = self._job_timezone(event.job_id)
+        if timezone is not None:
+            scheduler_metrics.job_finished(timezone, event.scheduled_run_time, self.now())
+        logger.debug(f"✅ Задача {event.job_id} выполнена успешно")
+    
+    def _job_submitted_listener(self, event):
+        """Задача передана исполнителю: задержка старта относительно scheduled_run_time."""
+        timezone = self._job_timezone(event.job_id)
+        if timezone is not None:
+            scheduler_metrics.job_started(timezone, event.scheduled_run_times[-1], self.now())
+    
+    def _job_missed_listener(self, event):
+        """Запуск пропущен: опоздание больше misfire_grace_time."""
+        timezone = self._job_timezone(event.job_id)
+        if timezone is not None:
+            scheduler_metrics.misfire(timezone)
+        logger.debug(f"⏩ Пропущен запуск {event.job_id} в {event.scheduled_run_time}")
+    
+    def _job_coalesced(self, job: Any, skipped: int):
+        """Вызывается хранилищем: skipped запусков задачи будут объединены в один."""
+        timezone = self._job_timezone(job.id)
+        if timezone is not None:
+            scheduler_metrics.coalesce(timezone, skipped)
+        logger.debug(f"⏩ Задача {job.id}: {skipped} пропущенных запусков объединены в один")
+    
+    def _job_timezone(self, job_id: str) -> Optional[str]:
+        """Часовой пояс задачи напоминания по ее id; для служебных задач - None."""
+        if job_id.startswith('water_bucket_'):
+            return job_id[len('water_bucket_'):].rsplit('_', 1)[0]
+        if job_id.startswith('water_') and job_id != 'water_slot_planner':
+            try:
+                chat_id = int(job_id.split('_', 2)[1])
+            except ValueError:
+                return None
+            return self.registry.get_timezone(chat_id)
+        return None
     
     def set_application(self, application: Any):
         """Устанавливает ссылку на Telegram Application."""
@@ -136,9 +348,86 @@ class JobManager:
     def start(self):
         """Запускает планировщик."""
         if not self.scheduler.running:
+            if self.mode == 'bucketed':
+                self.scheduler.add_job(
+                    self.plan_upcoming_slots,
+                    IntervalTrigger(minutes=1),
+                    id='water_slot_planner',
+                    name="Water reminder slot planner",
+                    replace_existing=True
+                )
+            else:
+                # Задачи per_user-слота не знают, какая из них последняя:
+                # слот закрывается, когда в него перестают поступать отправки
+                self.scheduler.add_job(
+                    delivery_pipeline.close_idle_slots,
+                    IntervalTrigger(minutes=1),
+                    id='delivery_slot_closer',
+                    name="Close idle delivery slots",
+                    replace_existing=True
+                )
+            # Недоступные чаты выключаются в БД пачкой
+            self.scheduler.add_job(
+                dead_chats.flush,
+                IntervalTrigger(seconds=DEAD_CHAT_FLUSH_INTERVAL),
+                id='dead_chats_flush',
+                name="Deactivate blocked chats",
+                replace_existing=True
+            )
+            # Журнал доставки: сброс буфера и очистка старых записей
+            self.scheduler.add_job(
+                delivery_ledger.flush,
+                IntervalTrigger(seconds=LEDGER_FLUSH_INTERVAL),
+                id='delivery_ledger_flush',
+                name="Flush delivery ledger",
+                replace_existing=True
+            )
+            self.scheduler.add_job(
+                delivery_ledger.prune,
+                IntervalTrigger(hours=1),
+                id='delivery_ledger_prune',
+                name="Prune delivery ledger",
+                replace_existing=True
+            )
+            # Сводка задержек напоминаний в лог
+            self.scheduler.add_job(
+                self.log_lag_summary,
+                IntervalTrigger(hours=1),
+                id='scheduler_lag_report',
+                name="Log reminder lag summary",
+                replace_existing=True
+            )
+            # Сводка срабатываний вместо строки лога на каждое срабатывание
+            self.scheduler.add_job(
+                self.log_activity_summary,
+                IntervalTrigger(seconds=LOG_SUMMARY_INTERVAL),
+                id='scheduler_activity_report',
+                name="Log reminder activity summary",
+                replace_existing=True
+            )
             self.scheduler.start()
             logger.info("✅ Планировщик задач запущен")
     
+    def log_lag_summary(self):
+        """Пишет в лог сводку задержек напоминаний (задача scheduler_lag_report)."""
+        summary = scheduler_metrics.summary()
+        if summary:
+            logger.info(f"⏱️ Задержки напоминаний: {summary}")
+    
+    def log_activity_summary(self):
+        """Пишет в лог число срабатываний и исходов отправки за интервал (задача scheduler_activity_report)."""
+        summary = self._activity.take()
+        if summary:
+            summary_logger.info(f"📊 Напоминания {summary}")
+    
+    def now(self, tz: Any = pytz.utc) -> datetime:
+        """Текущее время по часам менеджера в часовом поясе tz."""
+        return self.clock().astimezone(tz)
+    
+    def plan_upcoming_slots(self) -> int:
+        """Собирает получателей ближайших слотов (задача water_slot_planner)."""
+        return self.planner.plan_upcoming(self.clock())
+    
     def shutdown(self, wait: bool = True):
         """Останавливает планировщик."""
         if self.scheduler.running:
@@ -164,8 +453,6 @@ class JobManager:
             settings: Настройки напоминаний (timezone, is_active)
             send_func: Async функция для отправки напоминания
         """
-        base_job_id = f"water_{chat_id}"
-        
         try:
             logger.info(f"📅 Начало планирования напоминаний для {chat_id}")
             
@@ -175,57 +462,407 @@ class JobManager:
             if self.water_send_func is None:
                 self.water_send_func = send_func
             
-            # КРИТИЧЕСКИ ВАЖНО: Удаляем ВСЕ старые задачи для этого пользователя
-            jobs_before = len([j for j in self.scheduler.get_jobs() if j.id.startswith(base_job_id)])
-            if jobs_before > 0:
-                logger.info(f"🗑️ Найдено {jobs_before} старых задач для {chat_id}, удаляю...")
-            self._remove_jobs_by_prefix(base_job_id)
+            timezone = settings.get('timezone', DEFAULT_TIMEZONE)
+            # Пользователь снова взаимодействует с ботом - чат больше не считается недоступным
+            dead_chats.discard(chat_id)
+            self._schedule_chat(chat_id, timezone)
             
-            user_tz_str = settings.get('timezone', DEFAULT_TIMEZONE)
-            user_tz = pytz.timezone(user_tz_str)
+            if self.mode == 'bucketed':
+                logger.info(f"✅ Пользователь {chat_id} подписан на bucket {timezone}")
+            else:
+                logger.info(f"✅ Настроено напоминаний для {chat_id}: каждый час с {DEFAULT_START_HOUR:02d}:00 до {DEFAULT_END_HOUR:02d}:00")
             
-            # Фиксированные значения: 08:00-23:00, каждый час
-            start_hour = DEFAULT_START_HOUR  # 8
-            end_hour = DEFAULT_END_HOUR  # 23
+        except Exception as e:
+            logger.error(f"❌ Ошибка при планировании напоминаний о воде для {chat_id}: {e}", exc_info=True)
+            raise
+    
+    def restore_water_reminders(
+        self,
+        application: Any,
+        reminders: Iterable[Dict[str, Any]],
+        send_func: callable,
+        batch_size: int = RESTORE_BATCH_SIZE
+    ) -> int:
+        """
+        Массовое восстановление расписаний при запуске бота.
+        
+        Строки читаются потоково и регистрируются пачками. На время восстановления
+        планировщик ставится на паузу, поэтому добавление задач не будит его поток,
+        а после resume() планировщик просыпается один раз. Пользователи попадают
+        в реестр одной загрузкой (UserRegistry.activate_many), bucket-задачи
+        создаются после нее для каждого часового пояса с подписчиками.
+        Задачи per_user-режима собираются в список и попадают в хранилище одной
+        сортировкой (CoalesceCountingJobStore.add_jobs): вставка по одной сдвигает
+        хвост отсортированного списка и делает восстановление квадратичным.
+        
+        Args:
+            application: Экземпляр Telegram Application
+            reminders: Итерируемые настройки пользователей (chat_id, timezone)
+            send_func: Async функция для отправки напоминания
+            batch_size: Размер пачки для отчета о прогрессе
             
-            # Создаем задачи для каждого часа с 08:00 до 23:00 (всего 16 задач)
-            # Формат job_id: water_{chat_id}_8, water_{chat_id}_9, ..., water_{chat_id}_23
-            jobs_created = 0
-            for hour in range(start_hour, end_hour + 1):
-                job_id = f"{base_job_id}_{hour}"
-                
-                # ИСПРАВЛЕНИЕ: Создаем ГЛУБОКУЮ копию settings для каждой задачи
-                # чтобы избежать разделения состояния между пользователями
-                job_settings = {
-                    'timezone': user_tz_str,
-                    'is_active': settings.get('is_active', True),
-                    'chat_id': chat_id  # Добавляем chat_id для явности
-                }
-                job_callable = WaterReminderJob(chat_id, job_settings)
+        Returns:
+            Количество восстановленных пользователей
+        """
+        if self.application is None:
+            self.set_application(application)
+        if self.water_send_func is None:
+            self.water_send_func = send_func
+        
+        paused = self.scheduler.state == STATE_RUNNING
+        if paused:
+            self.scheduler.pause()
+        
+        started = time.perf_counter()
+        stats = {'restored': 0, 'failed': 0}
+        # Время первого запуска одинаково для всех задач пары (пояс, час) - считаем его один раз
+        first_run_times: Dict[Tuple[str, int], datetime] = {}
+        jobs: List[Job] = []
+        
+        def entries():
+            for reminder in reminders:
+                chat_id = reminder['chat_id']
+                timezone = reminder.get('timezone') or DEFAULT_TIMEZONE
+                try:
+                    if self.mode == 'per_user':
+                        self._add_chat_jobs(chat_id, timezone, first_run_times, bulk=jobs)
+                    stats['restored'] += 1
+                    yield chat_id, timezone
+                except Exception as e:
+                    stats['failed'] += 1
+                    logger.error(f"❌ Не удалось восстановить напоминания для {chat_id}: {e}")
                 
-                job = self.scheduler.add_job(
-                    job_callable,
-                    CronTrigger(
-                        hour=hour,
-                        minute=0,
-                        timezone=user_tz
-                    ),
-                    id=job_id,
-                    name=f"Water reminder for {chat_id} at {hour:02d}:00",
-                    replace_existing=True
-                )
-                jobs_created += 1
-                logger.info(f"📝 Добавлена задача {job_id}, next_run: {job.next_run_time}")
+                processed = stats['restored'] + stats['failed']
+                if processed % batch_size == 0:
+                    elapsed = time.perf_counter() - started
+                    logger.info(f"🔄 Восстановлено {stats['restored']} пользователей ({stats['restored'] / elapsed:.0f} пользователей/с)")
+        
+        try:
+            with self._index_lock:
+                self.registry.activate_many(entries())
+                if jobs:
+                    self.jobstore.add_jobs(jobs)
+                if self.mode == 'bucketed':
+                    for timezone in self.registry.active_timezones():
+                        self._add_bucket_jobs(timezone)
+        finally:
+            if paused:
+                self.scheduler.resume()
+        
+        restored, failed = stats['restored'], stats['failed']
+        elapsed = time.perf_counter() - started
+        rate = restored / elapsed if elapsed > 0 else float(restored)
+        logger.info(
+            f"✅ Восстановлено {restored} пользователей за {elapsed:.2f}с "
+            f"({rate:.0f} пользователей/с, ошибок: {failed})"
+        )
+        logger.info(
+            f"📇 Реестр: {len(self.registry)} пользователей, "
+            f"{self.registry.memory_bytes() / 1024:.0f} КБ"
+        )
+        return restored
+    
+    def _schedule_chat(
+        self,
+        chat_id: int,
+        timezone: str,
+        first_run_times: Optional[Dict[Tuple[str, int], datetime]] = None
+    ):
+        """
+        Ставит пользователя на расписание в текущем режиме без подробного логирования.
+        
+        Args:
+            first_run_times: Кэш времени первого запуска по (пояс, час) для массового восстановления
+        """
+        if self.mode == 'bucketed':
+            self._subscribe_to_bucket(chat_id, timezone)
+            return
+        
+        # КРИТИЧЕСКИ ВАЖНО: Удаляем ВСЕ старые задачи для этого пользователя
+        self._remove_chat_jobs(chat_id)
+        self._add_chat_jobs(chat_id, timezone, first_run_times)
+        self.registry.activate(chat_id, timezone)
+    
+    def _add_chat_jobs(
+        self,
+        chat_id: int,
+        timezone: str,
+        first_run_times: Optional[Dict[Tuple[str, int], datetime]] = None,
+        bulk: Optional[List[Job]] = None
+    ):
+        """
+        Создает 16 задач per_user-режима, не трогая реестр.
+        
+        Args:
+            bulk: Если задан, задачи не добавляются в планировщик, а дописываются
+                в этот список (для CoalesceCountingJobStore.add_jobs)
+        """
+        # Один вызываемый объект и общий словарь настроек пояса на все задачи пользователя
+        job_func = WaterReminderJob(chat_id, self.timezone_settings(timezone))
+        # Создаем задачи для каждого часа с 08:00 до 23:00 (всего 16 задач)
+        # Формат job_id: water_{chat_id}_8, water_{chat_id}_9, ..., water_{chat_id}_23
+        for hour in range(DEFAULT_START_HOUR, DEFAULT_END_HOUR + 1):
+            job_id = f"water_{chat_id}_{hour}"
             
-            logger.info(f"✅ Настроено {jobs_created} напоминаний для {chat_id} (каждый час с {start_hour:02d}:00 до {end_hour:02d}:00)")
+            trigger = self._get_cron_trigger(timezone, hour)
+            if first_run_times is not None:
+                next_run_time = first_run_times.get((timezone, hour))
+                if next_run_time is None:
+                    next_run_time = trigger.get_next_fire_time(None, self.now(trigger.timezone))
+                    first_run_times[(timezone, hour)] = next_run_time
+            else:
+                next_run_time = trigger.get_next_fire_time(None, self.now(trigger.timezone))
+            
+            if bulk is not None:
+                bulk.append(self._make_job(job_func, hour, trigger, job_id, next_run_time))
+                continue
+            self.scheduler.add_job(
+                job_func,
+                trigger,
+                args=_HOUR_ARGS[hour],
+                id=job_id,
+                # Общее имя: chat_id и час уже есть в job_id
+                name=WATER_JOB_NAME,
+                replace_existing=True,
+                next_run_time=next_run_time
+            )
+    
+    def _make_job(
+        self, func: WaterReminderJob, hour: int, trigger: CronTrigger, job_id: str, next_run_time: datetime
+    ) -> Job:
+        """
+        Задача с настройками по умолчанию - такая же, какую собрал бы scheduler.add_job.
+        
+        Job() проверяет сигнатуру func через inspect, и это большая часть стоимости
+        задачи. У всех задач напоминаний вызываемый объект - WaterReminderJob,
+        поэтому проверку проходит одна задача-образец, а остальные копируют ее атрибуты.
+        """
+        template = self._job_template
+        if template is None:
+            template = self._job_template = Job(
+                self.scheduler,
+                id=job_id,
+                func=func,
+                trigger=trigger,
+                executor='default',
+                args=_HOUR_ARGS[hour],
+                kwargs={},
+                name=WATER_JOB_NAME,
+                next_run_time=next_run_time,
+                **self.job_defaults
+            )
+            # add_job так же привязывает задачу к хранилищу: без этого job.modify() и job.remove() не сработают
+            template._jobstore_alias = 'default'
+            self._job_template_attrs = [(attr, getattr(template, attr)) for attr in _JOB_ATTRS]
+        job = Job.__new__(Job)
+        for attr, value in self._job_template_attrs:
+            setattr(job, attr, value)
+        job.id = job_id
+        job.func = func
+        job.args = _HOUR_ARGS[hour]
+        job.trigger = trigger
+        job.next_run_time = next_run_time
+        return job
+    
+    def timezone_settings(self, timezone: str) -> Mapping[str, Any]:
+        """Общие для часового пояса настройки задач (только для чтения)."""
+        settings = self._timezone_settings.get(timezone)
+        if settings is None:
+            settings = MappingProxyType({'timezone': timezone, 'is_active': True})
+            self._timezone_settings = {**self._timezone_settings, timezone: settings}
+        return settings
+    
+    def _get_cron_trigger(self, timezone: str, hour: int) -> CronTrigger:
+        """
+        Возвращает общий триггер для пары (часовой пояс, час) - см. app/scheduler/triggers.py.
+        Не нужно собирать 16 триггеров на пользователя, а следующий запуск
+        считается один раз на слот, а не на каждую задачу.
+        """
+        return hourly_trigger(timezone, hour)
+    
+    def unschedule_water_reminders(self, chat_id: int):
+        """
+        Снимает пользователя с расписания напоминаний о воде.
+        В режиме per_user удаляет его задачи, в режиме bucketed - убирает из индекса подписчиков.
+        """
+        if self.mode == 'bucketed':
+            self._unsubscribe_from_bucket(chat_id)
+        else:
+            self._remove_chat_jobs(chat_id)
+    
+    def has_water_reminders(self, chat_id: int) -> bool:
+        """Проверяет по реестру, запланированы ли напоминания для пользователя."""
+        return self.registry.is_active(chat_id)
+    
+    def _remove_chat_jobs(self, chat_id: int) -> int:
+        """
+        Снимает флаг пользователя в реестре и удаляет его задачи по выведенным id.
+        Стоимость пропорциональна числу задач пользователя, а не всех задач планировщика.
+        
+        Returns:
+            Количество удаленных задач
+        """
+        if self.registry.deactivate(chat_id) is None:
+            return 0
+        
+        removed_count = 0
+        for hour in range(DEFAULT_START_HOUR, DEFAULT_END_HOUR + 1):
+            try:
+                self.scheduler.remove_job(f"water_{chat_id}_{hour}")
+                removed_count += 1
+            except JobLookupError:
+                pass
+        
+        logger.info(f"🗑️ Удалено {removed_count} задач для {chat_id}")
+        return removed_count
+    
+    # =========================================================================
+    # BUCKETED-РЕЖИМ
+    # =========================================================================
+    
+    def _subscribe_to_bucket(self, chat_id: int, timezone: str):
+        """Добавляет пользователя в bucket часового пояса, создавая задачи пояса при необходимости."""
+        with self._index_lock:
+            old_timezone, was_active = self.registry.activate(chat_id, timezone)
+            if was_active and old_timezone == timezone:
+                return
+            if was_active:
+                self.planner.discard(chat_id, old_timezone)
+                if self.registry.active_count(old_timezone) == 0:
+                    self._remove_bucket_jobs(old_timezone)
+            self.planner.add(chat_id, timezone)
+            if self.registry.active_count(timezone) == 1:
+                self._add_bucket_jobs(timezone)
+    
+    def _unsubscribe_from_bucket(self, chat_id: int):
+        """Убирает пользователя из bucket; задачи пустого пояса удаляются."""
+        with self._index_lock:
+            timezone = self.registry.deactivate(chat_id)
+            if timezone is None:
+                return
+            self.planner.discard(chat_id, timezone)
+            if self.registry.active_count(timezone) == 0:
+                self._remove_bucket_jobs(timezone)
+        
+        logger.info(f"🗑️ Пользователь {chat_id} удален из bucket {timezone}")
+    
+    def _add_bucket_jobs(self, timezone: str):
+        """Создает 16 задач (08:00-23:00) для часового пояса."""
+        for hour in range(DEFAULT_START_HOUR, DEFAULT_END_HOUR + 1):
+            job_id = f"water_bucket_{timezone}_{hour}"
+            trigger = self._get_cron_trigger(timezone, hour)
+            self.scheduler.add_job(
+                WaterBucketJob(timezone, hour),
+                trigger,
+                id=job_id,
+                name=f"Water reminders for {timezone} at {hour:02d}:00",
+                replace_existing=True,
+                next_run_time=trigger.get_next_fire_time(None, self.now(trigger.timezone))
+            )
+        logger.info(f"📝 Созданы bucket-задачи для часового пояса {timezone}")
+    
+    def _remove_bucket_jobs(self, timezone: str):
+        """Удаляет задачи часового пояса, оставшегося без подписчиков."""
+        for hour in range(DEFAULT_START_HOUR, DEFAULT_END_HOUR + 1):
+            self.remove_job(f"water_bucket_{timezone}_{hour}")
+        self.planner.clear(timezone)
+    
+    def get_bucket_subscribers(self, timezone: str) -> Sequence[int]:
+        """Возвращает снимок активных подписчиков часового пояса (отсортированный array('q'))."""
+        return self.registry.active_chat_ids(timezone)
+    
+    def get_slot_recipients(self, timezone: str, hour: int) -> Sequence[int]:
+        """
+        Возвращает получателей слота: заранее собранный план, а если его нет
+        (бот только запустился или планировщик опоздал) - снимок из реестра.
+        """
+        chat_ids = self.planner.take(timezone, hour, self.clock())
+        if chat_ids is None:
+            logger.debug(f"🗓️ Нет готового плана для {timezone} {hour:02d}:00, собираем из реестра")
+            chat_ids = self.get_bucket_subscribers(timezone)
+        return chat_ids
+    
+    def dispatch_bucket(self, chat_ids: Sequence[int], timezone: str, hour: Optional[int] = None) -> int:
+        """
+        Рассылает напоминание подписчикам bucket из потока планировщика.
+        
+        Состояние пользователей читается одним запросом на DB_LOOKUP_CHUNK_SIZE
+        получателей (get_water_reminder_states), а не запросом на каждого.
+        Неактивные и удаленные пользователи снимаются с расписания. Если состояние
+        пачки прочитать не удалось (например, БД заблокирована), пачка пропускает
+        этот слот, но остается на расписании.
+        Если включен outbox, получатели записываются в него пачками по
+        DB_LOOKUP_CHUNK_SIZE; если запущен только конвейер доставки - ставятся
+        в его очередь; иначе рассылка идет пачками через fan_out_water_reminders.
+        
+        Returns:
+            Количество пользователей, которым отправлено (поставлено в очередь) напоминание
+        """
+        sync_fan_out = async_to_sync(self.fan_out_water_reminders)
+        use_outbox = outbox_relay.running
+        use_pipeline = delivery_pipeline.running
+        slot = slot_key(timezone, hour, self.clock())
+        settings = slot_settings(self.timezone_settings(timezone), slot, hour)
+        sent = 0
+        for i in range(0, len(chat_ids), DB_LOOKUP_CHUNK_SIZE):
+            chunk = chat_ids[i:i + DB_LOOKUP_CHUNK_SIZE]
+            try:
+                states = get_water_reminder_states(chunk)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Слот {slot}: пропущено {len(chunk)} получателей, состояние не прочитано ({e})")
+                continue
             
-            # ПРОВЕРКА: Считаем общее количество задач в планировщике
-            total_jobs = len(self.scheduler.get_jobs())
-            logger.info(f"📊 Всего задач в планировщике: {total_jobs}")
+            recipients = []
+            for chat_id in chunk:
+                state = states.get(chat_id)
+                if state is None or not state['is_active']:
+                    self.unschedule_water_reminders(chat_id)
+                else:
+                    recipients.append(chat_id)
             
-        except Exception as e:
-            logger.error(f"❌ Ошибка при планировании напоминаний о воде для {chat_id}: {e}", exc_info=True)
-            raise
+            if not recipients:
+                continue
+            if use_outbox:
+                sent += outbox_relay.submit((chat_id, slot, timezone) for chat_id in recipients)
+            elif use_pipeline:
+                sent += delivery_pipeline.submit_many(
+                    self.water_send_func,
+                    recipients,
+                    slot=slot,
+                    application=self.application,
+                    settings=settings
+                )
+            else:
+                sent += sync_fan_out(recipients, timezone, settings)
+        
+        if use_outbox:
+            outbox_relay.close_slot(slot)
+        elif use_pipeline:
+            delivery_pipeline.submit_many(self.water_send_func, (), slot=slot, close_slot=True)
+        return sent
+    
+    async def fan_out_water_reminders(
+        self, chat_ids: Sequence[int], timezone: str, settings: Optional[Mapping[str, Any]] = None
+    ) -> int:
+        """
+        Рассылает напоминание списку пользователей пачками по BUCKET_FANOUT_BATCH_SIZE.
+        
+        Args:
+            settings: Настройки для функции отправки (по умолчанию - общие настройки пояса)
+        
+        Returns:
+            Количество обработанных пользователей
+        """
+        if settings is None:
+            settings = self.timezone_settings(timezone)
+        for i in range(0, len(chat_ids), BUCKET_FANOUT_BATCH_SIZE):
+            batch = chat_ids[i:i + BUCKET_FANOUT_BATCH_SIZE]
+            await asyncio.gather(
+                *(self.water_send_func(application=self.application, chat_id=chat_id, settings=settings)
+                  for chat_id in batch),
+                return_exceptions=True
+            )
+        return len(chat_ids)
     
     def remove_job(self, job_id: str) -> bool:
         """Удаляет задачу по ID."""
@@ -239,29 +876,13 @@ class JobManager:
             logger.error(f"❌ Ошибка при удалении задачи {job_id}: {e}")
             return False
     
-    def _remove_jobs_by_prefix(self, prefix: str):
-        """Удаляет все задачи с заданным префиксом."""
-        jobs = self.scheduler.get_jobs()
-        removed_count = 0
-        
-        for job in jobs:
-            if job.id.startswith(prefix):
-                self.scheduler.remove_job(job.id)
-                removed_count += 1
-        
-        if removed_count > 0:
-            logger.info(f"🗑️ Удалено {removed_count} задач с префиксом '{prefix}'")
+    def job_counts(self) -> Tuple[int, int]:
+        """(всего задач, наступивших задач) без копирования списка задач - для метрик."""
+        return self.jobstore.job_count(), self.jobstore.due_count(self.clock())
     
     def get_all_jobs(self) -> List[Any]:
         """Возвращает список всех запланированных задач."""
         return self.scheduler.get_jobs()
-    
-    def print_jobs(self):
-        """Выводит информацию о всех задачах (для отладки)."""
-        jobs = self.get_all_jobs()
-        logger.info(f"📋 Всего запланированных задач: {len(jobs)}")
-        for job in jobs:
-            logger.info(f"  - {job.id}: {job.name}, next run: {job.next_run_time}")
 
 # Глобальный экземпляр job manager
 job_manager = JobManager()
@@ -0,0 +1,128 @@
+"""
+MemoryJobStore с учетом объединенных (coalesce) запусков.
+
+С coalesce=True APScheduler выполняет задачу, пропустившую несколько
+запусков (например, после паузы планировщика или долгой блокировки),
+один раз и молча отбрасывает остальные запуски - событий о них нет.
+Хранилище считает такие запуски в момент выборки наступивших задач.
+
+Для экспорта метрик хранилище отдает число задач и число наступивших
+задач без копирования списка (get_jobs под блокировкой планировщика
+собирает все задачи, что слишком дорого для опроса раз в несколько секунд).
+Метрики читаются из потока HTTP-сервера, поэтому хранилище держит свою
+блокировку: ее берут все изменения списка задач и чтения для метрик.
+
+MemoryJobStore.add_job вставляет задачу в середину отсортированного списка,
+то есть сдвигает весь хвост: восстановление N задач по одной стоит O(N^2).
+add_jobs добавляет пачку задач одной сортировкой.
+"""
+import threading
+from bisect import bisect_right
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from apscheduler.job import Job
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.util import datetime_to_utc_timestamp
+
+
+def _sort_key(item: Tuple[Job, Optional[float]]) -> Tuple[float, str]:
+    """Порядок MemoryJobStore: по времени запуска (приостановленные в конце), затем по id."""
+    job, timestamp = item
+    return (float('inf') if timestamp is None else timestamp, job.id)
+
+
+class CoalesceCountingJobStore(MemoryJobStore):
+    """MemoryJobStore, сообщающий о запусках, которые будут объединены в один."""
+
+    def __init__(self, on_coalesced: Callable[[Job, int], None]):
+        super().__init__()
+        self.on_coalesced = on_coalesced
+        self._lock = threading.RLock()
+
+    def add_job(self, job: Job):
+        with self._lock:
+            super().add_job(job)
+
+    def add_jobs(self, jobs: Iterable[Job]) -> int:
+        """
+        Массово добавляет задачи (восстановление при запуске): новые задачи
+        сливаются с уже существующими и список сортируется один раз.
+        Задача с уже существующим id заменяет прежнюю.
+
+        Returns:
+            Количество добавленных задач
+        """
+        # Задачи одного слота делят объект next_run_time - timestamp считается один раз.
+        # Ключ - id объекта: хэш aware datetime вызывает utcoffset и стоит как сам расчет
+        timestamps: Dict[int, Optional[float]] = {}
+        added = {}
+        for job in jobs:
+            run_time = job.next_run_time
+            timestamp = timestamps.get(id(run_time))
+            if timestamp is None:
+                timestamp = timestamps[id(run_time)] = datetime_to_utc_timestamp(run_time)
+            added[job.id] = (job, timestamp)
+        with self._lock:
+            merged = [item for item in self._jobs if item[0].id not in added]
+            merged.extend(added.values())
+            merged.sort(key=_sort_key)
+            self._jobs = merged
+            self._jobs_index = {item[0].id: item for item in merged}
+        return len(added)
+
+    def update_job(self, job: Job):
+        with self._lock:
+            super().update_job(job)
+
+    def remove_job(self, job_id: str):
+        with self._lock:
+            super().remove_job(job_id)
+
+    def remove_all_jobs(self):
+        with self._lock:
+            super().remove_all_jobs()
+
+    def get_due_jobs(self, now: datetime) -> List[Job]:
+        with self._lock:
+            due = super().get_due_jobs(now)
+        # Задачи одного пояса и часа делят триггер и время запуска -
+        # число пропущенных запусков считается один раз на пару
+        skipped_by_key: Dict[Tuple[int, datetime], int] = {}
+        for job in due:
+            if not job.coalesce:
+                continue
+            key = (id(job.trigger), job.next_run_time)
+            skipped = skipped_by_key.get(key)
+            if skipped is None:
+                skipped = self._count_skipped(job, now)
+                skipped_by_key[key] = skipped
+            if skipped:
+                self.on_coalesced(job, skipped)
+        return due
+
+    def job_count(self) -> int:
+        """Число задач в хранилище."""
+        with self._lock:
+            return len(self._jobs)
+
+    def due_count(self, now: datetime) -> int:
+        """Число задач, чей запуск уже наступил к now (бинарный поиск по отсортированному списку)."""
+        now_timestamp = datetime_to_utc_timestamp(now)
+        with self._lock:
+            jobs = self._jobs
+            # Приостановленные задачи (timestamp None) стоят в конце списка
+            paused_from = len(jobs)
+            while paused_from and jobs[paused_from - 1][1] is None:
+                paused_from -= 1
+            return bisect_right(jobs, now_timestamp, hi=paused_from, key=lambda item: item[1])
+
+    @staticmethod
+    def _count_skipped(job: Job, now: datetime) -> int:
+        """Сколько запусков после next_run_time тоже наступило к now."""
+        skipped = 0
+        run_time = job.trigger.get_next_fire_time(job.next_run_time, now)
+        while run_time is not None and run_time <= now:
+            skipped += 1
+            run_time = job.trigger.get_next_fire_time(run_time, now)
+        return skipped
@@ -0,0 +1,118 @@
+"""
+Предварительный расчет получателей для слотов bucketed-режима.
+
+За SLOT_PLAN_LEAD_MINUTES до очередного часа (08:00-23:00 по местному времени)
+планировщик собирает из реестра отсортированный array('q') активных chat_id
+для каждого часового пояса. Остановка и возобновление до начала слота
+правят готовый план точечно (бинарный поиск + вставка/удаление), поэтому
+в момент срабатывания bucket-задаче остается только отдать готовый список.
+"""
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import pytz
+
+from ..config import DEFAULT_START_HOUR, DEFAULT_END_HOUR, SLOT_PLAN_LEAD_MINUTES
+from .registry import UserRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class SlotPlanner:
+    """Заранее собранные списки получателей ближайшего слота по часовым поясам."""
+
+    def __init__(self, registry: UserRegistry, lead_minutes: int = SLOT_PLAN_LEAD_MINUTES):
+        self.registry = registry
+        self.lead = timedelta(minutes=lead_minutes)
+        # timezone -> (время слота, отсортированные chat_id)
+        self._plans: Dict[str, Tuple[datetime, array]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def next_slot(timezone: str, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Начало следующего часа в часовом поясе или None, если он вне 08:00-23:00."""
+        tz = pytz.timezone(timezone)
+        local_now = (now or datetime.now(pytz.utc)).astimezone(tz)
+        slot = tz.normalize(local_now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1))
+        if not DEFAULT_START_HOUR <= slot.hour <= DEFAULT_END_HOUR:
+            return None
+        return slot
+
+    def plan_upcoming(self, now: Optional[datetime] = None) -> int:
+        """
+        Собирает планы для поясов, чей следующий слот наступает в пределах lead.
+        Уже собранный план на тот же слот не пересобирается.
+
+        Returns:
+            Количество собранных планов
+        """
+        now = now or datetime.now(pytz.utc)
+        built = 0
+        for timezone in self.registry.active_timezones():
+            slot = self.next_slot(timezone, now)
+            if slot is None or slot - now > self.lead:
+                continue
+            with self._lock:
+                plan = self._plans.get(timezone)
+                if plan is not None and plan[0] == slot:
+                    continue
+                # Снимок берется под блокировкой, чтобы правки не потерялись
+                self._plans[timezone] = (slot, self.registry.active_chat_ids(timezone))
+            built += 1
+
+        if built:
+            logger.debug(f"🗓️ Собрано планов слотов: {built}")
+        return built
+
+    def take(self, timezone: str, hour: int, now: Optional[datetime] = None) -> Optional[array]:
+        """
+        Забирает план слота часового пояса.
+
+        Returns:
+            Отсортированный array('q') получателей или None, если плана на этот час нет
+        """
+        now = now or datetime.now(pytz.utc)
+        with self._lock:
+            plan = self._plans.get(timezone)
+            if plan is None:
+                return None
+            slot, chat_ids = plan
+            # План годится только для своего часа и пока слот не устарел
+            if slot.hour != hour or not slot - self.lead <= now < slot + timedelta(hours=1):
+                return None
+            del self._plans[timezone]
+            return chat_ids
+
+    def add(self, chat_id: int, timezone: str):
+        """Добавляет пользователя в план его часового пояса, если план уже собран."""
+        with self._lock:
+            plan = self._plans.get(timezone)
+            if plan is None:
+                return
+            chat_ids = plan[1]
+            pos = bisect_left(chat_ids, chat_id)
+            if pos == len(chat_ids) or chat_ids[pos] != chat_id:
+                chat_ids.insert(pos, chat_id)
+
+    def discard(self, chat_id: int, timezone: str):
+        """Убирает пользователя из плана его часового пояса."""
+        with self._lock:
+            plan = self._plans.get(timezone)
+            if plan is None:
+                return
+            chat_ids = plan[1]
+            pos = bisect_left(chat_ids, chat_id)
+            if pos < len(chat_ids) and chat_ids[pos] == chat_id:
+                del chat_ids[pos]
+
+    def clear(self, timezone: Optional[str] = None):
+        """Сбрасывает планы (все или одного часового пояса)."""
+        with self._lock:
+            if timezone is None:
+                self._plans.clear()
+            else:
+                self._plans.pop(timezone, None)
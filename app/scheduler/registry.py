@@ -0,0 +1,204 @@
+"""
+Компактный реестр подписчиков в памяти.
+
+Вместо словарей на каждого пользователя реестр хранит параллельные колонки,
+отсортированные по chat_id:
+- chat_id: array('q') - 8 байт
+- id часового пояса: array('H') - 2 байта (имена поясов хранятся один раз)
+- флаг активности: bytearray - 1 байт
+
+Кроме колонок реестр ведет индекс по часовым поясам: для каждого пояса
+отсортированный array('q') его активных chat_id (еще 8 байт на активного
+пользователя). Индекс обновляется в activate/deactivate, поэтому выборка
+получателей слота стоит O(пользователей пояса), а не O(всех пользователей).
+
+Итого около 19 байт на пользователя, поэтому один узел держит 1M+ подписчиков.
+Поиск пользователя - бинарный поиск по колонке chat_id. Остановленные
+пользователи остаются в реестре со снятым флагом, возобновление его ставит.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class UserRegistry:
+    """Реестр подписчиков: chat_id, часовой пояс и флаг активности в параллельных массивах."""
+    
+    def __init__(self):
+        self._chat_ids = array('q')
+        self._tz_ids = array('H')
+        self._active = bytearray()
+        
+        # Интернированные имена часовых поясов: id -> имя и имя -> id
+        self._timezones: List[str] = []
+        self._tz_index: Dict[str, int] = {}
+        # Индекс по поясам: id часового пояса -> отсортированные активные chat_id
+        self._members: Dict[int, array] = {}
+        
+        self._lock = threading.RLock()
+    
+    def __len__(self) -> int:
+        return len(self._chat_ids)
+    
+    def _find(self, chat_id: int) -> int:
+        """Возвращает позицию chat_id в колонках или -1."""
+        pos = bisect_left(self._chat_ids, chat_id)
+        if pos < len(self._chat_ids) and self._chat_ids[pos] == chat_id:
+            return pos
+        return -1
+    
+    def _add_member(self, tz_id: int, chat_id: int):
+        members = self._members.get(tz_id)
+        if members is None:
+            members = self._members[tz_id] = array('q')
+        members.insert(bisect_left(members, chat_id), chat_id)
+    
+    def _remove_member(self, tz_id: int, chat_id: int):
+        members = self._members[tz_id]
+        del members[bisect_left(members, chat_id)]
+    
+    def _intern_timezone(self, timezone: str) -> int:
+        """Возвращает id часового пояса, регистрируя новое имя при необходимости."""
+        tz_id = self._tz_index.get(timezone)
+        if tz_id is None:
+            tz_id = len(self._timezones)
+            self._timezones.append(timezone)
+            self._tz_index[timezone] = tz_id
+        return tz_id
+    
+    def activate(self, chat_id: int, timezone: str) -> Tuple[Optional[str], bool]:
+        """
+        Добавляет пользователя или делает его активным в заданном часовом поясе.
+        
+        Returns:
+            (предыдущий часовой пояс или None, был ли пользователь активен)
+        """
+        with self._lock:
+            tz_id = self._intern_timezone(timezone)
+            pos = bisect_left(self._chat_ids, chat_id)
+            if pos < len(self._chat_ids) and self._chat_ids[pos] == chat_id:
+                old_tz_id = self._tz_ids[pos]
+                was_active = bool(self._active[pos])
+                if was_active:
+                    self._remove_member(old_tz_id, chat_id)
+                self._tz_ids[pos] = tz_id
+                self._active[pos] = 1
+                previous = self._timezones[old_tz_id]
+            else:
+                self._chat_ids.insert(pos, chat_id)
+                self._tz_ids.insert(pos, tz_id)
+                self._active.insert(pos, 1)
+                previous, was_active = None, False
+            self._add_member(tz_id, chat_id)
+            return previous, was_active
+    
+    def activate_many(self, entries: Iterable[Tuple[int, str]]) -> int:
+        """
+        Массово активирует пользователей (восстановление при запуске).
+        
+        В пустой реестр записи дописываются в конец колонок, а затем колонки
+        один раз сортируются по chat_id: вставка по одному в середину массива
+        стоила бы сдвига всей колонки на каждого пользователя. Строки приходят
+        упорядоченными по (timezone, chat_id), и сортировка сливает готовые серии.
+        В непустой реестр записи добавляются через activate().
+        
+        Returns:
+            Количество обработанных записей
+        """
+        with self._lock:
+            if self._chat_ids:
+                count = 0
+                for chat_id, timezone in entries:
+                    self.activate(chat_id, timezone)
+                    count += 1
+                return count
+            
+            chat_ids = array('q')
+            tz_ids = array('H')
+            for chat_id, timezone in entries:
+                chat_ids.append(chat_id)
+                tz_ids.append(self._intern_timezone(timezone))
+            count = len(chat_ids)
+            
+            if any(chat_ids[i] >= chat_ids[i + 1] for i in range(count - 1)):
+                order = sorted(range(count), key=chat_ids.__getitem__)
+                # При повторе chat_id побеждает последняя запись
+                order = [
+                    pos for i, pos in enumerate(order)
+                    if i + 1 == count or chat_ids[order[i + 1]] != chat_ids[pos]
+                ]
+                chat_ids = array('q', [chat_ids[pos] for pos in order])
+                tz_ids = array('H', [tz_ids[pos] for pos in order])
+            
+            self._chat_ids = chat_ids
+            self._tz_ids = tz_ids
+            self._active = bytearray(b'\x01') * len(chat_ids)
+            # chat_ids уже отсортированы, поэтому индекс поясов собирается дозаписью
+            self._members = {}
+            for chat_id, tz_id in zip(chat_ids, tz_ids):
+                members = self._members.get(tz_id)
+                if members is None:
+                    members = self._members[tz_id] = array('q')
+                members.append(chat_id)
+            return count
+    
+    def deactivate(self, chat_id: int) -> Optional[str]:
+        """
+        Снимает флаг активности пользователя.
+        
+        Returns:
+            Часовой пояс пользователя, если он был активен, иначе None
+        """
+        with self._lock:
+            pos = self._find(chat_id)
+            if pos < 0 or not self._active[pos]:
+                return None
+            self._active[pos] = 0
+            tz_id = self._tz_ids[pos]
+            self._remove_member(tz_id, chat_id)
+            return self._timezones[tz_id]
+    
+    def is_active(self, chat_id: int) -> bool:
+        """Проверяет, активен ли пользователь."""
+        with self._lock:
+            pos = self._find(chat_id)
+            return pos >= 0 and bool(self._active[pos])
+    
+    def get_timezone(self, chat_id: int) -> Optional[str]:
+        """Возвращает часовой пояс пользователя или None, если его нет в реестре."""
+        with self._lock:
+            pos = self._find(chat_id)
+            return self._timezones[self._tz_ids[pos]] if pos >= 0 else None
+    
+    def active_count(self, timezone: Optional[str] = None) -> int:
+        """Количество активных пользователей (всего или в часовом поясе)."""
+        with self._lock:
+            if timezone is None:
+                return sum(len(members) for members in self._members.values())
+            members = self._members.get(self._tz_index.get(timezone))
+            return len(members) if members is not None else 0
+    
+    def active_timezones(self) -> List[str]:
+        """Часовые пояса, в которых есть активные пользователи."""
+        with self._lock:
+            return [self._timezones[tz_id] for tz_id, members in self._members.items() if members]
+    
+    def active_chat_ids(self, timezone: str) -> array:
+        """
+        Возвращает отсортированный array('q') активных chat_id часового пояса.
+        Копия берется из индекса поясов: O(пользователей пояса).
+        """
+        with self._lock:
+            members = self._members.get(self._tz_index.get(timezone))
+            return members[:] if members is not None else array('q')
+    
+    def memory_bytes(self) -> int:
+        """Размер колонок реестра в байтах (без интернированных имен поясов)."""
+        with self._lock:
+            return (
+                self._chat_ids.itemsize * len(self._chat_ids) +
+                self._tz_ids.itemsize * len(self._tz_ids) +
+                len(self._active) +
+                sum(members.itemsize * len(members) for members in self._members.values())
+            )
@@ -0,0 +1,108 @@
+"""
+Общие (интернированные) cron-триггеры напоминаний с запоминанием следующего запуска.
+
+Все задачи пары (часовой пояс, час) срабатывают в одно и то же время, но
+APScheduler после каждого запуска вызывает get_next_fire_time для каждой
+задачи отдельно - в per_user-режиме это одинаковый календарный расчет
+16×N раз в сутки. Триггер один на пару (hourly_trigger), а результат расчета
+запоминается вместе с окном, в котором он верен.
+
+CronTrigger возвращает первое время запуска не раньше start_date (start_date
+выводится из previous_fire_time и now). Если для start_date = s расчет дал t,
+то для любого s' из [s, t) ответ тоже t: между s и t запусков нет. Поэтому
+триггер хранит одно окно (s, t), и все задачи слота, как и все новые
+пользователи до ближайшего запуска, получают готовый (и общий) datetime.
+Сам момент t в окно не входит: если t попадает в час, пропущенный переходом
+на летнее время, CronTrigger сравнивает местное время, а не момент, и для
+s' = t отвечает уже следующими сутками.
+
+В дни перехода на летнее время CronTrigger иногда пропускает сутки (t - s
+больше 25 часов), и для s' внутри такого окна ответ отличается. Такие окна
+не запоминаются - триггер ведет себя в точности как CronTrigger.
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import pytz
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.util import datetime_utc_add
+
+from ..utils.metrics import Counter
+
+_MICROSECOND = timedelta(microseconds=1)
+# Самый длинный промежуток между запусками ежедневного триггера (сутки перехода на зимнее время)
+_MAX_WINDOW = timedelta(hours=25)
+
+# Расчеты следующего запуска: взятые из окна и выполненные заново
+next_fire_hits = Counter()
+next_fire_misses = Counter()
+
+
+class MemoCronTrigger(CronTrigger):
+    """CronTrigger, запоминающий последний расчет следующего запуска."""
+
+    __slots__ = ('_window', 'max_window')
+
+    def __init__(self, *args, max_window: timedelta = _MAX_WINDOW, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Окна длиннее max_window не запоминаются (см. описание модуля)
+        self.max_window = max_window
+        # (start_date, результат) последнего расчета; кортеж заменяется целиком
+        self._window: Optional[Tuple[datetime, datetime]] = None
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._window = None
+        self.max_window = _MAX_WINDOW
+
+    def _start_date(self, previous_fire_time: Optional[datetime], now: datetime) -> datetime:
+        """Нижняя граница поиска - так же, как в CronTrigger.get_next_fire_time."""
+        if previous_fire_time:
+            start_date = min(
+                now.astimezone(pytz.utc),
+                datetime_utc_add(previous_fire_time, _MICROSECOND).astimezone(pytz.utc),
+            ).astimezone(self.timezone)
+            if start_date == previous_fire_time:
+                start_date = datetime_utc_add(start_date, _MICROSECOND)
+            return start_date
+        if self.start_date:
+            return max(now.astimezone(pytz.utc), self.start_date.astimezone(pytz.utc)).astimezone(self.timezone)
+        return now
+
+    def get_next_fire_time(self, previous_fire_time: Optional[datetime], now: datetime) -> Optional[datetime]:
+        if self.jitter:
+            return super().get_next_fire_time(previous_fire_time, now)
+
+        start_date = self._start_date(previous_fire_time, now)
+        window = self._window
+        if window is not None and window[0] <= start_date < window[1]:
+            next_fire_hits.inc()
+            return window[1]
+
+        next_fire_misses.inc()
+        next_fire = super().get_next_fire_time(previous_fire_time, now)
+        if next_fire is not None and next_fire - start_date <= self.max_window:
+            self._window = (start_date, next_fire)
+        return next_fire
+
+
+_triggers: Dict[Tuple[str, int], MemoCronTrigger] = {}
+_lock = threading.Lock()
+
+
+def hourly_trigger(timezone: str, hour: int) -> MemoCronTrigger:
+    """
+    Возвращает общий триггер «каждый день в hour:00» для часового пояса.
+    Триггер не хранит состояния задачи, поэтому один экземпляр обслуживает
+    все задачи пары (пояс, час) в обоих режимах планировщика.
+    """
+    key = (timezone, hour)
+    trigger = _triggers.get(key)
+    if trigger is None:
+        with _lock:
+            trigger = _triggers.get(key)
+            if trigger is None:
+                trigger = MemoCronTrigger(hour=hour, minute=0, timezone=pytz.timezone(timezone))
+                _triggers[key] = trigger
+    return trigger
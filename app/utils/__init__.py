@@ -1,7 +1,14 @@
 """
 Утилиты для бота
 """
-from .logger import setup_logger, logger
+from .logger import setup_logger, stop_logging, logger, summary_logger
+from .metrics import Histogram, SchedulerMetrics, scheduler_metrics, delivery_metrics, db_timed
+from .metrics_server import MetricsServer, metrics_server, render_metrics
+from .profiling import Profiler, profiler, install_signal_handler
 
-__all__ = ['setup_logger', 'logger']
+__all__ = [
+    'setup_logger', 'stop_logging', 'logger', 'summary_logger', 'Histogram', 'SchedulerMetrics', 'scheduler_metrics',
+    'delivery_metrics', 'db_timed', 'MetricsServer', 'metrics_server', 'render_metrics',
+    'Profiler', 'profiler', 'install_signal_handler'
+]
 
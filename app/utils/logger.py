@@ -1,34 +1,58 @@
 """
 Централизованная настройка логирования для всего приложения.
+
+Файл логов ротируется по размеру (RotatingFileHandler). В асинхронном режиме
+логгер получает только QueueHandler: запись кладется в очередь, а форматирование
+вывода и запись на диск и в консоль выполняет фоновый поток QueueListener,
+поэтому поток планировщика и event loop бота не ждут диск.
 """
+import atexit
 import logging
+import queue
 import sys
 import os
-from typing import Optional
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List, Optional
+
+# Фоновые потоки асинхронного логирования (останавливаются в stop_logging)
+_listeners: List[QueueListener] = []
+
 
-def setup_logger(name: Optional[str] = None, log_level: str = 'INFO', log_file: str = 'bot_log.txt') -> logging.Logger:
+def setup_logger(
+    name: Optional[str] = None,
+    log_level: str = 'INFO',
+    log_file: str = 'bot_log.txt',
+    async_mode: bool = False,
+    max_bytes: int = 0,
+    backup_count: int = 0
+) -> logging.Logger:
     """
     Настраивает и возвращает logger с консольным и файловым выводом.
-    
+
     Args:
         name: Имя логгера. Если None, используется root logger.
         log_level: Уровень логирования (DEBUG, INFO, WARNING, ERROR, CRITICAL)
         log_file: Путь к файлу логов
-    
+        async_mode: Писать через QueueHandler/QueueListener в фоновом потоке
+        max_bytes: Размер файла логов для ротации (0 - без ротации)
+        backup_count: Сколько ротированных файлов хранить
+
     Returns:
         Настроенный logger
     """
     logger = logging.getLogger(name)
-    
+
     # Если логгер уже настроен, не настраиваем заново
     if logger.handlers:
         return logger
-    
-    logger.setLevel(getattr(logging, log_level.upper()))
-    
+
+    level = getattr(logging, log_level.upper())
+    logger.setLevel(level)
+    handlers: List[logging.Handler] = []
+
     # Настройка формата
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    
+
     # Консольный хендлер с правильной кодировкой для Windows
     if os.name == 'nt':  # Windows
         import io
@@ -37,23 +61,48 @@ def setup_logger(name: Optional[str] = None, log_level: str = 'INFO', log_file:
         )
     else:
         console_handler = logging.StreamHandler()
-    
-    console_handler.setLevel(getattr(logging, log_level.upper()))
+
+    console_handler.setLevel(level)
     console_handler.setFormatter(formatter)
-    
-    # Файловый хендлер
+
+    # Файловый хендлер с ротацией по размеру
     try:
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        file_handler.setLevel(getattr(logging, log_level.upper()))
+        file_handler = RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        file_handler.setLevel(level)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
     except Exception as e:
         print(f"⚠️ Не удалось создать файл логов: {e}")
-    
-    logger.addHandler(console_handler)
-    
+
+    handlers.append(console_handler)
+
+    if async_mode:
+        # Очередь без ограничения: вызывающий поток никогда не блокируется на логировании
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+        logger.addHandler(QueueHandler(log_queue))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
     return logger
 
-# Создаем базовый логгер для модуля
-logger = setup_logger(__name__)
 
+def stop_logging():
+    """Дописывает записи из очередей и останавливает фоновые потоки логирования."""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+atexit.register(stop_logging)
+
+# Логгер модуля; обработчики настраиваются на логгере пакета app в bot.py
+logger = logging.getLogger(__name__)
+
+# Сводки (срабатывания за интервал, доставка слотов) пишутся с LOG_LEVEL,
+# даже когда модули app.* приглушены LOG_MODULES_LEVEL
+summary_logger = logging.getLogger('app.summary')
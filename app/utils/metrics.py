@@ -0,0 +1,320 @@
+"""
+Метрики бота: задержка напоминаний (главный SLO), доставка и запросы к БД.
+
+Для каждого срабатывания задачи напоминания фиксируется, насколько позже
+запланированного времени (scheduled_run_time) задача стартовала и
+завершилась, а для каждой отправки - насколько позже начала слота сообщение
+ушло в Telegram. Значения складываются в гистограммы с фиксированными
+границами: общую, по часовым поясам и по последним слотам. Отдельно
+считаются пропущенные (misfire) и объединенные (coalesce) запуски.
+
+Запись в гистограмму - bisect по границам и инкремент под короткой
+блокировкой, без выделения памяти на наблюдение; счетчики устроены так же.
+Экспорт в формате Prometheus - app/utils/metrics_server.py.
+"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import pytz
+
+# Границы корзин задержки (секунды): от «вовремя» до «на час позже»
+LAG_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Границы корзин длительности отправки в Telegram (секунды)
+SEND_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Границы корзин длительности запросов к БД (секунды)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+
+# Сколько последних слотов хранить в гистограммах по слотам
+_SLOT_HISTORY_SIZE = 100
+
+
+class Counter:
+    """Монотонный счетчик с короткой блокировкой на инкремент."""
+
+    __slots__ = ('_value', '_lock')
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин (как histogram в Prometheus)."""
+
+    __slots__ = ('bounds', '_counts', '_sum', '_lock')
+
+    def __init__(self, bounds: Sequence[float] = LAG_BUCKETS):
+        self.bounds = tuple(bounds)
+        # Последняя корзина - все, что больше верхней границы (+Inf)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def snapshot(self) -> Tuple[Tuple[int, ...], float]:
+        """Копия (счетчики по корзинам, сумма)."""
+        with self._lock:
+            return tuple(self._counts), self._sum
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля: верхняя граница корзины, в которую он попал."""
+        counts, _ = self.snapshot()
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def as_dict(self) -> Dict[str, Any]:
+        counts, total_sum = self.snapshot()
+        total = sum(counts)
+        return {
+            'count': total,
+            'mean': round(total_sum / total, 3) if total else 0.0,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+
+class LabeledHistograms:
+    """Гистограммы с одной меткой (например, имя функции БД), создаются по требованию."""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, label: str) -> Histogram:
+        histogram = self._histograms.get(label)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(label, Histogram(self.bounds))
+        return histogram
+
+    def items(self):
+        with self._lock:
+            return sorted(self._histograms.items())
+
+
+class LagTracker:
+    """Гистограммы одной задержки: общая, по часовым поясам и по последним слотам."""
+
+    def __init__(self, bounds: Sequence[float] = LAG_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.total = Histogram(self.bounds)
+        self.by_timezone: Dict[str, Histogram] = {}
+        self.by_slot: "OrderedDict[str, Histogram]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, slot: str, timezone: str, seconds: float):
+        seconds = max(seconds, 0.0)
+        with self._lock:
+            tz_hist = self.by_timezone.get(timezone)
+            if tz_hist is None:
+                tz_hist = self.by_timezone[timezone] = Histogram(self.bounds)
+            slot_hist = self.by_slot.get(slot)
+            if slot_hist is None:
+                slot_hist = self.by_slot[slot] = Histogram(self.bounds)
+                while len(self.by_slot) > _SLOT_HISTORY_SIZE:
+                    self.by_slot.popitem(last=False)
+        self.total.observe(seconds)
+        tz_hist.observe(seconds)
+        slot_hist.observe(seconds)
+
+    def timezones_snapshot(self) -> List[Tuple[str, Histogram]]:
+        """Гистограммы по часовым поясам, отсортированные по имени пояса."""
+        with self._lock:
+            return sorted(self.by_timezone.items())
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            by_slot = list(self.by_slot.items())
+        return {
+            'total': self.total.as_dict(),
+            'by_timezone': {tz: hist.as_dict() for tz, hist in self.timezones_snapshot()},
+            'by_slot': {slot: hist.as_dict() for slot, hist in by_slot},
+        }
+
+
+class SchedulerMetrics:
+    """
+    Задержки и аномалии срабатываний задач напоминаний.
+
+    - start_lag: старт задачи относительно scheduled_run_time
+    - job_lag: завершение задачи (слот поставлен в очередь доставки)
+    - delivery_lag: отправка сообщения относительно начала слота
+    - misfires / coalesced: пропущенные и объединенные запуски по часовым поясам
+    """
+
+    def __init__(self):
+        self.start_lag = LagTracker()
+        self.job_lag = LagTracker()
+        self.delivery_lag = LagTracker()
+        self.misfires: Dict[str, int] = {}
+        self.coalesced: Dict[str, int] = {}
+        # Выполненные задачи напоминаний (для периодической сводки в лог)
+        self.jobs_executed = Counter()
+        self._lock = threading.Lock()
+        # (пояс, время запуска) -> ключ слота; за сутки набирается не больше 16 на пояс
+        self._slot_keys: Dict[Tuple[str, datetime], str] = {}
+
+    def slot_for(self, timezone: str, scheduled: datetime) -> str:
+        """Ключ слота (как slot_key планировщика) для запланированного времени запуска."""
+        key = (timezone, scheduled)
+        slot = self._slot_keys.get(key)
+        if slot is None:
+            local = scheduled.astimezone(pytz.timezone(timezone))
+            slot = f"{local:%Y-%m-%d %H}:00 {timezone}"
+            if len(self._slot_keys) >= 4096:
+                self._slot_keys.clear()
+            self._slot_keys[key] = slot
+        return slot
+
+    def job_started(self, timezone: str, scheduled: datetime, now: datetime):
+        self.start_lag.observe(self.slot_for(timezone, scheduled), timezone, (now - scheduled).total_seconds())
+
+    def job_finished(self, timezone: str, scheduled: datetime, now: datetime):
+        self.jobs_executed.inc()
+        self.job_lag.observe(self.slot_for(timezone, scheduled), timezone, (now - scheduled).total_seconds())
+
+    def message_sent(self, slot: str, timezone: str, scheduled_at: float, sent_at: float):
+        """Отправка напоминания; scheduled_at и sent_at - Unix-время."""
+        self.delivery_lag.observe(slot, timezone, sent_at - scheduled_at)
+
+    def misfire(self, timezone: str, count: int = 1):
+        with self._lock:
+            self.misfires[timezone] = self.misfires.get(timezone, 0) + count
+
+    def coalesce(self, timezone: str, count: int):
+        with self._lock:
+            self.coalesced[timezone] = self.coalesced.get(timezone, 0) + count
+
+    def anomalies_snapshot(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Копии счетчиков (пропущенные, объединенные запуски) по часовым поясам."""
+        with self._lock:
+            return dict(self.misfires), dict(self.coalesced)
+
+    def snapshot(self) -> Dict[str, Any]:
+        misfires, coalesced = self.anomalies_snapshot()
+        return {
+            'start_lag_seconds': self.start_lag.as_dict(),
+            'job_lag_seconds': self.job_lag.as_dict(),
+            'delivery_lag_seconds': self.delivery_lag.as_dict(),
+            'misfires': misfires,
+            'coalesced': coalesced,
+        }
+
+    def summary(self) -> Optional[str]:
+        """Короткая строка для лога или None, если срабатываний еще не было."""
+        start, delivery = self.start_lag.total, self.delivery_lag.total
+        if not start.count and not delivery.count:
+            return None
+        misfires, coalesced = (sum(counts.values()) for counts in self.anomalies_snapshot())
+        return (
+            f"старт задач p50≤{start.quantile(0.5)}с p99≤{start.quantile(0.99)}с ({start.count}), "
+            f"отправка p50≤{delivery.quantile(0.5)}с p99≤{delivery.quantile(0.99)}с ({delivery.count}), "
+            f"пропущено {misfires}, объединено {coalesced}"
+        )
+
+
+class DeliveryMetrics:
+    """Счетчики и длительность запросов sendMessage (замеряются в TelegramRateLimiter)."""
+
+    def __init__(self):
+        self.sent = Counter()
+        self.retry_after = Counter()
+        self.forbidden = Counter()
+        self.errors = Counter()
+        # Напоминания, не отправленные без ошибки (снят с расписания, час вне диапазона)
+        self.skipped = Counter()
+        self.send_seconds = Histogram(SEND_BUCKETS)
+
+
+class ActivitySummary:
+    """
+    Сводка срабатываний за интервал вместо строки лога на каждое срабатывание:
+    разность счетчиков scheduler_metrics и delivery_metrics с прошлого вызова.
+    """
+
+    def __init__(self):
+        self._last: Dict[str, int] = {}
+        self._last_at = time.monotonic()
+
+    @staticmethod
+    def _totals() -> Dict[str, int]:
+        return {
+            'jobs': scheduler_metrics.jobs_executed.value,
+            'sent': delivery_metrics.sent.value,
+            'skipped': delivery_metrics.skipped.value,
+            'retry_after': delivery_metrics.retry_after.value,
+            'forbidden': delivery_metrics.forbidden.value,
+            'errors': delivery_metrics.errors.value,
+        }
+
+    def take(self) -> Optional[str]:
+        """Строка для лога за время с прошлого вызова или None, если ничего не происходило."""
+        totals, now = self._totals(), time.monotonic()
+        delta = {key: value - self._last.get(key, 0) for key, value in totals.items()}
+        elapsed = now - self._last_at
+        self._last, self._last_at = totals, now
+        if not any(delta.values()):
+            return None
+        return (
+            f"за {elapsed / 60:.0f} мин: задач {delta['jobs']}, отправлено {delta['sent']}, "
+            f"пропущено {delta['skipped']}, 429 {delta['retry_after']}, "
+            f"403 {delta['forbidden']}, ошибок {delta['errors']}"
+        )
+
+
+# Длительность функций water_db по имени функции
+db_query_seconds = LabeledHistograms(DB_BUCKETS)
+
+
+def db_timed(func: Callable) -> Callable:
+    """Декоратор: записывает длительность вызова функции БД в db_query_seconds."""
+    histogram = db_query_seconds.labels(func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+# Глобальные экземпляры метрик
+scheduler_metrics = SchedulerMetrics()
+delivery_metrics = DeliveryMetrics()
@@ -0,0 +1,202 @@
+"""
+Локальный HTTP-эндпоинт /metrics в текстовом формате Prometheus.
+
+Ответ собирается из уже накопленных счетчиков и гистограмм (app/utils/metrics.py)
+и снимков состояния компонентов: числа задач планировщика и наступивших задач
+(без копирования списка задач), очереди конвейера доставки и кэша настроек.
+Сбор не обращается к БД, поэтому опрос раз в несколько секунд ничего не стоит.
+
+Гистограммы задержки экспортируются по часовым поясам; ряды по слотам не
+экспортируются, чтобы число рядов не росло со временем.
+"""
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from .metrics import Histogram, LagTracker, db_query_seconds, delivery_metrics, scheduler_metrics
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Exposition:
+    """Накопитель строк ответа: HELP/TYPE один раз на метрику, затем ряды."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def header(self, name: str, kind: str, help_text: str):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        self.lines.append(f"{name}{_format_labels(labels or {})} {_format_value(value)}")
+
+    def metric(self, name: str, kind: str, help_text: str, value: float):
+        self.header(name, kind, help_text)
+        self.sample(name, value)
+
+    def histogram(self, name: str, histogram: Histogram, labels: Optional[Dict[str, str]] = None):
+        labels = labels or {}
+        counts, total_sum = histogram.snapshot()
+        cumulative = 0
+        for bound, count in zip(histogram.bounds + (float('inf'),), counts):
+            cumulative += count
+            self.sample(f"{name}_bucket", cumulative, {**labels, 'le': _format_value(float(bound))})
+        self.sample(f"{name}_sum", total_sum, labels)
+        self.sample(f"{name}_count", cumulative, labels)
+
+    def labeled_counter(self, name: str, help_text: str, label: str, values: Dict[str, int]):
+        self.header(name, 'counter', help_text)
+        for key, value in sorted(values.items()):
+            self.sample(name, value, {label: key})
+
+    def lag_by_timezone(self, name: str, help_text: str, tracker: LagTracker):
+        self.header(name, 'histogram', help_text)
+        for timezone, histogram in tracker.timezones_snapshot():
+            self.histogram(name, histogram, {'timezone': timezone})
+
+    def render(self) -> bytes:
+        return ('\n'.join(self.lines) + '\n').encode()
+
+
+def render_metrics() -> bytes:
+    """Собирает текущие метрики в текстовом формате Prometheus."""
+    # Импорт здесь: app.utils импортируется раньше планировщика и конвейера
+    from ..database.cache import settings_cache
+    from ..delivery import delivery_pipeline, dead_chats
+    from ..scheduler import job_manager
+    from ..scheduler.triggers import next_fire_hits, next_fire_misses
+
+    out = _Exposition()
+
+    # --- Планировщик ---
+    jobs, due = job_manager.job_counts()
+    out.metric('water_scheduler_jobs', 'gauge', "Задачи в хранилище планировщика", jobs)
+    out.metric('water_scheduler_due_jobs', 'gauge', "Задачи, чей запуск уже наступил, но еще не выбран", due)
+    out.metric('water_registry_users', 'gauge', "Пользователи в реестре планировщика", len(job_manager.registry))
+
+    out.metric(
+        'water_trigger_next_fire_hits_total', 'counter', "Следующий запуск взят из окна общего триггера",
+        next_fire_hits.value
+    )
+    out.metric(
+        'water_trigger_next_fire_misses_total', 'counter', "Следующий запуск рассчитан CronTrigger",
+        next_fire_misses.value
+    )
+
+    misfires, coalesced = scheduler_metrics.anomalies_snapshot()
+    out.labeled_counter('water_scheduler_misfires_total', "Пропущенные запуски задач", 'timezone', misfires)
+    out.labeled_counter('water_scheduler_coalesced_total', "Объединенные запуски задач", 'timezone', coalesced)
+    out.lag_by_timezone(
+        'water_job_start_lag_seconds', "Задержка старта задачи относительно запланированного времени",
+        scheduler_metrics.start_lag
+    )
+    out.lag_by_timezone(
+        'water_delivery_lag_seconds', "Задержка отправки напоминания относительно начала слота",
+        scheduler_metrics.delivery_lag
+    )
+
+    # --- Доставка ---
+    pipeline = delivery_pipeline.stats()
+    out.metric('water_delivery_queue_depth', 'gauge', "Задания в очереди конвейера доставки", pipeline['queue_depth'])
+    out.metric('water_delivery_in_flight', 'gauge', "Задания, обрабатываемые воркерами", pipeline['in_flight'])
+    out.metric('water_dead_chats_pending', 'gauge', "Недоступные чаты, ожидающие выключения в БД", dead_chats.pending())
+
+    out.metric('water_messages_sent_total', 'counter', "Успешные sendMessage", delivery_metrics.sent.value)
+    out.metric('water_telegram_retry_after_total', 'counter', "Ответы 429 RetryAfter", delivery_metrics.retry_after.value)
+    out.metric('water_telegram_forbidden_total', 'counter', "Ответы 403 Forbidden", delivery_metrics.forbidden.value)
+    out.metric('water_send_errors_total', 'counter', "Прочие ошибки Telegram при отправке", delivery_metrics.errors.value)
+    out.header('water_send_seconds', 'histogram', "Длительность запроса sendMessage")
+    out.histogram('water_send_seconds', delivery_metrics.send_seconds)
+
+    # --- БД и кэш ---
+    out.header('water_db_query_seconds', 'histogram', "Длительность функций water_db")
+    for function, histogram in db_query_seconds.items():
+        out.histogram('water_db_query_seconds', histogram, {'function': function})
+
+    cache = settings_cache.stats()
+    out.metric('water_settings_cache_size', 'gauge', "Записи в кэше настроек", cache['size'])
+    out.metric('water_settings_cache_hits_total', 'counter', "Попадания в кэш настроек", cache['hits'])
+    out.metric('water_settings_cache_misses_total', 'counter', "Промахи кэша настроек", cache['misses'])
+    out.metric('water_settings_cache_hit_ratio', 'gauge', "Доля попаданий в кэш настроек", cache['hit_ratio'])
+
+    return out.render()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        try:
+            body = render_metrics()
+        except Exception as e:
+            logger.error(f"❌ Ошибка сбора метрик: {e}", exc_info=True)
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer:
+    """HTTP-сервер метрик в фоновом потоке."""
+
+    def __init__(self):
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._server is not None
+
+    def start(self, host: str, port: int):
+        if self._server is not None:
+            return
+        self._server = _Server((host, port), _Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+        host, port = self._server.server_address[:2]
+        logger.info(f"📈 Метрики Prometheus: http://{host}:{port}/metrics")
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self._thread = None
+
+
+# Глобальный экземпляр сервера метрик
+metrics_server = MetricsServer()
@@ -0,0 +1,242 @@
+"""
+Профилирование работающего бота на ограниченное окно, без перезапуска процесса.
+
+За окно профилировщик собирает:
+- выборку стеков: фоновый поток раз в PROFILE_SAMPLE_INTERVAL_MS снимает стеки
+  всех потоков (sys._current_frames) - event loop бота, поток APScheduler и его
+  исполнителей - и считает одинаковые стеки. В отличие от cProfile, не нужно
+  ставить хук в каждый поток, а профилируемый код не замедляется;
+- tracemalloc: снимки в начале и в конце окна и прирост памяти по строкам.
+
+Отчеты пишутся в PROFILE_DIR (по умолчанию рядом с БД, на томе данных):
+    profile-<время>.folded - свернутые стеки для flamegraph.pl / speedscope
+    profile-<время>.txt    - потоки, горячие функции и прирост памяти
+
+Выборка идет по настенному времени: ожидание (select, Lock.acquire) тоже попадает
+в отчет. Запуск - команда /profile администратора (app/handlers/admin.py) или
+сигнал SIGUSR1. Задачи планировщика и конвейер доставки продолжают работать.
+"""
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from types import FrameType
+from typing import Dict, List, Optional, Tuple
+
+from ..config import PROFILE_DIR, PROFILE_SECONDS, PROFILE_MAX_SECONDS, PROFILE_SAMPLE_INTERVAL_MS
+
+logger = logging.getLogger(__name__)
+
+# Глубина стека, сохраняемая tracemalloc для каждого выделения памяти
+_TRACEMALLOC_FRAMES = 10
+# Сколько строк выводить в каждом разделе текстового отчета
+_REPORT_TOP = 30
+
+
+def _short_path(filename: str) -> str:
+    """Последние два компонента пути: app/bot.py, asyncio/base_events.py."""
+    return '/'.join(filename.replace('\\', '/').rsplit('/', 2)[-2:])
+
+
+def _function_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame: Optional[FrameType]) -> List[str]:
+    """Стек от внешнего вызова к текущей функции."""
+    stack = []
+    while frame is not None:
+        stack.append(_function_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class Profiler:
+    """Выборочный профилировщик и tracemalloc на одно окно за раз."""
+
+    def __init__(
+        self,
+        output_dir: str = PROFILE_DIR,
+        interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS,
+        max_seconds: float = PROFILE_MAX_SECONDS
+    ):
+        self.output_dir = output_dir
+        self.interval = interval_ms / 1000
+        self.max_seconds = max_seconds
+        self.last_report: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float = PROFILE_SECONDS, reason: str = '', blocking: bool = True) -> float:
+        """
+        Запускает профилирование в фоновом потоке.
+
+        Args:
+            seconds: Длительность окна
+            reason: Причина запуска для отчета
+            blocking: Ждать блокировку. Обработчик сигнала передает False: сигнал
+                выполняется в главном потоке и может прийти, пока тот сам внутри start()
+
+        Returns:
+            Длительность окна (ограничена max_seconds) или 0, если профилирование
+            уже идет или (при blocking=False) уже запускается
+        """
+        seconds = max(1.0, min(float(seconds), self.max_seconds))
+        if not self._lock.acquire(blocking=blocking):
+            return 0
+        try:
+            if self.running:
+                return 0
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(seconds, reason), name='profiler', daemon=True
+            )
+            self._thread.start()
+        finally:
+            self._lock.release()
+        return seconds
+
+    def stop(self) -> bool:
+        """Завершает окно досрочно (отчет все равно будет записан)."""
+        if not self.running:
+            return False
+        self._stop.set()
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Ждет окончания окна и возвращает путь к отчету без расширения."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.last_report
+
+    def _run(self, seconds: float, reason: str):
+        # Логируем из фонового потока: start() может вызываться из обработчика сигнала
+        logger.info(f"🔬 Профилирование на {seconds:.0f}с ({reason or 'без причины'})")
+        self.last_report = None
+        own_tracing = not tracemalloc.is_tracing()
+        if own_tracing:
+            tracemalloc.start(_TRACEMALLOC_FRAMES)
+        try:
+            before = tracemalloc.take_snapshot()
+            stacks: Counter = Counter()
+            samples = 0
+            me = threading.get_ident()
+            started_at = datetime.now()
+            started = time.monotonic()
+            deadline = started + seconds
+
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident != me:
+                        stacks[(names.get(ident, str(ident)), tuple(_collapse(frame)))] += 1
+                samples += 1
+                self._stop.wait(self.interval)
+
+            elapsed = time.monotonic() - started
+            after = tracemalloc.take_snapshot()
+            traced = tracemalloc.get_traced_memory()
+        except Exception as e:
+            logger.error(f"❌ Ошибка профилирования: {e}", exc_info=True)
+            return
+        finally:
+            if own_tracing:
+                tracemalloc.stop()
+
+        try:
+            self.last_report = self._write_reports(
+                started_at, elapsed, samples, reason, stacks, before, after, traced
+            )
+            logger.info(f"📄 Отчет профилирования: {self.last_report}.txt ({samples} выборок)")
+        except OSError as e:
+            logger.error(f"❌ Не удалось записать отчет профилирования: {e}")
+
+    def _write_reports(
+        self,
+        started_at: datetime,
+        elapsed: float,
+        samples: int,
+        reason: str,
+        stacks: Counter,
+        before: tracemalloc.Snapshot,
+        after: tracemalloc.Snapshot,
+        traced: Tuple[int, int]
+    ) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"profile-{started_at:%Y%m%d-%H%M%S}")
+
+        # Свернутые стеки: "поток;внешняя;...;текущая количество"
+        with open(f"{base}.folded", 'w', encoding='utf-8') as f:
+            for (thread, stack), count in stacks.most_common():
+                f.write(f"{';'.join((thread,) + stack)} {count}\n")
+
+        by_thread: Dict[str, int] = Counter()
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for (thread, stack), count in stacks.items():
+            by_thread[thread] += count
+            if stack:
+                own[(thread, stack[-1])] += count
+            for label in set(stack):
+                inclusive[label] += count
+
+        ignore = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        )
+        memory_diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+        current, peak = traced
+
+        lines = [
+            f"Профилирование: {started_at:%Y-%m-%d %H:%M:%S}, {elapsed:.1f}с, {samples} выборок "
+            f"каждые {self.interval * 1000:.0f}мс ({reason or 'без причины'})",
+            f"PID {os.getpid()}, Python {sys.version.split()[0]}",
+            "",
+            "== Выборки по потокам ==",
+        ]
+        lines += [f"{count:8d}  {thread}" for thread, count in sorted(by_thread.items(), key=lambda i: -i[1])]
+        lines += ["", "== Собственное время (поток, функция): доля выборок потока =="]
+        for (thread, label), count in own.most_common(_REPORT_TOP):
+            lines.append(f"{count / by_thread[thread]:7.1%}  {count:8d}  [{thread}] {label}")
+        lines += ["", "== Включенное время (функция вместе с вызванными) =="]
+        for label, count in inclusive.most_common(_REPORT_TOP):
+            lines.append(f"{count:8d}  {label}")
+        lines += [
+            "",
+            f"== tracemalloc: отслежено {current / 1024:.0f} КБ, пик {peak / 1024:.0f} КБ; прирост по строкам ==",
+        ]
+        lines += [str(stat) for stat in memory_diff[:_REPORT_TOP]]
+
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return base
+
+
+def _on_signal(signum, frame):
+    # Без ожидания блокировки: иначе сигнал внутри start() главного потока - взаимоблокировка
+    profiler.start(reason=f"сигнал {signal.Signals(signum).name}", blocking=False)
+
+
+def install_signal_handler() -> bool:
+    """Профилирование по SIGUSR1 (kill -USR1 <pid>); вызывается из главного потока."""
+    if not hasattr(signal, 'SIGUSR1'):  # Windows
+        return False
+    signal.signal(signal.SIGUSR1, _on_signal)
+    return True
+
+
+# Глобальный экземпляр профилировщика
+profiler = Profiler()
@@ -0,0 +1,303 @@
+"""
+Локальная заглушка Telegram Bot API для нагрузочных тестов.
+
+Поддерживает getMe, getUpdates (long polling из очереди синтетических
+обновлений), sendMessage, editMessageText, answerCallbackQuery; остальные
+методы отвечают {"ok": true, "result": true}. Добавляет задержку ко всем
+методам, кроме getUpdates; случайные 429 (RetryAfter) и 403 Forbidden для
+части чатов - только к sendMessage, через который идут напоминания.
+Записывает время обработки и исход каждого вызова.
+
+Бот направляется на заглушку через TELEGRAM_API_BASE_URL:
+
+    python benchmarks/fake_bot_api.py --port 8081 --latency-ms 50 --rate-429 0.01
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8081/bot python -m app
+
+Служебные адреса (вне /bot<token>/...):
+    POST /_control/updates  - добавить обновления (JSON-список) в очередь getUpdates
+    GET  /_control/stats    - статистика вызовов
+    POST /_control/reset    - сбросить статистику и очередь
+"""
+import argparse
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+# Методы, отвечающие сообщением
+_MESSAGE_METHODS = ('sendMessage', 'editMessageText')
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Очередь accept по умолчанию (5) переполняется при десятках одновременных
+    # соединений клиента, и часть запросов обрывается с ReadError
+    request_queue_size = 1024
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class FakeBotAPI:
+    """HTTP-заглушка Bot API в фоновом потоке."""
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        rate_429: float = 0.0,
+        retry_after: int = 1,
+        forbidden_every: int = 0,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.forbidden_every = forbidden_every
+        self._random = random.Random(seed)
+
+        self._lock = threading.Lock()
+        self._updates_ready = threading.Condition(self._lock)
+        self._updates: List[Dict[str, Any]] = []
+        self._message_ids = itertools.count(1)
+        self._timings: Dict[str, List[float]] = defaultdict(list)
+        self._outcomes: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        # (метод, chat_id, исход, время ответа по time.monotonic())
+        self.events: List[Tuple[str, Optional[int], str, float]] = []
+
+        self._server = _Server((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """Значение для TELEGRAM_API_BASE_URL (PTB дописывает токен)."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-bot-api', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._updates_ready:
+            self._updates_ready.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_updates(self, updates: List[Dict[str, Any]]):
+        """Кладет обновления в очередь getUpdates."""
+        with self._updates_ready:
+            self._updates.extend(updates)
+            self._updates_ready.notify_all()
+
+    def reset(self):
+        with self._lock:
+            self._updates.clear()
+            self._timings.clear()
+            self._outcomes.clear()
+            self.events.clear()
+
+    def count(self, method: str, outcome: str = 'ok') -> int:
+        with self._lock:
+            return self._outcomes[method][outcome]
+
+    def events_since(self, index: int) -> List[Tuple[str, Optional[int], str, float]]:
+        """Копия событий начиная с позиции index."""
+        with self._lock:
+            return self.events[index:]
+
+    def stats(self) -> Dict[str, Any]:
+        """Количество вызовов, исходы и перцентили времени обработки по методам."""
+        with self._lock:
+            result = {}
+            for method, timings in self._timings.items():
+                result[method] = {
+                    'calls': len(timings),
+                    'outcomes': dict(self._outcomes[method]),
+                    'p50_ms': round(_percentile(timings, 0.50) * 1000, 2),
+                    'p95_ms': round(_percentile(timings, 0.95) * 1000, 2),
+                    'p99_ms': round(_percentile(timings, 0.99) * 1000, 2),
+                    'max_ms': round(max(timings) * 1000, 2) if timings else 0.0,
+                }
+            return result
+
+    # -------------------------------------------------------------------------
+    # Методы Bot API
+    # -------------------------------------------------------------------------
+
+    def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+        with self._updates_ready:
+            while True:
+                # Как в Telegram: offset подтверждает все обновления до него
+                if offset:
+                    self._updates = [u for u in self._updates if u['update_id'] >= offset]
+                if self._updates:
+                    return self._updates[:limit]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._updates_ready.wait(remaining)
+
+    def _message(self, chat_id: Any, text: str) -> Dict[str, Any]:
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'},
+            'text': text,
+        }
+
+    def _call(self, method: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any], str]:
+        """Возвращает (HTTP-код, тело ответа, исход)."""
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': self._get_updates(params)}, 'ok'
+
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {
+                'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot',
+                'can_join_groups': False, 'can_read_all_group_messages': False,
+                'supports_inline_queries': False,
+            }}, 'ok'
+
+        chat_id = params.get('chat_id')
+        if method == 'sendMessage':
+            if self.forbidden_every and chat_id is not None and int(chat_id) % self.forbidden_every == 0:
+                return 403, {
+                    'ok': False, 'error_code': 403,
+                    'description': 'Forbidden: bot was blocked by the user',
+                }, '403'
+            if self.rate_429 and self._random.random() < self.rate_429:
+                return 429, {
+                    'ok': False, 'error_code': 429,
+                    'description': f'Too Many Requests: retry after {self.retry_after}',
+                    'parameters': {'retry_after': self.retry_after},
+                }, '429'
+        if method in _MESSAGE_METHODS:
+            return 200, {'ok': True, 'result': self._message(chat_id or 0, params.get('text', ''))}, 'ok'
+
+        return 200, {'ok': True, 'result': True}, 'ok'
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _read_params(self) -> Dict[str, Any]:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                if not body:
+                    return {}
+                if content_type.startswith('application/json'):
+                    return json.loads(body)
+                params = {}
+                # PTB передает параметры form-urlencoded, сложные значения - строками JSON
+                for key, value in parse_qsl(body.decode()):
+                    try:
+                        params[key] = json.loads(value)
+                    except ValueError:
+                        params[key] = value
+                return params
+
+            def _reply(self, status: int, payload: Any):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент закрыл long polling при остановке
+                    pass
+
+            def do_GET(self):
+                if self.path == '/_control/stats':
+                    self._reply(200, api.stats())
+                else:
+                    self.do_POST()
+
+            def do_POST(self):
+                started = time.monotonic()
+                params = self._read_params()
+
+                if self.path == '/_control/updates':
+                    api.add_updates(params)
+                    self._reply(200, {'ok': True})
+                    return
+                if self.path == '/_control/reset':
+                    api.reset()
+                    self._reply(200, {'ok': True})
+                    return
+
+                # /bot<token>/<method>
+                method = self.path.rsplit('/', 1)[-1].split('?', 1)[0]
+                status, payload, outcome = api._call(method, params)
+                self._reply(status, payload)
+
+                finished = time.monotonic()
+                chat_id = params.get('chat_id')
+                with api._lock:
+                    api._timings[method].append(finished - started)
+                    api._outcomes[method][outcome] += 1
+                    if method != 'getUpdates':
+                        api.events.append((
+                            method, int(chat_id) if chat_id is not None else None, outcome, finished
+                        ))
+
+        return Handler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Задержка каждого ответа")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Случайная добавка к задержке")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="Доля ответов 429 (0..1)")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after в ответах 429")
+    parser.add_argument('--forbidden-every', type=int, default=0,
+                        help="403 Forbidden для chat_id, кратных этому числу (0 - выключено)")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(
+        args.host, args.port, args.latency_ms, args.jitter_ms,
+        args.rate_429, args.retry_after, args.forbidden_every
+    )
+    print(f"Fake Bot API: TELEGRAM_API_BASE_URL={api.base_url}")
+    try:
+        api._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(api.stats(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Нагрузочный тест бота целиком против локальной заглушки Bot API.
+
+Поднимает benchmarks/fake_bot_api.py в том же процессе, направляет на нее
+Application (TELEGRAM_API_BASE_URL), и прогоняет сценарий:
+
+1. N пользователей нажимают «Ок, понятно!» (onboarding_activate);
+2. часть из них нажимает «Остановить» (water_stop), затем «Продолжить» (water_resume);
+3. наступает слот рассылки: все подписчики получают напоминание (в per_user-режиме
+   вызываются задачи пользователей текущего часа, в bucketed - рассылка по поясам).
+
+Нажатия приходят через getUpdates, как в polling-режиме; время ответа на
+нажатие считается от постановки обновления в очередь заглушки до
+editMessageText. Для слота меряется время от запуска рассылки до последней
+отправки и пропускная способность. Результат - JSON.
+
+    python benchmarks/load_test.py --users 2000 --latency-ms 30 --rate-429 0.01 --forbidden-every 50
+
+Тест работает во временном каталоге (БД и логи не смешиваются с рабочими).
+Часовой пояс пользователей выбирается так, чтобы локальное время было
+дневным и напоминания не отсекались тихими часами.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI, _percentile  # noqa: E402
+
+CHAT_BASE = 10_000_000
+
+
+def daytime_timezone() -> str:
+    """Зона Etc/GMT, в которой сейчас 12 часов дня."""
+    offset = 12 - datetime.now(timezone.utc).hour
+    # В именах Etc/GMT знак инвертирован: Etc/GMT-3 - это UTC+3
+    return f"Etc/GMT-{offset}" if offset >= 0 else f"Etc/GMT+{-offset}"
+
+
+def callback_update(update_id: int, chat_id: int, data: str) -> dict:
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f'Load {chat_id}'}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user,
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private', 'first_name': user['first_name']},
+                'text': 'menu',
+            },
+        },
+    }
+
+
+def latency_summary(values) -> dict:
+    return {
+        'p50': round(_percentile(values, 0.50) * 1000, 2),
+        'p95': round(_percentile(values, 0.95) * 1000, 2),
+        'p99': round(_percentile(values, 0.99) * 1000, 2),
+        'max': round(max(values) * 1000, 2) if values else 0.0,
+    }
+
+
+class Scenario:
+    """Шаги сценария поверх запущенного Application и заглушки."""
+
+    def __init__(self, api: FakeBotAPI, timeout: float):
+        self.api = api
+        self.timeout = timeout
+        self._update_ids = 0
+
+    async def press(self, data: str, chat_ids) -> dict:
+        """Нажимает кнопку data у всех chat_ids и ждет ответов editMessageText."""
+        mark = len(self.api.events_since(0))
+        pending = set(chat_ids)
+        updates = []
+        for chat_id in chat_ids:
+            self._update_ids += 1
+            updates.append(callback_update(self._update_ids, chat_id, data))
+
+        started = time.monotonic()
+        self.api.add_updates(updates)
+
+        answered = {}
+        deadline = started + self.timeout
+        while pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            events = self.api.events_since(mark)
+            mark += len(events)
+            for method, chat_id, _, finished in events:
+                if method == 'editMessageText' and chat_id in pending:
+                    pending.discard(chat_id)
+                    answered[chat_id] = finished - started
+
+        elapsed = (max(answered.values()) if answered else time.monotonic() - started)
+        return {
+            'button': data,
+            'updates': len(updates),
+            'answered': len(answered),
+            'timed_out': len(pending),
+            'elapsed_seconds': round(elapsed, 3),
+            'updates_per_second': round(len(answered) / elapsed, 1) if elapsed else 0.0,
+            'response_ms': latency_summary(list(answered.values())),
+        }
+
+    @staticmethod
+    def due_water_jobs(job_manager) -> list:
+        """
+        Задачи напоминаний per_user-режима на текущий местный час - как если бы
+        его слот только что наступил (час слота - аргумент задачи).
+        """
+        now = datetime.now(timezone.utc)
+        return [
+            job for job in job_manager.get_all_jobs()
+            if job.id.startswith('water_') and job.args
+            and job.args[0] == now.astimezone(job.trigger.timezone).hour
+        ]
+
+    async def fire_slot(self, job_manager, idle_seconds: float) -> dict:
+        """
+        Запускает рассылку ближайшего слота и ждет ее окончания: в bucketed-режиме
+        по всем часовым поясам реестра, в per_user - задачами пользователей.
+        """
+        mark = len(self.api.events_since(0))
+        expected = 0
+        started = time.monotonic()
+
+        def dispatch():
+            nonlocal expected
+            if job_manager.mode == 'per_user':
+                # Как планировщик: вызываются задачи WaterReminderJob текущего слота
+                for job in self.due_water_jobs(job_manager):
+                    expected += 1
+                    job.func(*job.args, **job.kwargs)
+                return
+            # Как bucket-задача: рассылка из потока планировщика
+            for tz in job_manager.registry.active_timezones():
+                chat_ids = job_manager.get_bucket_subscribers(tz)
+                expected += len(chat_ids)
+                job_manager.dispatch_bucket(chat_ids, tz)
+
+        await asyncio.to_thread(dispatch)
+        dispatched = time.monotonic() - started
+
+        finished_chats = {}
+        outcomes = {}
+        last_event = time.monotonic()
+        deadline = started + self.timeout
+        while len(finished_chats) < expected and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+            events = self.api.events_since(mark)
+            mark += len(events)
+            for method, chat_id, outcome, finished in events:
+                if method != 'sendMessage':
+                    continue
+                last_event = time.monotonic()
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                # 429 повторяется ограничителем скорости, итоговый исход - ok или 403
+                if outcome != '429':
+                    finished_chats[chat_id] = finished - started
+            if time.monotonic() - last_event > idle_seconds:
+                break
+
+        delivery = list(finished_chats.values())
+        elapsed = max(delivery) if delivery else time.monotonic() - started
+        return {
+            'recipients': expected,
+            'delivered_or_blocked': len(delivery),
+            'missing': expected - len(delivery),
+            'send_outcomes': outcomes,
+            'dispatch_seconds': round(dispatched, 3),
+            'elapsed_seconds': round(elapsed, 3),
+            'messages_per_second': round(len(delivery) / elapsed, 1) if elapsed else 0.0,
+            'delivery_ms': latency_summary(delivery),
+        }
+
+
+async def run(args, api: FakeBotAPI) -> dict:
+    from app.bot import create_application
+    from app.scheduler import job_manager
+    from app.delivery import delivery_pipeline
+
+    job_manager.start()
+    application = create_application()
+    await application.initialize()
+    await application.post_init(application)
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+    await application.start()
+
+    scenario = Scenario(api, args.timeout)
+    users = [CHAT_BASE + i for i in range(args.users)]
+    togglers = users[:max(1, int(len(users) * args.toggle_share))]
+    result = {
+        'users': args.users,
+        'scheduler_mode': os.environ['SCHEDULER_MODE'],
+        'timezone': os.environ['DEFAULT_TIMEZONE'],
+        'fake_api': {
+            'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms,
+            'rate_429': args.rate_429, 'forbidden_every': args.forbidden_every,
+        },
+        'phases': [],
+    }
+    try:
+        result['phases'].append(await scenario.press('onboarding_activate', users))
+        result['phases'].append(await scenario.press('water_stop', togglers))
+        result['phases'].append(await scenario.press('water_resume', togglers))
+        result['scheduled_jobs'] = len(job_manager.get_all_jobs())
+        result['slot'] = await scenario.fire_slot(job_manager, args.idle_seconds)
+        result['pipeline'] = delivery_pipeline.stats()
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+        job_manager.shutdown()
+    result['api_calls'] = api.stats()
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота против заглушки Bot API")
+    parser.add_argument('--users', type=int, default=500, help="Сколько пользователей симулировать")
+    parser.add_argument('--toggle-share', type=float, default=0.2,
+                        help="Доля пользователей, которые останавливают и возобновляют напоминания")
+    parser.add_argument('--mode', choices=('per_user', 'bucketed'), default='bucketed', help="SCHEDULER_MODE")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Задержка ответа заглушки")
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help="Случайная добавка к задержке")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="Доля ответов 429 на sendMessage")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after в ответах 429")
+    parser.add_argument('--forbidden-every', type=int, default=0,
+                        help="403 для chat_id, кратных этому числу (0 - выключено)")
+    parser.add_argument('--global-rate', type=float, default=1000.0,
+                        help="TELEGRAM_GLOBAL_RATE на время теста (25 - как в продакшене)")
+    parser.add_argument('--timeout', type=float, default=300.0, help="Предел ожидания одной фазы, секунд")
+    parser.add_argument('--idle-seconds', type=float, default=10.0,
+                        help="Фаза слота завершается, если столько секунд нет отправок")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        rate_429=args.rate_429, retry_after=args.retry_after,
+        forbidden_every=args.forbidden_every, seed=1
+    )
+    api.start()
+
+    workdir = tempfile.mkdtemp(prefix='water-load-')
+    os.chdir(workdir)
+    # Конфигурация читается при импорте app, поэтому окружение задается до него
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:LOAD-TEST',
+        'TELEGRAM_API_BASE_URL': api.base_url,
+        'DEFAULT_TIMEZONE': daytime_timezone(),
+        'SCHEDULER_MODE': args.mode,
+        'TELEGRAM_GLOBAL_RATE': str(args.global_rate),
+        'TELEGRAM_GLOBAL_BURST': str(max(1, int(args.global_rate))),
+        'LOG_LEVEL': 'WARNING',
+        'LOG_FILE': os.path.join(workdir, 'bot_log.txt'),
+    })
+
+    try:
+        result = asyncio.run(run(args, api))
+    finally:
+        api.stop()
+    result['workdir'] = workdir
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0 if result['slot']['missing'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""
+Бенчмарк планировщика на виртуальных часах: N пользователей, сутки за секунды.
+
+Для каждой пары (режим, N) запускается отдельный процесс во временном каталоге:
+
+1. В БД записывается N активных пользователей, распределенных по --timezones поясам.
+2. JobManager получает виртуальные часы, планировщик стартует на паузе,
+   пользователи восстанавливаются как при запуске бота (restore_water_reminders).
+3. Сутки прогоняются напрямую по jobstore, как это делает цикл APScheduler:
+   часы переводятся на ближайший next_run_time, наступившие задачи выполняются,
+   им пересчитывается следующий запуск. Отправка - пустая корутина в конвейере
+   доставки, поэтому меряется только стоимость планирования и рассылки.
+4. Для выборки пользователей меряется остановка и возобновление.
+
+Метрики:
+    schedule_seconds   - восстановление N пользователей
+    memory_per_user    - прирост RSS на пользователя, размер реестра и память,
+                         выделенная при постановке пользователя на расписание
+                         (tracemalloc на выборке из --sample пользователей)
+    wakeup             - стоимость пробуждения (выборка наступивших задач и
+                         пересчет следующего запуска, без выполнения задач)
+    fanout_per_slot    - выполнение задач слота до опустошения очереди конвейера
+    stop_resume_us     - задержка unschedule/schedule одного пользователя
+
+    python benchmarks/scheduler_bench.py --sizes 10000,100000 --output bench.json
+
+Результат - JSON (с коммитом git) для сравнения между коммитами. per_user-режим
+держит 16 задач на пользователя, а вставка в MemoryJobStore линейна по числу
+задач, поэтому по умолчанию он запускается только до --per-user-max пользователей.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Начало моделируемых суток (UTC); за 24 часа каждый пояс проходит все 16 слотов
+SIMULATION_START = datetime(2025, 1, 6)
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summary(values, scale: float = 1000.0, digits: int = 3) -> dict:
+    """p50/p99/max/сумма; по умолчанию в миллисекундах."""
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 0.50) * scale, digits),
+        'p99': round(percentile(values, 0.99) * scale, digits),
+        'max': round(max(values) * scale, digits) if values else 0.0,
+        'total': round(sum(values) * scale, digits),
+    }
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса (Linux), иначе пиковый."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class VirtualClock:
+    """Часы JobManager, которые двигает симуляция."""
+
+    def __init__(self, start: datetime):
+        self._now = start
+
+    def __call__(self) -> datetime:
+        return self._now
+
+    def set(self, moment: datetime):
+        self._now = moment
+
+
+# =============================================================================
+# РАБОЧИЙ ПРОЦЕСС: ОДНА ПАРА (РЕЖИМ, N)
+# =============================================================================
+
+def worker(args) -> dict:
+    import pytz
+    from app.database import init_db, iter_active_water_reminders
+    from app.database.connection import transaction
+    from app.scheduler import job_manager, bind_event_loop
+    from app.delivery import delivery_pipeline
+    from app.scheduler.triggers import next_fire_hits, next_fire_misses
+
+    timezones = [f"Etc/GMT-{k}" for k in range(args.timezones)]
+    clock = VirtualClock(pytz.utc.localize(SIMULATION_START))
+    result = {'mode': job_manager.mode, 'users': args.users, 'timezones': len(timezones)}
+
+    # --- Данные ---
+    init_db()
+    started = time.perf_counter()
+    with transaction() as con:
+        con.executemany(
+            """
+            INSERT INTO water_reminders
+                (chat_id, message, interval_minutes, start_hour, end_hour, is_active, onboarding_completed, timezone)
+            VALUES (?, 'Время пить воду! 💧', 60, 8, 23, 1, 1, ?)
+            """,
+            ((10_000_000 + i, timezones[i % len(timezones)]) for i in range(args.users))
+        )
+    result['seed_seconds'] = round(time.perf_counter() - started, 3)
+
+    # --- Конвейер доставки с пустой отправкой в отдельном event loop ---
+    sends = 0
+
+    async def noop_send(application, chat_id, settings):
+        nonlocal sends
+        sends += 1
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name='bench-loop', daemon=True).start()
+    bind_event_loop(loop)
+    asyncio.run_coroutine_threadsafe(delivery_pipeline.start(), loop).result()
+
+    def wait_drained():
+        while True:
+            stats = delivery_pipeline.stats()
+            if stats['queue_depth'] == 0 and stats['in_flight'] == 0:
+                return
+            time.sleep(0.0005)
+
+    job_manager.clock = clock
+    job_manager.set_application(object())
+    job_manager.set_send_functions(noop_send)
+    # Задачи попадают в jobstore, но поток планировщика их не запускает
+    job_manager.scheduler.start(paused=True)
+
+    # --- Восстановление ---
+    gc.collect()
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    restored = job_manager.restore_water_reminders(None, iter_active_water_reminders(), noop_send)
+    elapsed = time.perf_counter() - started
+    result['schedule_seconds'] = round(elapsed, 3)
+    result['schedule_users_per_second'] = round(restored / max(elapsed, 1e-9))
+    gc.collect()
+    rss_grown = rss_bytes() - rss_before
+    result['memory_per_user'] = {
+        'rss_bytes': round(rss_grown / max(restored, 1), 1),
+        'registry_bytes': round(job_manager.registry.memory_bytes() / max(restored, 1), 1),
+    }
+    result['jobs'] = len(job_manager.get_all_jobs())
+
+    # --- Сутки на виртуальных часах ---
+    store = job_manager.jobstore
+    end = clock() + timedelta(days=1)
+    wakeup_costs, fanout_costs, plan_costs = [], [], []
+    fires = 0
+    hits_before, misses_before = next_fire_hits.value, next_fire_misses.value
+    day_started = time.perf_counter()
+    while True:
+        next_run = store.get_next_run_time()
+        if next_run is None or next_run > end:
+            break
+
+        if job_manager.mode == 'bucketed':
+            # Последний запуск water_slot_planner перед слотом
+            clock.set(next_run - timedelta(minutes=1))
+            started = time.perf_counter()
+            job_manager.plan_upcoming_slots()
+            plan_costs.append(time.perf_counter() - started)
+
+        clock.set(next_run)
+        now = next_run
+        overhead = 0.0
+        fanout = 0.0
+
+        started = time.perf_counter()
+        due = store.get_due_jobs(now)
+        overhead += time.perf_counter() - started
+
+        for job in due:
+            run_times = job._get_run_times(now)
+            started = time.perf_counter()
+            job.func(*job.args, **job.kwargs)
+            fanout += time.perf_counter() - started
+            fires += 1
+
+            started = time.perf_counter()
+            next_fire = job.trigger.get_next_fire_time(run_times[-1], now)
+            if next_fire:
+                job._modify(next_run_time=next_fire)
+                store.update_job(job)
+            else:
+                store.remove_job(job.id)
+            overhead += time.perf_counter() - started
+
+        started = time.perf_counter()
+        wait_drained()
+        fanout += time.perf_counter() - started
+
+        wakeup_costs.append(overhead)
+        fanout_costs.append(fanout)
+
+    result['simulated_day'] = {
+        'wall_seconds': round(time.perf_counter() - day_started, 3),
+        'wakeups': len(wakeup_costs),
+        'job_runs': fires,
+        'sends': sends,
+        # Расчеты следующего запуска: из окна общего триггера / заново
+        'next_fire_hits': next_fire_hits.value - hits_before,
+        'next_fire_misses': next_fire_misses.value - misses_before,
+    }
+    result['wakeup_ms'] = summary(wakeup_costs)
+    result['fanout_per_slot_ms'] = summary(fanout_costs)
+    if plan_costs:
+        result['slot_plan_ms'] = summary(plan_costs)
+
+    # --- Остановка / возобновление ---
+    clock.set(pytz.utc.localize(SIMULATION_START))
+    rng = random.Random(1)
+    sample = rng.sample(range(args.users), min(args.sample, args.users))
+    stop_costs, resume_costs = [], []
+    for i in sample:
+        chat_id = 10_000_000 + i
+        settings = {'timezone': timezones[i % len(timezones)], 'is_active': True}
+        started = time.perf_counter()
+        job_manager.unschedule_water_reminders(chat_id)
+        stop_costs.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        job_manager.schedule_water_reminders(None, chat_id, settings, noop_send)
+        resume_costs.append(time.perf_counter() - started)
+    result['stop_us'] = summary(stop_costs, scale=1e6, digits=1)
+    result['resume_us'] = summary(resume_costs, scale=1e6, digits=1)
+
+    # --- Память на пользователя: снятие и повторная постановка выборки под tracemalloc ---
+    for i in sample:
+        job_manager.unschedule_water_reminders(10_000_000 + i)
+    gc.collect()
+    tracemalloc.start()
+    traced_before = tracemalloc.get_traced_memory()[0]
+    for i in sample:
+        settings = {'timezone': timezones[i % len(timezones)], 'is_active': True}
+        job_manager.schedule_water_reminders(None, 10_000_000 + i, settings, noop_send)
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0] - traced_before
+    tracemalloc.stop()
+    result['memory_per_user']['traced_bytes'] = round(traced / max(len(sample), 1), 1)
+
+    asyncio.run_coroutine_threadsafe(delivery_pipeline.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    job_manager.shutdown(wait=False)
+    return result
+
+
+# =============================================================================
+# РОДИТЕЛЬСКИЙ ПРОЦЕСС: ПЕРЕБОР РЕЖИМОВ И РАЗМЕРОВ
+# =============================================================================
+
+def run_case(args, mode: str, users: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix='water-sched-bench-')
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN='123456:SCHEDULER-BENCH',
+        SCHEDULER_MODE=mode,
+        LOG_LEVEL='WARNING',
+        LOG_FILE=os.path.join(workdir, 'bot_log.txt'),
+        PYTHONPATH=ROOT,
+    )
+    command = [
+        sys.executable, os.path.abspath(__file__), '--worker',
+        '--users', str(users), '--timezones', str(args.timezones), '--sample', str(args.sample),
+    ]
+    try:
+        completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if completed.returncode != 0:
+        return {'mode': mode, 'users': users, 'error': completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк планировщика на виртуальных часах")
+    parser.add_argument('--sizes', default='10000,100000', help="Числа пользователей через запятую")
+    parser.add_argument('--modes', default='per_user,bucketed', help="Режимы планировщика через запятую")
+    parser.add_argument('--timezones', type=int, default=4, help="Сколько часовых поясов у пользователей")
+    parser.add_argument('--sample', type=int, default=1000, help="Пользователей в замере остановки/возобновления")
+    parser.add_argument('--per-user-max', type=int, default=20_000,
+                        help="Максимум пользователей для per_user-режима (16 задач на пользователя)")
+    parser.add_argument('--output', default='', help="Файл для JSON (по умолчанию stdout)")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--users', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, ROOT)
+        print(json.dumps(worker(args), ensure_ascii=False))
+        return 0
+
+    report = {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'results': [],
+    }
+    for mode in args.modes.split(','):
+        for users in (int(size) for size in args.sizes.split(',')):
+            if mode == 'per_user' and users > args.per_user_max:
+                report['results'].append({'mode': mode, 'users': users, 'skipped': '--per-user-max'})
+                continue
+            print(f"⏱️ {mode} {users}...", file=sys.stderr)
+            report['results'].append(run_case(args, mode, users))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if any('error' in r for r in report['results']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
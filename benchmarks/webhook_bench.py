@@ -0,0 +1,285 @@
+"""
+Сравнение webhook и long polling на одинаковых обновлениях Telegram.
+
+Бот запускается в том же процессе против заглушки Bot API
+(benchmarks/fake_bot_api.py, TELEGRAM_API_BASE_URL), и один и тот же набор
+синтетических обновлений (сообщения /start или нажатия кнопки меню)
+прогоняется в обоих режимах получения:
+
+- polling: обновления кладутся в очередь getUpdates заглушки (FakeBotAPI.add_updates);
+- webhook: обновления отправляются POST-запросами во встроенный webhook-сервер PTB
+  (нужен пакет python-telegram-bot[webhooks], иначе режим отмечается ошибкой).
+
+Для каждого режима меряется время от передачи обновления боту до его ответа
+в заглушке (sendMessage на /start, editMessageText на нажатие) и пропускная
+способность; для webhook дополнительно - задержка ответа сервера на POST
+(прием обновления и постановка в очередь PTB). Результат - один JSON.
+
+    python benchmarks/webhook_bench.py --count 5000 --concurrency 50 --latency-ms 20
+
+Тест работает во временном каталоге (БД и логи не смешиваются с рабочими).
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from load_test import callback_update, latency_summary  # noqa: E402
+
+WEBHOOK_PATH = 'telegram'
+WEBHOOK_SECRET = 'webhook-bench-secret'
+# Метод Bot API, которым бот отвечает на обновление каждого типа
+REPLY_METHODS = {'message': 'sendMessage', 'callback': 'editMessageText'}
+
+
+def make_update(update_id: int, kind: str, chat_id: int) -> dict:
+    """Собирает синтетическое обновление: сообщение /start или нажатие кнопки меню."""
+    if kind == 'callback':
+        return callback_update(update_id, chat_id, 'menu_water')
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f'Bench {chat_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': user['first_name']},
+            'from': user,
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }
+
+
+def update_chat_id(update: dict) -> int:
+    if 'callback_query' in update:
+        return update['callback_query']['message']['chat']['id']
+    return update['message']['chat']['id']
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ReplyCollector:
+    """
+    Сопоставляет ответы бота в заглушке с переданными обновлениями.
+
+    Обновления одного чата отвечаются по порядку, поэтому время передачи
+    хранится очередью на чат, а ответ закрывает самое раннее из них.
+    """
+
+    def __init__(self, api: FakeBotAPI, method: str):
+        self.api = api
+        self.method = method
+        self.mark = len(api.events_since(0))
+        self._sent_at: Dict[int, Deque[float]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self.expected = 0
+        self.failed = 0
+        self.latencies: List[float] = []
+        self.last_reply = 0.0
+
+    def sent(self, chat_id: int, at: float):
+        """Отмечает передачу обновления боту (вызывается и из потоков POST)."""
+        with self._lock:
+            self._sent_at[chat_id].append(at)
+            self.expected += 1
+
+    def failed_to_send(self, chat_id: int):
+        """Обновление не дошло до бота: ответа на него ждать не нужно."""
+        with self._lock:
+            self._sent_at[chat_id].pop()
+            self.expected -= 1
+            self.failed += 1
+
+    async def wait(self, total: int, deadline: float):
+        """Собирает ответы, пока не получены все total или не наступил deadline."""
+        while len(self.latencies) < total - self.failed and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            events = self.api.events_since(self.mark)
+            self.mark += len(events)
+            with self._lock:
+                for method, chat_id, _, finished in events:
+                    queue = self._sent_at.get(chat_id)
+                    if method != self.method or not queue:
+                        continue
+                    self.latencies.append(finished - queue.popleft())
+                    self.last_reply = max(self.last_reply, finished)
+
+    def summary(self, started: float) -> dict:
+        elapsed = (self.last_reply or time.monotonic()) - started
+        return {
+            'replied': len(self.latencies),
+            'timed_out': self.expected - len(self.latencies),
+            'elapsed_seconds': round(elapsed, 3),
+            'updates_per_second': round(len(self.latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+            'reply_ms': latency_summary(self.latencies),
+        }
+
+
+async def bench_polling(application, api: FakeBotAPI, updates: List[dict], args) -> dict:
+    """Обновления приходят через getUpdates: все сразу кладутся в очередь заглушки."""
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+    try:
+        collector = ReplyCollector(api, REPLY_METHODS[args.kind])
+        started = time.monotonic()
+        for update in updates:
+            collector.sent(update_chat_id(update), started)
+        api.add_updates(updates)
+        await collector.wait(len(updates), started + args.timeout)
+        return collector.summary(started)
+    finally:
+        await application.updater.stop()
+
+
+def post_update(url: str, update: dict, timeout: float) -> float:
+    """Отправляет обновление в webhook и возвращает задержку ответа в секундах."""
+    request = urllib.request.Request(url, data=json.dumps(update).encode(), method='POST')
+    request.add_header('Content-Type', 'application/json')
+    request.add_header('X-Telegram-Bot-Api-Secret-Token', WEBHOOK_SECRET)
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+async def bench_webhook(application, api: FakeBotAPI, updates: List[dict], args) -> dict:
+    """Обновления приходят POST-запросами во встроенный webhook-сервер PTB."""
+    if importlib.util.find_spec('tornado') is None:
+        return {'error': 'webhook-сервер PTB недоступен: pip install "python-telegram-bot[webhooks]"'}
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/{WEBHOOK_PATH}"
+    # setWebhook уходит в заглушку, она просто отвечает ok
+    await application.updater.start_webhook(
+        listen='127.0.0.1', port=port, url_path=WEBHOOK_PATH,
+        webhook_url=url, secret_token=WEBHOOK_SECRET
+    )
+    try:
+        collector = ReplyCollector(api, REPLY_METHODS[args.kind])
+        post_latencies: List[float] = []
+        errors = 0
+        lock = threading.Lock()
+
+        def post(update: dict):
+            nonlocal errors
+            collector.sent(update_chat_id(update), time.monotonic())
+            try:
+                latency = post_update(url, update, args.request_timeout)
+                with lock:
+                    post_latencies.append(latency)
+            except (urllib.error.URLError, OSError):
+                collector.failed_to_send(update_chat_id(update))
+                with lock:
+                    errors += 1
+
+        def post_all():
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                list(pool.map(post, updates))
+
+        started = time.monotonic()
+        posting = asyncio.ensure_future(asyncio.to_thread(post_all))
+        await collector.wait(len(updates), started + args.timeout)
+        await posting
+        result = collector.summary(started)
+        result.update({
+            'concurrency': args.concurrency,
+            'post_errors': errors,
+            'post_ms': latency_summary(post_latencies),
+        })
+        return result
+    finally:
+        await application.updater.stop()
+
+
+async def run(args, api: FakeBotAPI) -> dict:
+    from app.bot import create_application
+    from app.scheduler import job_manager
+
+    job_manager.start()
+    application = create_application()
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+
+    # Одинаковые обновления для обоих режимов
+    updates = [
+        make_update(i + 1, args.kind, args.chat_base + i % args.users)
+        for i in range(args.count)
+    ]
+    result = {
+        'kind': args.kind,
+        'count': args.count,
+        'users': args.users,
+        'fake_api': {'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms},
+    }
+    benches = {'polling': bench_polling, 'webhook': bench_webhook}
+    try:
+        for mode in args.modes:
+            result[mode] = await benches[mode](application, api, updates, args)
+    finally:
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+        job_manager.shutdown()
+    result['api_calls'] = api.stats()
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Сравнение webhook и long polling на одинаковых обновлениях")
+    parser.add_argument('--modes', nargs='+', choices=('polling', 'webhook'), default=['polling', 'webhook'],
+                        help="Режимы получения обновлений, в порядке прогона")
+    parser.add_argument('--count', type=int, default=1000, help="Сколько обновлений отправить")
+    parser.add_argument('--concurrency', type=int, default=20, help="Одновременных POST в webhook")
+    parser.add_argument('--users', type=int, default=1000, help="Сколько разных chat_id использовать")
+    parser.add_argument('--chat-base', type=int, default=10_000_000, help="Первый синтетический chat_id")
+    parser.add_argument('--kind', choices=('message', 'callback'), default='message', help="Тип обновления")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Задержка ответа заглушки")
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help="Случайная добавка к задержке")
+    parser.add_argument('--request-timeout', type=float, default=10.0, help="Таймаут POST-запроса, секунд")
+    parser.add_argument('--timeout', type=float, default=300.0, help="Предел ожидания одного режима, секунд")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1)
+    api.start()
+
+    workdir = tempfile.mkdtemp(prefix='water-webhook-')
+    os.chdir(workdir)
+    # Конфигурация читается при импорте app, поэтому окружение задается до него
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:WEBHOOK-BENCH',
+        'TELEGRAM_API_BASE_URL': api.base_url,
+        'LOG_LEVEL': 'WARNING',
+        'LOG_FILE': os.path.join(workdir, 'bot_log.txt'),
+    })
+
+    try:
+        result = asyncio.run(run(args, api))
+    finally:
+        api.stop()
+    result['workdir'] = workdir
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    complete = all(result[mode].get('timed_out', 1) == 0 for mode in args.modes)
+    return 0 if complete else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+Тесты надежности доставки: состояния строк outbox (подтверждение, повтор
+с паузой, неудача после всех попыток) и пакетное выключение недоступных чатов.
+
+    TELEGRAM_BOT_TOKEN=x python -m pytest -q test_delivery_reliability.py
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+from telegram.error import Forbidden, TimedOut
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:TEST')
+
+from app.database import (  # noqa: E402
+    add_outbox_entries,
+    claim_outbox_entries,
+    close_connections,
+    get_connection,
+    get_water_reminder,
+    init_db,
+    save_water_reminder,
+    set_water_reminder_active,
+    settings_cache,
+)
+from app.delivery.dead_chats import DeadChatCollector  # noqa: E402
+from app.delivery.outbox import OutboxRelay  # noqa: E402
+
+# Модуль, а не одноименный глобальный экземпляр из app.delivery
+dead_chats_module = sys.modules['app.delivery.dead_chats']
+
+SLOT = '2025-06-02 12:00 Europe/Moscow'
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Отдельная БД на тест; кэш настроек не переживает тест."""
+    init_db(str(tmp_path / 'reminders.db'))
+    settings_cache.clear()
+    yield
+    settings_cache.clear()
+    close_connections()
+
+
+def outbox_row(chat_id: int):
+    return get_connection().execute(
+        "SELECT status, attempts, next_attempt_at FROM delivery_outbox WHERE chat_id = ? AND slot = ?",
+        (chat_id, SLOT)
+    ).fetchone()
+
+
+def make_relay(send_func, **kwargs) -> OutboxRelay:
+    relay = OutboxRelay(enabled=True, ack_batch=1000, **kwargs)
+    relay._send_func = send_func
+    return relay
+
+
+def deliver(relay: OutboxRelay, chat_id: int):
+    """Забирает строку, как ретранслятор, отправляет ее и записывает итог."""
+    async def run():
+        assert claim_outbox_entries(10) == [(chat_id, SLOT, 'Europe/Moscow')]
+        try:
+            await relay._deliver(chat_id, SLOT, 'Europe/Moscow')
+        except TimedOut:
+            pass
+        await relay.flush()
+    asyncio.run(run())
+
+
+# =============================================================================
+# OutboxRelay
+# =============================================================================
+
+def test_outbox_ack_after_successful_send(db):
+    """Успешная отправка подтверждается: строка больше не выбирается."""
+    sent = []
+
+    async def send(application, chat_id, settings):
+        sent.append((chat_id, settings['slot']))
+
+    assert add_outbox_entries([(1, SLOT, 'Europe/Moscow')]) == 1
+    # Повторная запись того же слота игнорируется
+    assert add_outbox_entries([(1, SLOT, 'Europe/Moscow')]) == 0
+
+    deliver(make_relay(send), 1)
+
+    assert sent == [(1, SLOT)]
+    assert outbox_row(1)[:2] == (2, 0)
+    assert claim_outbox_entries(10) == []
+
+
+def test_outbox_retry_backs_off(db):
+    """Временная ошибка возвращает строку в ожидание с удваивающейся паузой."""
+    async def send(application, chat_id, settings):
+        raise TimedOut()
+
+    relay = make_relay(send, max_attempts=5, retry_base_seconds=30)
+    add_outbox_entries([(1, SLOT, 'Europe/Moscow')])
+
+    before = time.time()
+    deliver(relay, 1)
+    status, attempts, next_attempt_at = outbox_row(1)
+    assert (status, attempts) == (0, 1)
+    assert before + 30 <= next_attempt_at <= time.time() + 30
+    # До истечения паузы строка не выбирается
+    assert claim_outbox_entries(10) == []
+
+    # Вторая попытка - пауза вдвое длиннее
+    get_connection().execute("UPDATE delivery_outbox SET next_attempt_at = 0")
+    get_connection().commit()
+    before = time.time()
+    deliver(relay, 1)
+    status, attempts, next_attempt_at = outbox_row(1)
+    assert (status, attempts) == (0, 2)
+    assert before + 60 <= next_attempt_at <= time.time() + 60
+
+
+def test_outbox_fails_after_max_attempts(db):
+    """После max_attempts неудачных попыток строка помечается неудачной и не выбирается."""
+    async def send(application, chat_id, settings):
+        raise TimedOut()
+
+    relay = make_relay(send, max_attempts=3, retry_base_seconds=0)
+    add_outbox_entries([(1, SLOT, 'Europe/Moscow')])
+
+    for attempt in range(1, 3):
+        deliver(relay, 1)
+        assert outbox_row(1)[:2] == (0, attempt)
+    deliver(relay, 1)
+
+    assert outbox_row(1)[:2] == (4, 3)
+    assert claim_outbox_entries(10) == []
+
+
+# =============================================================================
+# DeadChatCollector
+# =============================================================================
+
+def add_user(chat_id: int):
+    save_water_reminder(chat_id, {'is_active': True, 'onboarding_completed': True, 'timezone': 'Europe/Moscow'})
+
+
+def backdate(chat_id: int):
+    """Сдвигает updated_at в прошлое: CURRENT_TIMESTAMP хранит время с точностью до секунды."""
+    con = get_connection()
+    con.execute("UPDATE water_reminders SET updated_at = '2000-01-01 00:00:00' WHERE chat_id = ?", (chat_id,))
+    con.commit()
+
+
+def test_dead_chats_requeue_on_flush_error(db, monkeypatch):
+    """Если запись пачки упала, чаты возвращаются в очередь и выключаются следующим flush."""
+    for chat_id in (1, 2):
+        add_user(chat_id)
+        backdate(chat_id)
+    collector = DeadChatCollector(batch_size=100)
+    collector.add(1, Forbidden('bot was blocked by the user'))
+    collector.add(2, Forbidden('bot was blocked by the user'))
+
+    def locked(queued_at):
+        raise sqlite3.OperationalError('database is locked')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(dead_chats_module, 'deactivate_water_reminders', locked)
+        with pytest.raises(sqlite3.OperationalError):
+            collector.flush()
+    assert collector.pending() == 2
+
+    assert collector.flush() == 2
+    assert collector.pending() == 0
+    assert not get_water_reminder(1)['is_active']
+    assert not get_water_reminder(2)['is_active']
+
+
+def test_dead_chats_flush_keeps_resumed_user(db):
+    """Пользователь, возобновивший напоминания после постановки в очередь, остается активным."""
+    for chat_id in (1, 2):
+        add_user(chat_id)
+        backdate(chat_id)
+    collector = DeadChatCollector(batch_size=100)
+    collector.add(1, Forbidden('bot was blocked by the user'))
+    collector.add(2, Forbidden('bot was blocked by the user'))
+
+    # Возобновление без discard(): запись пачки уже могла забрать очередь
+    time.sleep(1.1)
+    set_water_reminder_active(2, True)
+
+    assert collector.flush() == 1
+    assert not get_water_reminder(1)['is_active']
+    assert get_water_reminder(2)['is_active']
+
+
+def test_dead_chats_discard(db):
+    """discard убирает чат из очереди до записи пачки."""
+    add_user(1)
+    backdate(1)
+    collector = DeadChatCollector(batch_size=100)
+    collector.add(1, Forbidden('bot was blocked by the user'))
+    collector.discard(1)
+
+    assert collector.flush() == 0
+    assert get_water_reminder(1)['is_active']
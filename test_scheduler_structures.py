@@ -0,0 +1,186 @@
+"""
+Тесты структур планировщика: реестр подписчиков, планы слотов bucketed-режима
+и запоминающий cron-триггер.
+
+    TELEGRAM_BOT_TOKEN=x python -m pytest -q test_scheduler_structures.py
+"""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from apscheduler.triggers.cron import CronTrigger
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:TEST')
+
+from app.scheduler.planner import SlotPlanner  # noqa: E402
+from app.scheduler.registry import UserRegistry  # noqa: E402
+from app.scheduler.triggers import MemoCronTrigger  # noqa: E402
+
+
+# =============================================================================
+# UserRegistry
+# =============================================================================
+
+def test_registry_activate_and_move_timezone():
+    """activate возвращает прежний пояс и активность, индекс поясов следует за пользователем."""
+    registry = UserRegistry()
+    assert registry.activate(10, 'Europe/Moscow') == (None, False)
+    assert registry.activate(10, 'Asia/Tokyo') == ('Europe/Moscow', True)
+
+    assert registry.get_timezone(10) == 'Asia/Tokyo'
+    assert list(registry.active_chat_ids('Europe/Moscow')) == []
+    assert list(registry.active_chat_ids('Asia/Tokyo')) == [10]
+    assert registry.active_timezones() == ['Asia/Tokyo']
+
+
+def test_registry_deactivate_keeps_user():
+    """Остановленный пользователь остается в реестре, повторная остановка ничего не меняет."""
+    registry = UserRegistry()
+    registry.activate(5, 'Europe/Moscow')
+    registry.activate(3, 'Europe/Moscow')
+
+    assert registry.deactivate(5) == 'Europe/Moscow'
+    assert registry.deactivate(5) is None
+    assert registry.deactivate(404) is None
+
+    assert not registry.is_active(5)
+    assert registry.get_timezone(5) == 'Europe/Moscow'
+    assert list(registry.active_chat_ids('Europe/Moscow')) == [3]
+    assert registry.active_count() == 1
+    assert len(registry) == 2
+
+    assert registry.activate(5, 'Europe/Moscow') == ('Europe/Moscow', False)
+    assert list(registry.active_chat_ids('Europe/Moscow')) == [3, 5]
+
+
+def test_registry_activate_many_sorts_and_deduplicates():
+    """Строки в порядке (timezone, chat_id) сортируются по chat_id, при повторе побеждает последняя."""
+    registry = UserRegistry()
+    entries = [
+        (30, 'Asia/Tokyo'), (40, 'Asia/Tokyo'),
+        (10, 'Europe/Moscow'), (20, 'Europe/Moscow'), (30, 'Europe/Moscow'),
+    ]
+    assert registry.activate_many(entries) == 5
+
+    assert len(registry) == 4
+    assert [registry.get_timezone(chat_id) for chat_id in (10, 20, 30, 40)] == [
+        'Europe/Moscow', 'Europe/Moscow', 'Europe/Moscow', 'Asia/Tokyo'
+    ]
+    assert list(registry.active_chat_ids('Europe/Moscow')) == [10, 20, 30]
+    assert list(registry.active_chat_ids('Asia/Tokyo')) == [40]
+    # Бинарный поиск работает только по отсортированной колонке
+    assert all(registry.is_active(chat_id) for chat_id in (10, 20, 30, 40))
+    assert not registry.is_active(25)
+
+
+def test_registry_activate_many_into_non_empty_registry():
+    """В непустой реестр записи добавляются по одной, с учетом смены пояса."""
+    registry = UserRegistry()
+    registry.activate(20, 'Europe/Moscow')
+    registry.deactivate(20)
+
+    registry.activate_many([(30, 'Asia/Tokyo'), (10, 'Asia/Tokyo'), (20, 'Asia/Tokyo')])
+
+    assert list(registry.active_chat_ids('Asia/Tokyo')) == [10, 20, 30]
+    assert list(registry.active_chat_ids('Europe/Moscow')) == []
+    assert registry.active_count() == 3
+
+
+# =============================================================================
+# SlotPlanner
+# =============================================================================
+
+TZ = 'Europe/Moscow'
+# 11:55 по Москве: до слота 12:00 пять минут
+BEFORE_NOON = pytz.utc.localize(datetime(2025, 6, 2, 8, 55))
+
+
+@pytest.fixture
+def planner():
+    registry = UserRegistry()
+    registry.activate_many([(1, TZ), (3, TZ), (5, TZ)])
+    planner = SlotPlanner(registry, lead_minutes=10)
+    assert planner.plan_upcoming(BEFORE_NOON) == 1
+    return planner
+
+
+def test_planner_add_and_discard(planner):
+    """Возобновление и остановка до слота правят готовый план, не нарушая порядок."""
+    planner.add(4, TZ)
+    planner.add(4, TZ)
+    planner.discard(3, TZ)
+    planner.discard(404, TZ)
+
+    assert list(planner.take(TZ, 12, BEFORE_NOON)) == [1, 4, 5]
+    # План забирается один раз
+    assert planner.take(TZ, 12, BEFORE_NOON) is None
+
+
+def test_planner_ignores_edits_without_plan(planner):
+    """Пояс без собранного плана правки не затрагивают."""
+    planner.add(7, 'Asia/Tokyo')
+    planner.discard(7, 'Asia/Tokyo')
+    assert planner.take('Asia/Tokyo', 12, BEFORE_NOON) is None
+
+
+def test_planner_take_checks_hour_and_age(planner):
+    """План годится только для своего часа и пока слот не устарел."""
+    assert planner.take(TZ, 13, BEFORE_NOON) is None
+    assert planner.take(TZ, 12, BEFORE_NOON + timedelta(hours=2)) is None
+    assert list(planner.take(TZ, 12, BEFORE_NOON + timedelta(minutes=6))) == [1, 3, 5]
+
+
+def test_planner_does_not_rebuild_same_slot(planner):
+    """Повторный plan_upcoming не пересобирает план и не теряет правки."""
+    planner.discard(1, TZ)
+    assert planner.plan_upcoming(BEFORE_NOON + timedelta(minutes=1)) == 0
+    assert list(planner.take(TZ, 12, BEFORE_NOON)) == [3, 5]
+
+
+# =============================================================================
+# MemoCronTrigger
+# =============================================================================
+
+# Переходы на летнее и зимнее время в 2025 году
+DST_CASES = [
+    ('Europe/Berlin', datetime(2025, 3, 28)),
+    ('Europe/Berlin', datetime(2025, 10, 24)),
+    ('America/New_York', datetime(2025, 3, 7)),
+    ('America/New_York', datetime(2025, 10, 31)),
+    ('Australia/Sydney', datetime(2025, 4, 3)),
+    ('Australia/Sydney', datetime(2025, 10, 2)),
+]
+
+
+@pytest.mark.parametrize('timezone,start', DST_CASES)
+@pytest.mark.parametrize('hour', [1, 2, 3, 8, 23])
+def test_memo_trigger_matches_cron_trigger_runs(timezone, start, hour):
+    """Цепочка запусков через переход времени совпадает с CronTrigger."""
+    tz = pytz.timezone(timezone)
+    memo = MemoCronTrigger(hour=hour, minute=0, timezone=tz)
+    cron = CronTrigger(hour=hour, minute=0, timezone=tz)
+
+    now = tz.localize(start)
+    previous = None
+    for _ in range(8):
+        expected = cron.get_next_fire_time(previous, now)
+        # Как у задач одного слота: расчет повторяется несколько раз подряд
+        for _ in range(3):
+            assert memo.get_next_fire_time(previous, now) == expected
+        previous = expected
+        now = expected + timedelta(seconds=5)
+
+
+@pytest.mark.parametrize('timezone,start', DST_CASES)
+@pytest.mark.parametrize('hour', [2, 9])
+def test_memo_trigger_matches_cron_trigger_first_run(timezone, start, hour):
+    """Первый запуск новых задач (без previous_fire_time) совпадает с CronTrigger в любой момент."""
+    tz = pytz.timezone(timezone)
+    memo = MemoCronTrigger(hour=hour, minute=0, timezone=tz)
+    cron = CronTrigger(hour=hour, minute=0, timezone=tz)
+
+    now = tz.localize(start)
+    for _ in range(4 * 24 * 60 // 37):
+        assert memo.get_next_fire_time(None, now) == cron.get_next_fire_time(None, now)
+        now = tz.normalize(now + timedelta(minutes=37))